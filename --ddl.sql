@@ -1,5 +1,18 @@
 --ddl
 -- DDL: criar esquema consistente (idempotente)
+DROP VIEW IF EXISTS uso_consolidado;
+DROP TABLE IF EXISTS consumo_celula_dia CASCADE;
+DROP TABLE IF EXISTS celula_geo CASCADE;
+DROP TABLE IF EXISTS arquivo_log CASCADE;
+DROP TABLE IF EXISTS resumo_uso_diario CASCADE;
+DROP TABLE IF EXISTS tarifa_cargo CASCADE;
+DROP TABLE IF EXISTS historico_usuario CASCADE;
+DROP TABLE IF EXISTS amostra_consumo CASCADE;
+DROP TABLE IF EXISTS estrato_amostra CASCADE;
+DROP TABLE IF EXISTS calendario CASCADE;
+DROP TABLE IF EXISTS alertas_quota CASCADE;
+DROP TABLE IF EXISTS estado_consumo_mes CASCADE;
+DROP TABLE IF EXISTS consumo_diario CASCADE;
 DROP TABLE IF EXISTS log_uso_sim CASCADE;
 DROP TABLE IF EXISTS usuario CASCADE;
 DROP TABLE IF EXISTS altera_excesso CASCADE;
@@ -75,3 +88,184 @@ CREATE TABLE log_uso_sim (
     FOREIGN KEY (id_evento) REFERENCES eventos_especiais(id_evento),
     FOREIGN KEY (id_dispositivo) REFERENCES dispositivos(id_dispositivo)
 );
+
+-- Consumo agregado por usuário e dia (mantido pelo ingestao_logs.py)
+CREATE TABLE consumo_diario (
+    id_usuario INT NOT NULL,
+    id_empresa INT NOT NULL,
+    data DATE NOT NULL,
+    consumo_gb NUMERIC(12,2) NOT NULL DEFAULT 0,
+    custo_total NUMERIC(12,2) NOT NULL DEFAULT 0,
+    n_registros INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_usuario, data),
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario),
+    FOREIGN KEY (id_empresa) REFERENCES empresas(id_empresa)
+);
+
+CREATE INDEX idx_consumo_diario_empresa_data ON consumo_diario (id_empresa, data);
+CREATE INDEX idx_usuario_empresa ON usuario (id_empresa);
+
+CREATE INDEX idx_log_uso_sim_usuario_data ON log_uso_sim (id_usuario, data_uso);
+-- BRIN: varredura por intervalo de datas no arquivamento (tabela só cresce em data_uso)
+CREATE INDEX idx_log_uso_sim_data_brin ON log_uso_sim USING brin (data_uso);
+
+-- Estado incremental do motor de alertas: total do mês e maior faixa já alertada.
+-- Migração de um banco existente: `python ingestao_logs.py --backfill` (consumo_diario)
+-- e depois `python motor_alertas.py --rebuild`. Até lá o KPI de alertas do
+-- frontendalt conta os registros marcados em altera_excesso.
+CREATE TABLE estado_consumo_mes (
+    id_usuario INT NOT NULL,
+    mes DATE NOT NULL,
+    consumo_gb NUMERIC(12,2) NOT NULL DEFAULT 0,
+    nivel_alerta SMALLINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_usuario, mes),
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario)
+);
+
+-- Alertas emitidos quando 80% / 100% / 120% do plano são ultrapassados
+CREATE TABLE alertas_quota (
+    id_alerta_quota SERIAL PRIMARY KEY,
+    id_usuario INT NOT NULL,
+    mes DATE NOT NULL,
+    faixa SMALLINT NOT NULL,
+    consumo_gb NUMERIC(12,2) NOT NULL,
+    limite_gb FLOAT NOT NULL,
+    disparado_em TIMESTAMP NOT NULL,
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario)
+);
+
+-- Calendário de features (gerado por calendario.py): evento, feriado e dia útil por data
+CREATE TABLE calendario (
+    data DATE PRIMARY KEY,
+    evento VARCHAR(100) NOT NULL DEFAULT 'Nenhum',
+    feriado BOOLEAN NOT NULL DEFAULT FALSE,
+    nome_feriado VARCHAR(100),
+    dia_util BOOLEAN NOT NULL
+);
+
+-- Amostra estratificada (modo exploratório do Dashboard, mantida por ingestao_logs.py):
+-- reservatório de até N registros por empresa/departamento/cargo/mês + total do estrato
+CREATE TABLE estrato_amostra (
+    id_empresa INT NOT NULL,
+    id_departamento INT NOT NULL,
+    id_cargo INT NOT NULL,
+    mes DATE NOT NULL,
+    n_total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_empresa, id_departamento, id_cargo, mes)
+);
+
+CREATE TABLE amostra_consumo (
+    id_empresa INT NOT NULL,
+    id_departamento INT NOT NULL,
+    id_cargo INT NOT NULL,
+    mes DATE NOT NULL,
+    posicao INT NOT NULL,
+    id_usuario INT NOT NULL,
+    data_uso TIMESTAMP NOT NULL,
+    consumo_gb NUMERIC(10,2) NOT NULL,
+    PRIMARY KEY (id_empresa, id_departamento, id_cargo, mes, posicao),
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario)
+);
+
+-- Últimos valores de consumo por usuário (estado inicial da previsão, mantido por ingestao_logs.py)
+-- e as categóricas do último registro. Banco existente:
+-- ALTER TABLE historico_usuario ADD COLUMN id_evento INT REFERENCES eventos_especiais(id_evento);
+-- e depois `python historico_usuarios.py --rebuild`.
+CREATE TABLE historico_usuario (
+    id_usuario INT PRIMARY KEY,
+    valores DOUBLE PRECISION[] NOT NULL,
+    n_total INT NOT NULL DEFAULT 0,
+    ultima_data TIMESTAMP,
+    id_dispositivo INT,
+    id_situacao INT,
+    id_evento INT,
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario),
+    FOREIGN KEY (id_dispositivo) REFERENCES dispositivos(id_dispositivo),
+    FOREIGN KEY (id_situacao) REFERENCES situacao(id_situacao),
+    FOREIGN KEY (id_evento) REFERENCES eventos_especiais(id_evento)
+);
+
+-- Tarifas por cargo (custos.py): franquia mensal, preço do GB excedente e do GB em roaming.
+-- Cargos sem linha usam o preço médio por GB calibrado pelo custo_total histórico.
+CREATE TABLE tarifa_cargo (
+    id_cargo INT PRIMARY KEY,
+    mensalidade NUMERIC(10,2) NOT NULL,
+    preco_gb_excedente NUMERIC(10,4) NOT NULL,
+    preco_gb_roaming NUMERIC(10,4) NOT NULL,
+    FOREIGN KEY (id_cargo) REFERENCES cargos(id_cargo)
+);
+
+-- Resumo diário dos registros arquivados (arquivamento.py): o detalhe bruto dos
+-- meses frios sai de log_uso_sim para arquivos Parquet e fica aqui uma linha por
+-- usuário, dia, situação, dispositivo e evento.
+CREATE TABLE resumo_uso_diario (
+    id_usuario INT NOT NULL,
+    data DATE NOT NULL,
+    id_situacao INT NOT NULL,
+    id_dispositivo INT NOT NULL,
+    id_evento INT NOT NULL,
+    consumo_gb NUMERIC(12,2) NOT NULL DEFAULT 0,
+    custo_total NUMERIC(12,2),
+    n_registros INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_usuario, data, id_situacao, id_dispositivo, id_evento),
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id_usuario),
+    FOREIGN KEY (id_situacao) REFERENCES situacao(id_situacao),
+    FOREIGN KEY (id_dispositivo) REFERENCES dispositivos(id_dispositivo),
+    FOREIGN KEY (id_evento) REFERENCES eventos_especiais(id_evento)
+);
+
+CREATE INDEX idx_resumo_uso_diario_data ON resumo_uso_diario (data);
+
+-- Catálogo dos meses arquivados: arquivo Parquet, linhas e quando foi reanexado (se foi).
+-- Registros que chegam depois (backfill) de um mês já arquivado vão para uma
+-- parte nova do arquivo (partes). Banco existente:
+-- ALTER TABLE arquivo_log ADD COLUMN partes INT NOT NULL DEFAULT 1;
+CREATE TABLE arquivo_log (
+    mes DATE PRIMARY KEY,
+    caminho VARCHAR(500) NOT NULL,
+    partes INT NOT NULL DEFAULT 1,
+    linhas BIGINT NOT NULL,
+    bytes BIGINT NOT NULL,
+    arquivado_em TIMESTAMP NOT NULL,
+    reanexado_em TIMESTAMP
+);
+
+-- Uso completo para leitura: registros quentes + resumo dos meses arquivados
+-- (nas linhas de resumo data_uso é a meia-noite do dia e n_registros o total agregado)
+CREATE VIEW uso_consolidado AS
+SELECT id_log, id_usuario, id_situacao, id_evento, id_dispositivo, data_uso,
+       consumo_dados_gb, custo_total, localizacao, 1 AS n_registros
+FROM log_uso_sim
+UNION ALL
+SELECT NULL::int, id_usuario, id_situacao, id_evento, id_dispositivo, data::timestamp,
+       consumo_gb, custo_total, NULL, n_registros
+FROM resumo_uso_diario;
+
+-- Índice geográfico (geoindice.py): localizacao vira uma célula na ingestão —
+-- geohash de 5 caracteres (~5 km) quando há coordenadas, 'uf:SP' quando o texto
+-- termina na sigla do estado, 'loc:<nome>' nos demais casos.
+CREATE TABLE celula_geo (
+    celula VARCHAR(64) PRIMARY KEY,
+    lat DOUBLE PRECISION,
+    lon DOUBLE PRECISION,
+    rotulo VARCHAR(255) NOT NULL
+);
+
+-- Consumo por célula, empresa, departamento, cargo e dia (mantido por ingestao_logs.py).
+-- Níveis mais grossos do geohash são prefixos: celula LIKE '6gy%'.
+CREATE TABLE consumo_celula_dia (
+    celula VARCHAR(64) NOT NULL,
+    id_empresa INT NOT NULL,
+    id_departamento INT NOT NULL,
+    id_cargo INT NOT NULL,
+    data DATE NOT NULL,
+    consumo_gb NUMERIC(14,2) NOT NULL DEFAULT 0,
+    n_registros INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_empresa, data, celula, id_departamento, id_cargo),
+    FOREIGN KEY (celula) REFERENCES celula_geo(celula),
+    FOREIGN KEY (id_empresa) REFERENCES empresas(id_empresa),
+    FOREIGN KEY (id_departamento) REFERENCES departamentos(id_departamento),
+    FOREIGN KEY (id_cargo) REFERENCES cargos(id_cargo)
+);
+
+CREATE INDEX idx_consumo_celula_prefixo ON consumo_celula_dia (celula text_pattern_ops, data);
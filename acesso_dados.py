@@ -0,0 +1,143 @@
+# acesso_dados.py
+# Acesso concorrente ao banco: um pool de conexões e um executor que dispara
+# consultas independentes ao mesmo tempo, cada uma com seu prazo
+# (statement_timeout no servidor + espera limitada no cliente). Consultas
+# com a mesma chave em andamento são compartilhadas, e a página usa cada
+# resultado assim que ele chega: a latência tende à da consulta mais lenta,
+# não à soma de todas.
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+POOL_MIN = 1
+POOL_MAX = 6            # conexões abertas no máximo (= consultas simultâneas)
+PRAZO_PADRAO = 30.0     # segundos por consulta
+PING_APOS = 60.0        # conexão parada há mais que isso é testada antes do uso
+FOLGA_CLIENTE = 1.0     # o cliente espera um pouco além do statement_timeout
+
+
+# --- POOL DE CONEXÕES ---
+class ConnectionPool:
+    """
+    ThreadedConnectionPool do psycopg2 com espera por conexão livre (em vez
+    de PoolError), teste de conexões paradas e descarte das que caíram.
+    """
+
+    def __init__(self, params, minconn=POOL_MIN, maxconn=POOL_MAX):
+        from psycopg2.pool import ThreadedConnectionPool  # adiado: só carrega quando o banco é usado
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **params)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}   # id(conn) -> time.monotonic() da devolução
+
+    def _checkout(self):
+        conn = self._pool.getconn()
+        idle = time.monotonic() - self._last_used.get(id(conn), time.monotonic())
+        if conn.closed or idle > PING_APOS:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+            except Exception:
+                # Derrubada pelo servidor (ociosidade, reinício): troca por uma nova
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        return conn
+
+    @contextmanager
+    def connection(self, deadline=None):
+        """Conexão do pool com statement_timeout = deadline (s); volta limpa ao pool no fim."""
+        self._slots.acquire()
+        conn, broken = None, False
+        try:
+            conn = self._checkout()
+            if deadline is not None:
+                with conn.cursor() as cur:
+                    cur.execute("SET statement_timeout = %s;", (int(deadline * 1000),))
+                conn.commit()
+            yield conn
+        finally:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                    if deadline is not None:
+                        with conn.cursor() as cur:
+                            cur.execute("RESET statement_timeout;")
+                        conn.commit()
+                except Exception:
+                    broken = True
+                broken = broken or bool(conn.closed)
+                self._last_used.pop(id(conn), None)
+                if not broken:
+                    self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn, close=broken)
+            self._slots.release()
+
+    def run(self, fn, deadline=None):
+        """fn(conn) numa conexão do pool."""
+        with self.connection(deadline) as conn:
+            return fn(conn)
+
+    def close(self):
+        self._pool.closeall()
+
+
+# --- CONSULTAS EM PARALELO ---
+class ParallelFetcher:
+    """
+    Executa fn(conn) em threads sobre o pool. submit() devolve um Future;
+    uma chave já em andamento devolve o mesmo Future (uma consulta só para
+    quem chegar junto). result() e as_completed() respeitam o prazo de cada
+    consulta, contado do disparo.
+    """
+
+    def __init__(self, pool, max_workers=POOL_MAX):
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="consulta")
+        self._pending = {}
+        self._lock = threading.RLock()
+
+    def _forget(self, key, fut):
+        with self._lock:
+            if self._pending.get(key) is fut:
+                del self._pending[key]
+
+    def submit(self, key, fn, deadline=PRAZO_PADRAO):
+        with self._lock:
+            fut = self._pending.get(key)
+            if fut is None:
+                fut = self._executor.submit(self.pool.run, fn, deadline)
+                fut.key, fut.deadline = key, deadline
+                fut.expires_at = None if deadline is None else time.monotonic() + deadline + FOLGA_CLIENTE
+                self._pending[key] = fut
+                fut.add_done_callback(lambda f, k=key: self._forget(k, f))
+            return fut
+
+    @staticmethod
+    def _remaining(fut):
+        return None if fut.expires_at is None else max(0.0, fut.expires_at - time.monotonic())
+
+    def result(self, fut):
+        """Valor da consulta; TimeoutError se o prazo estourar, ou a exceção de fn."""
+        return fut.result(timeout=self._remaining(fut))
+
+    def as_completed(self, futures):
+        """
+        futures: {nome: Future}. Gera (nome, valor, erro) na ordem em que as
+        consultas terminam; as que passam do prazo saem com TimeoutError.
+        """
+        pending = dict((fut, nome) for nome, fut in futures.items())
+        while pending:
+            prazos = [self._remaining(f) for f in pending]
+            timeout = min((p for p in prazos if p is not None), default=None)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                nome = pending.pop(fut)
+                erro = fut.exception()
+                yield nome, (None if erro else fut.result()), erro
+            for fut in [f for f in pending if f not in done and self._remaining(f) == 0.0]:
+                yield pending.pop(fut), None, TimeoutError(f"Consulta {fut.key!r} excedeu {fut.deadline:.0f} s")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
@@ -0,0 +1,244 @@
+# amostragem.py
+# Amostra estratificada para as visões exploratórias do Dashboard: um
+# reservatório de tamanho fixo por estrato (empresa, departamento, cargo, mês),
+# mantido na ingestão (algoritmo R), mais o total de registros de cada estrato.
+# Totais e distribuições são estimados com margem de erro de 95%.
+#
+# Uso:  python amostragem.py --rebuild     (refaz a amostra a partir do uso consolidado)
+import argparse
+import random
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+RESERVATORIO = 200   # registros guardados por estrato
+Z_95 = 1.96
+
+
+def month_of(dt):
+    return dt.date().replace(day=1) if isinstance(dt, datetime) else dt.replace(day=1)
+
+
+# --- MANUTENÇÃO NA INGESTÃO ---
+class StratifiedReservoir:
+    """
+    Reservatório por estrato: os primeiros k registros entram direto; o n-ésimo
+    substitui uma posição aleatória com probabilidade k/n. Custo O(1) por registro.
+    Contagens do lote só valem depois do commit; rollback() volta às gravadas.
+    """
+
+    def __init__(self, conn, user_stratum, k=RESERVATORIO, rng=None):
+        self.conn = conn
+        self.user_stratum = user_stratum   # id_usuario -> (id_empresa, id_departamento, id_cargo)
+        self.k = k
+        self.rng = rng or random.Random()
+        self.counts = {}                   # (empresa, departamento, cargo, mes) -> registros vistos
+        self.loaded_months = set()
+        self.dirty_strata = set()
+        self.slots = {}                    # (estrato, posição) -> (id_usuario, data_uso, consumo)
+        self._undo = {}                    # estrato -> contagem antes do lote (None = não existia)
+
+    def _load_month(self, mes):
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT id_empresa, id_departamento, id_cargo, n_total
+                FROM estrato_amostra WHERE mes = %s;
+            """, (mes,))
+            for emp, dep, cargo, n in cur.fetchall():
+                self.counts.setdefault((emp, dep, cargo, mes), n)
+        self.loaded_months.add(mes)
+
+    def observe(self, uid, data_uso, consumo):
+        mes = month_of(data_uso)
+        if mes not in self.loaded_months:
+            self._load_month(mes)
+        stratum = (*self.user_stratum[uid], mes)
+        if stratum not in self._undo:
+            self._undo[stratum] = self.counts.get(stratum)
+        n = self.counts.get(stratum, 0) + 1
+        self.counts[stratum] = n
+        self.dirty_strata.add(stratum)
+        slot = n - 1 if n <= self.k else self.rng.randrange(n)
+        if slot < self.k:
+            self.slots[(stratum, slot)] = (uid, data_uso, consumo)
+
+    def persist(self, cur):
+        """Grava posições substituídas e contagens (sem commit — usa a transação do chamador)."""
+        if self.slots:
+            execute_values(cur, """
+                INSERT INTO amostra_consumo
+                    (id_empresa, id_departamento, id_cargo, mes, posicao, id_usuario, data_uso, consumo_gb)
+                VALUES %s
+                ON CONFLICT (id_empresa, id_departamento, id_cargo, mes, posicao) DO UPDATE SET
+                    id_usuario = EXCLUDED.id_usuario,
+                    data_uso = EXCLUDED.data_uso,
+                    consumo_gb = EXCLUDED.consumo_gb;
+            """, [(*stratum, slot, *row) for (stratum, slot), row in self.slots.items()], page_size=10_000)
+        if self.dirty_strata:
+            execute_values(cur, """
+                INSERT INTO estrato_amostra (id_empresa, id_departamento, id_cargo, mes, n_total)
+                VALUES %s
+                ON CONFLICT (id_empresa, id_departamento, id_cargo, mes) DO UPDATE SET
+                    n_total = EXCLUDED.n_total;
+            """, [(*s, self.counts[s]) for s in self.dirty_strata], page_size=10_000)
+
+    def commit(self):
+        """Depois do commit do chamador: posições e contagens do lote passam a valer."""
+        self.slots = {}
+        self.dirty_strata = set()
+        self._undo = {}
+
+    def rollback(self):
+        """Transação desfeita: contagens voltam ao que estava gravado e as posições do lote são descartadas."""
+        for stratum, before in self._undo.items():
+            if before is None:
+                self.counts.pop(stratum, None)
+            else:
+                self.counts[stratum] = before
+        self.commit()
+
+
+def rebuild_sample(conn, k=RESERVATORIO):
+    """
+    Refaz amostra e contagens a partir do uso consolidado (log + meses
+    arquivados). Uma linha de resumo diário vale n_registros registros: entra
+    na contagem com esse peso, é sorteada com probabilidade proporcional a ele
+    e guarda o consumo médio por registro do dia.
+    """
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE amostra_consumo, estrato_amostra;")
+        cur.execute("""
+            WITH base AS (
+                SELECT u.id_empresa, u.id_departamento, u.id_cargo,
+                       date_trunc('month', l.data_uso)::date AS mes,
+                       l.id_usuario, l.data_uso, l.consumo_dados_gb / l.n_registros AS consumo,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY u.id_empresa, u.id_departamento, u.id_cargo, date_trunc('month', l.data_uso)
+                           ORDER BY -ln(1 - random()) / l.n_registros
+                       ) - 1 AS posicao
+                FROM uso_consolidado l
+                JOIN usuario u ON l.id_usuario = u.id_usuario
+                WHERE l.n_registros > 0
+            )
+            INSERT INTO amostra_consumo
+                (id_empresa, id_departamento, id_cargo, mes, posicao, id_usuario, data_uso, consumo_gb)
+            SELECT id_empresa, id_departamento, id_cargo, mes, posicao, id_usuario, data_uso, consumo
+            FROM base WHERE posicao < %s;
+        """, (k,))
+        cur.execute("""
+            INSERT INTO estrato_amostra (id_empresa, id_departamento, id_cargo, mes, n_total)
+            SELECT u.id_empresa, u.id_departamento, u.id_cargo, date_trunc('month', l.data_uso)::date,
+                   SUM(l.n_registros)
+            FROM uso_consolidado l
+            JOIN usuario u ON l.id_usuario = u.id_usuario
+            GROUP BY 1, 2, 3, 4;
+        """)
+    conn.commit()
+
+
+# --- LEITURA E ESTIMATIVAS ---
+def load_sample(conn, id_empresa):
+    """
+    Amostra da empresa com as mesmas colunas do load_main_data do Dashboard,
+    mais estrato, n_estrato (amostra) e N_estrato (população).
+    """
+    query = """
+    SELECT
+        a.data_uso,
+        a.consumo_gb AS "Consumo (GB)",
+        u.nome AS "Nome",
+        dep.nome AS "Departamento",
+        c.nome AS "Cargo",
+        c.limite_gigas AS "Plano (GB)",
+        emp.nome AS "Empresa",
+        a.id_departamento, a.id_cargo, a.mes,
+        e.n_total AS "N_estrato"
+    FROM amostra_consumo a
+    JOIN estrato_amostra e USING (id_empresa, id_departamento, id_cargo, mes)
+    JOIN usuario u ON a.id_usuario = u.id_usuario
+    JOIN departamentos dep ON a.id_departamento = dep.id_departamento
+    JOIN cargos c ON a.id_cargo = c.id_cargo
+    JOIN empresas emp ON a.id_empresa = emp.id_empresa
+    WHERE a.id_empresa = %s;
+    """
+    df = pd.read_sql_query(query, conn, params=(int(id_empresa),))
+    if df.empty:
+        return df
+    df['data_uso'] = pd.to_datetime(df['data_uso'])
+    df['Mês'] = df['data_uso'].dt.to_period('M').astype(str)
+    df['Consumo (GB)'] = df['Consumo (GB)'].astype(float)
+    df['estrato'] = df.groupby(['id_departamento', 'id_cargo', 'mes'], sort=False).ngroup()
+    df['n_estrato'] = df.groupby('estrato')['estrato'].transform('size')
+    return df
+
+
+def estimate_by(sample, value_col, by=None, mask=None, z=Z_95):
+    """
+    Estimador estratificado do total de value_col (por grupo `by`, se dado)
+    restrito às linhas de `mask`. Cada estrato conta com sua amostra inteira;
+    linhas fora do filtro/grupo entram como zero (estimação de domínio).
+    Retorna DataFrame com total, margem (±, nível z) e registros estimados.
+    """
+    y = sample[value_col].to_numpy(dtype=float)
+    keep = np.ones(len(sample), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+    parts = pd.DataFrame({
+        'estrato': sample['estrato'].to_numpy(),
+        'grupo': sample[by].to_numpy() if by else 0,
+        'y': np.where(keep, y, 0.0),
+        'y2': np.where(keep, y * y, 0.0),
+        'c': keep.astype(float),
+    })[keep]
+    if parts.empty:
+        return pd.DataFrame(columns=['total', 'margem', 'registros', 'margem_registros'])
+
+    strata = sample.groupby('estrato')[['n_estrato', 'N_estrato']].first()
+    agg = parts.groupby(['grupo', 'estrato'])[['y', 'y2', 'c']].sum().join(strata, on='estrato')
+    n, N = agg['n_estrato'].to_numpy(dtype=float), agg['N_estrato'].to_numpy(dtype=float)
+    fpc = np.clip(1 - n / N, 0, 1)            # estrato completo na amostra: variância zero
+    dof = np.maximum(n - 1, 1)
+
+    def total_and_var(s1, s2):
+        var_h = np.maximum(s2 - s1 * s1 / n, 0) / dof
+        return N * s1 / n, N * N * fpc * var_h / n
+
+    t_y, v_y = total_and_var(agg['y'].to_numpy(), agg['y2'].to_numpy())
+    t_c, v_c = total_and_var(agg['c'].to_numpy(), agg['c'].to_numpy())   # indicador: c² = c
+    out = pd.DataFrame({'total': t_y, 'var': v_y, 'registros': t_c, 'var_c': v_c},
+                       index=agg.index.get_level_values('grupo')).groupby(level=0).sum()
+    out['margem'] = z * np.sqrt(out.pop('var'))
+    out['margem_registros'] = z * np.sqrt(out.pop('var_c'))
+    out.index.name = by
+    return out[['total', 'margem', 'registros', 'margem_registros']]
+
+
+def estimate_total(sample, value_col, mask=None, z=Z_95):
+    """Total estimado e margem de erro (±) para as linhas do filtro."""
+    est = estimate_by(sample, value_col, mask=mask, z=z)
+    if est.empty:
+        return 0.0, 0.0
+    return float(est['total'].iloc[0]), float(est['margem'].iloc[0])
+
+
+def main():
+    import psycopg2
+    from ingestao_logs import conn_params_from_env
+
+    parser = argparse.ArgumentParser(description="Manutenção da amostra estratificada")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Refaz amostra_consumo e estrato_amostra a partir do uso consolidado")
+    parser.add_argument("--tamanho", type=int, default=RESERVATORIO, help="Registros por estrato")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        if args.rebuild:
+            rebuild_sample(conn, args.tamanho)
+            print("Amostra estratificada reconstruída.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,5 @@
 import streamlit as st
 import os
-import pandas as pd
-import random
-from datetime import datetime
 
 # --- 1. CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -280,4 +277,11 @@ elif page == "Sobre Nós":
                     Instagram 📸
                 </a>
             </div>
-            """, unsafe_allow_html=True)
\ No newline at end of file
+            """, unsafe_allow_html=True)
+
+# --- 5. AQUECIMENTO EM SEGUNDO PLANO ---
+# Roda depois do conteúdo desenhado: prepara dashboard, modelo e dados sem
+# atrasar a primeira renderização da página atual.
+if page != "Dashboard":
+    import aquecimento
+    aquecimento.start_warmup()
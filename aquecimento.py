@@ -0,0 +1,60 @@
+# aquecimento.py
+# Aquecimento em segundo plano: depois que a página inicial já foi desenhada,
+# importa os módulos pesados do Dashboard (plotly, numpy, lightgbm) e carrega
+# modelo e dados nos caches do processo, para o primeiro clique não esperar.
+# Não usa os helpers de UI do Dashboard (st.error, st.warning): abre a própria
+# conexão psycopg2, fechada no fim, e só registra as falhas no log.
+import logging
+import threading
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+log = logging.getLogger(__name__)
+
+
+def _warmup():
+    try:
+        import dashboard
+    except Exception:
+        log.exception("Aquecimento: falha ao importar o Dashboard")
+        return
+
+    shared = dashboard.get_shared_cache()
+    try:
+        if shared.get_or_load("modelo", dashboard._load_model_uncached) is None:
+            log.warning("Aquecimento: modelo indisponível")
+    except Exception:
+        log.exception("Aquecimento: falha ao carregar o modelo")
+
+    conn = None
+    try:
+        import psycopg2
+        conn = psycopg2.connect(**dashboard.db_params())
+        # Mesmas chaves de cache do load_empresas / load_main_data
+        df_empresas = shared.get_or_load("empresas", lambda: dashboard._query_empresas(conn), ttl=600)
+        if df_empresas.empty:
+            log.warning("Aquecimento: nenhuma empresa carregada")
+            return
+        # Empresa padrão do seletor (primeira da lista) é a primeira a ser aberta
+        id_empresa = df_empresas['id_empresa'].iloc[0]
+        df_main = dashboard.get_tenant_caches().get_or_load(
+            id_empresa, "main", lambda: dashboard._query_main_data(conn, id_empresa)
+        )
+        if df_main.empty:
+            log.warning("Aquecimento: dados da empresa %s não carregados", id_empresa)
+    except Exception:
+        log.exception("Aquecimento: falha ao carregar os dados")
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@st.cache_resource
+def start_warmup():
+    """Dispara o aquecimento uma única vez por processo (não bloqueia o script)."""
+    thread = threading.Thread(target=_warmup, name="aquecimento-dashboard", daemon=True)
+    # Contexto do script só para os st.cache_resource (caches do processo) reconhecerem a thread
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    return thread
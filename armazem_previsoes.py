@@ -0,0 +1,163 @@
+# armazem_previsoes.py
+# Resultados de previsão compartilhados pelo processo: cada previsão (séries
+# diárias, contexto bruto, faturas, simulador...) fica guardada uma vez só,
+# identificada por um handle, e o st.session_state guarda apenas o handle e os
+# agregados mensais. Cada handle conta as sessões que o referenciam e é
+# liberado quando a última o solta ou deixa de existir (sessão encerrada ou
+# sem uso por mais que o arrendamento). O tamanho é medido uma vez, no put;
+# só os resultados que crescem com o uso e informam a própria memória (o
+# simulador lembra projeções: nbytes) são somados de novo a cada leitura.
+# Um armazém por empresa, com orçamento próprio (TenantForecastStores): as
+# previsões de um cliente grande nunca expulsam as de um cliente pequeno.
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cache_memoria import MB, readonly_view, sizeof
+
+ARRENDAMENTO = 30 * 60     # s sem leitura até a referência de uma sessão vencer
+ORCAMENTO = 1024 * MB      # teto de memória do armazém (expulsa o menos usado)
+
+
+def _grows(value):
+    """Resultado que cresce depois de guardado e informa a própria memória (ex.: cenarios.ScenarioSimulator)."""
+    return (not isinstance(value, (pd.DataFrame, pd.Series, np.ndarray))
+            and isinstance(getattr(value, "nbytes", None), int))
+
+
+class ForecastStore:
+    """
+    handle -> resultados (dict), com as sessões que o referenciam. is_active:
+    função session_id -> bool do runtime (None = só o arrendamento decide).
+    """
+
+    def __init__(self, max_bytes=ORCAMENTO, lease=ARRENDAMENTO, is_active=None):
+        self.max_bytes = max_bytes
+        self.lease = lease
+        self.is_active = is_active
+        self._entries = OrderedDict()   # handle -> [valores, tamanho, {session_id: última leitura}, fixo, crescem]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.collected = self.evicted = 0
+
+    def _drop(self, handle):
+        size = self._entries.pop(handle)[1]
+        self._bytes -= size
+
+    def _alive(self, session_id, seen, now):
+        if now - seen > self.lease:
+            return False
+        try:
+            return self.is_active is None or self.is_active(session_id)
+        except Exception:
+            return True
+
+    def _collect_locked(self):
+        now = time.monotonic()
+        orphans = []
+        for handle, (_, _, refs, *_) in self._entries.items():
+            for sid in [s for s, seen in refs.items() if not self._alive(s, seen, now)]:
+                del refs[sid]
+            if not refs:
+                orphans.append(handle)
+        for handle in orphans:
+            self._drop(handle)
+        self.collected += len(orphans)
+        return len(orphans)
+
+    def put(self, values, session_id):
+        """Guarda os resultados com uma referência da sessão; retorna o handle."""
+        handle = uuid.uuid4().hex
+        growing = [k for k, v in values.items() if _grows(v)]
+        fixed = sizeof({k: v for k, v in values.items() if k not in growing})
+        size = fixed + sum(values[k].nbytes for k in growing)
+        with self._lock:
+            self._collect_locked()
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evicted += 1
+            self._entries[handle] = [values, size, {session_id: time.monotonic()}, fixed, growing]
+            self._bytes += size
+        return handle
+
+    def get(self, handle, session_id):
+        """
+        Resultados como visões somente-leitura (None se já liberados); renova a
+        referência da sessão e soma de novo só o que cresce (expulsando outros
+        handles se passar do teto).
+        """
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            values, _, refs, fixed, growing = entry
+            size = fixed + sum(values[k].nbytes for k in growing)
+            refs[session_id] = time.monotonic()
+            self._entries.move_to_end(handle)
+            self._bytes += size - entry[1]
+            entry[1] = size
+            while self._bytes > self.max_bytes and next(iter(self._entries)) != handle:
+                self._drop(next(iter(self._entries)))
+                self.evicted += 1
+        return {k: readonly_view(v) for k, v in values.items()}
+
+    def release(self, handle, session_id):
+        """A sessão solta o handle; sem outras referências, a memória é liberada na hora."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return
+            entry[2].pop(session_id, None)
+            if not entry[2]:
+                self._drop(handle)
+                self.collected += 1
+
+    def collect(self):
+        """Remove referências de sessões encerradas/vencidas e libera os handles órfãos."""
+        with self._lock:
+            return self._collect_locked()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "handles": len(self._entries),
+                "referencias": sum(len(e[2]) for e in self._entries.values()),
+                "bytes": self._bytes, "orcamento": self.max_bytes,
+                "coletados": self.collected, "expulsos": self.evicted,
+            }
+
+
+class TenantForecastStores:
+    """Um ForecastStore por id_empresa, com orçamento próprio por tenant."""
+
+    def __init__(self, default_budget=ORCAMENTO, budgets=None, lease=ARRENDAMENTO, is_active=None):
+        self.default_budget = default_budget
+        self.budgets = dict(budgets or {})
+        self.lease = lease
+        self.is_active = is_active
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def for_tenant(self, id_empresa):
+        with self._lock:
+            store = self._stores.get(id_empresa)
+            if store is None:
+                budget = self.budgets.get(id_empresa, self.default_budget)
+                store = self._stores[id_empresa] = ForecastStore(budget, self.lease, self.is_active)
+            return store
+
+    def collect(self):
+        """Coleta os handles órfãos de todos os tenants."""
+        with self._lock:
+            stores = list(self._stores.values())
+        return sum(s.collect() for s in stores)
+
+    def stats(self):
+        """Estatísticas (handles, referências, bytes, orçamento) por tenant."""
+        with self._lock:
+            stores = dict(self._stores)
+        return {tid: s.stats() for tid, s in stores.items()}
@@ -0,0 +1,304 @@
+# arquivamento.py
+# Arquivamento dos dados frios de log_uso_sim: meses inteiros mais antigos que
+# a janela quente saem da tabela para arquivos Parquet (zstd, colunar) em disco
+# e ficam no banco como resumo diário por usuário (resumo_uso_diario). Leituras
+# que precisam do histórico inteiro usam a view uso_consolidado; o detalhe
+# bruto de um mês pode ser lido direto do arquivo ou reanexado à tabela.
+# Assim log_uso_sim guarda no máximo a janela quente mais o mês corrente.
+# Registros atrasados (backfill) de um mês já arquivado vão para uma parte
+# nova do arquivo do mês; as partes anteriores nunca são sobrescritas.
+#
+# Uso:  python arquivamento.py --arquivar [--janela 120] [--destino arquivo]
+#       python arquivamento.py --reanexar 2024-01
+#       python arquivamento.py --listar
+import argparse
+import csv
+import glob
+import io
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+JANELA_DIAS = 120          # dias mantidos em log_uso_sim (além do mês corrente)
+DESTINO = "arquivo"        # diretório dos arquivos Parquet
+LOTE = 100_000             # linhas lidas do banco por vez (cursor do servidor)
+
+ARQUIVO_SCHEMA = pa.schema([
+    ("id_log", pa.int64()),
+    ("id_usuario", pa.int32()),
+    ("id_situacao", pa.int32()),
+    ("id_alerta", pa.int32()),
+    ("id_evento", pa.int32()),
+    ("id_dispositivo", pa.int32()),
+    ("data_uso", pa.timestamp("us")),
+    ("consumo_dados_gb", pa.float64()),
+    ("custo_total", pa.float64()),
+    ("localizacao", pa.string()),
+    ("data_referencia", pa.date32()),
+])
+ARQUIVO_COLS = ARQUIVO_SCHEMA.names
+NUMERIC_COLS = {"consumo_dados_gb", "custo_total"}   # NUMERIC chega como Decimal
+
+
+def archive_path(destino, mes, parte=1):
+    sufixo = "" if parte == 1 else f".parte{parte}"
+    return os.path.join(destino, f"log_uso_sim_{mes:%Y-%m}{sufixo}.parquet")
+
+
+def archive_parts(destino, mes, partes=None):
+    """Arquivos do mês: as `partes` do catálogo ou, sem ele, as que estão no disco."""
+    if partes is not None:
+        return [archive_path(destino, mes, p) for p in range(1, partes + 1)]
+    extras = glob.glob(os.path.join(glob.escape(destino), f"log_uso_sim_{mes:%Y-%m}.parte*.parquet"))
+    principal = archive_path(destino, mes)
+    return ([principal] if os.path.exists(principal) else []) + sorted(
+        extras, key=lambda c: int(c.rsplit(".parte", 1)[1].split(".")[0]))
+
+
+def catalog_entry(conn, mes):
+    """(partes, reanexado_em) do mês no catálogo, ou None se o mês nunca foi arquivado."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT partes, reanexado_em FROM arquivo_log WHERE mes = %s;", (mes,))
+        return cur.fetchone()
+
+
+def cutoff_month(ultimo_dia, janela=JANELA_DIAS):
+    """Primeiro dia do mês que contém ultimo_dia - janela: meses anteriores a ele são arquivados."""
+    return (ultimo_dia - timedelta(days=janela)).replace(day=1)
+
+
+def months_to_archive(conn, janela=JANELA_DIAS):
+    """Meses de log_uso_sim inteiramente fora da janela quente (do mais antigo ao mais novo)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(data_uso)::date FROM log_uso_sim;")
+        ultimo = cur.fetchone()[0]
+        if ultimo is None:
+            return []
+        corte = cutoff_month(ultimo, janela)
+        cur.execute("""
+            SELECT DISTINCT date_trunc('month', data_uso)::date
+            FROM log_uso_sim WHERE data_uso < %s ORDER BY 1;
+        """, (corte,))
+        return [r[0] for r in cur.fetchall()]
+
+
+# --- EXPORTAÇÃO ---
+def _month_bounds(mes):
+    fim = (mes.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return mes, fim
+
+
+def _to_table(rows):
+    cols = list(zip(*rows))
+    arrays = []
+    for name, values in zip(ARQUIVO_COLS, cols):
+        if name in NUMERIC_COLS:
+            values = [None if v is None else float(v) for v in values]
+        arrays.append(pa.array(values, type=ARQUIVO_SCHEMA.field(name).type))
+    return pa.Table.from_arrays(arrays, schema=ARQUIVO_SCHEMA)
+
+
+def export_month(conn, mes, destino=DESTINO, parte=1):
+    """
+    Grava os registros brutos do mês em Parquet, em lotes (memória limitada),
+    num arquivo temporário renomeado no fim, como a `parte` do mês (uma parte
+    já gravada e catalogada nunca é passada aqui). Retorna (caminho, linhas, bytes).
+    """
+    os.makedirs(destino, exist_ok=True)
+    caminho = archive_path(destino, mes, parte)
+    tmp = caminho + ".tmp"
+    inicio, fim = _month_bounds(mes)
+    linhas = 0
+    with conn.cursor(name=f"arquivo_{mes:%Y%m}") as cur:
+        cur.itersize = LOTE
+        cur.execute(f"""
+            SELECT {', '.join(ARQUIVO_COLS)} FROM log_uso_sim
+            WHERE data_uso >= %s AND data_uso < %s ORDER BY data_uso, id_log;
+        """, (inicio, fim))
+        with pq.ParquetWriter(tmp, ARQUIVO_SCHEMA, compression="zstd") as writer:
+            while True:
+                rows = cur.fetchmany(LOTE)
+                if not rows:
+                    break
+                writer.write_table(_to_table(rows))
+                linhas += len(rows)
+    if pq.ParquetFile(tmp).metadata.num_rows != linhas:
+        os.remove(tmp)
+        raise RuntimeError(f"Arquivo de {mes:%Y-%m} incompleto; log_uso_sim não foi alterado.")
+    os.replace(tmp, caminho)
+    return caminho, linhas, os.path.getsize(caminho)
+
+
+# --- COMPACTAÇÃO ---
+def compact_month(cur, mes, caminho, linhas, tamanho, parte=1):
+    """
+    Na transação do chamador: resumo diário do mês, remoção dos registros
+    brutos e registro no catálogo. O arquivo já precisa estar gravado.
+    Parte > 1 (backfill de mês arquivado) soma linhas e bytes às das partes
+    anteriores; parte 1 de um mês reanexado substitui o registro.
+    """
+    inicio, fim = _month_bounds(mes)
+    cur.execute("""
+        INSERT INTO resumo_uso_diario
+            (id_usuario, data, id_situacao, id_dispositivo, id_evento, consumo_gb, custo_total, n_registros)
+        SELECT id_usuario, data_uso::date, id_situacao, id_dispositivo, id_evento,
+               SUM(consumo_dados_gb), SUM(custo_total), COUNT(*)
+        FROM log_uso_sim
+        WHERE data_uso >= %s AND data_uso < %s
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (id_usuario, data, id_situacao, id_dispositivo, id_evento) DO UPDATE SET
+            consumo_gb = resumo_uso_diario.consumo_gb + EXCLUDED.consumo_gb,
+            custo_total = COALESCE(resumo_uso_diario.custo_total + EXCLUDED.custo_total,
+                                   resumo_uso_diario.custo_total, EXCLUDED.custo_total),
+            n_registros = resumo_uso_diario.n_registros + EXCLUDED.n_registros;
+    """, (inicio, fim))
+    cur.execute("DELETE FROM log_uso_sim WHERE data_uso >= %s AND data_uso < %s;", (inicio, fim))
+    if cur.rowcount != linhas:
+        raise RuntimeError(f"{mes:%Y-%m}: {cur.rowcount} registros removidos, {linhas} arquivados.")
+    cur.execute("""
+        INSERT INTO arquivo_log (mes, caminho, partes, linhas, bytes, arquivado_em)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (mes) DO UPDATE SET
+            partes = EXCLUDED.partes,
+            linhas = CASE WHEN EXCLUDED.partes > 1 THEN arquivo_log.linhas + EXCLUDED.linhas
+                          ELSE EXCLUDED.linhas END,
+            bytes = CASE WHEN EXCLUDED.partes > 1 THEN arquivo_log.bytes + EXCLUDED.bytes
+                         ELSE EXCLUDED.bytes END,
+            arquivado_em = EXCLUDED.arquivado_em, reanexado_em = NULL;
+    """, (mes, archive_path(os.path.dirname(caminho), mes), parte, linhas, tamanho, datetime.now()))
+
+
+def archive_cold_data(conn, janela=JANELA_DIAS, destino=DESTINO):
+    """
+    Arquiva, mês a mês, tudo que está fora da janela quente. Cada mês é
+    gravado em disco antes de sair do banco e compactado numa transação
+    própria: uma falha no meio deixa os meses anteriores arquivados e o
+    atual intacto. Mês já arquivado (backfill) ganha uma parte nova; mês
+    reanexado volta inteiro para a parte 1 e as outras partes são apagadas
+    depois do commit. Retorna [(mes, linhas, bytes), ...].
+    """
+    feitos = []
+    for mes in months_to_archive(conn, janela):
+        entrada = catalog_entry(conn, mes)
+        reanexado = entrada is not None and entrada[1] is not None
+        parte = 1 if entrada is None or reanexado else entrada[0] + 1
+        caminho, linhas, tamanho = export_month(conn, mes, destino, parte)
+        try:
+            with conn.cursor() as cur:
+                compact_month(cur, mes, caminho, linhas, tamanho, parte)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if reanexado:
+            for antigo in archive_parts(destino, mes, entrada[0])[1:]:
+                if os.path.exists(antigo):
+                    os.remove(antigo)
+        feitos.append((mes, linhas, tamanho))
+    return feitos
+
+
+# --- LEITURA E REANEXAÇÃO ---
+def read_archive(destino=DESTINO, meses=None, columns=None, filters=None):
+    """
+    Detalhe bruto dos meses arquivados direto dos arquivos (sem tocar o banco).
+    meses: lista de datas (primeiro dia do mês) ou None para todos; filters no
+    formato do pyarrow, ex. [("id_usuario", "in", [1, 2])].
+    """
+    if meses is None:
+        caminhos = sorted(os.path.join(destino, f) for f in os.listdir(destino)
+                          if f.startswith("log_uso_sim_") and f.endswith(".parquet"))
+    else:
+        caminhos = [c for m in meses for c in archive_parts(destino, m)]
+    if not caminhos:
+        return pd.DataFrame(columns=columns or ARQUIVO_COLS)
+    return pq.ParquetDataset(caminhos, filters=filters).read(columns=columns).to_pandas()
+
+
+def reattach_month(conn, mes, destino=DESTINO):
+    """
+    Devolve o detalhe bruto de um mês a log_uso_sim (com os id_log originais,
+    de todas as partes) e remove o resumo do mês, numa única transação. Os
+    arquivos são mantidos: o próximo --arquivar volta a compactar o mês (numa
+    parte só) se ele seguir fora da janela.
+    """
+    entrada = catalog_entry(conn, mes)
+    if entrada is None:
+        raise ValueError(f"{mes:%Y-%m} não está no catálogo de meses arquivados.")
+    if entrada[1] is not None:
+        raise ValueError(f"{mes:%Y-%m} já foi reanexado.")
+    inicio, fim = _month_bounds(mes)
+    linhas = 0
+    try:
+        with conn.cursor() as cur:
+            lotes = (lote for caminho in archive_parts(destino, mes, entrada[0])
+                     for lote in pq.ParquetFile(caminho).iter_batches(batch_size=LOTE))
+            for lote in lotes:
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                for row in zip(*(c.to_pylist() for c in lote.columns)):
+                    writer.writerow(["" if v is None else v for v in row])
+                buf.seek(0)
+                cur.copy_expert(
+                    f"COPY log_uso_sim ({', '.join(ARQUIVO_COLS)}) FROM STDIN WITH (FORMAT csv)", buf
+                )
+                linhas += lote.num_rows
+            cur.execute("DELETE FROM resumo_uso_diario WHERE data >= %s AND data < %s;", (inicio, fim))
+            cur.execute("UPDATE arquivo_log SET reanexado_em = %s WHERE mes = %s;", (datetime.now(), mes))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return linhas
+
+
+def list_archives(conn):
+    return pd.read_sql_query("SELECT * FROM arquivo_log ORDER BY mes;", conn)
+
+
+def _parse_month(texto):
+    return datetime.strptime(texto, "%Y-%m").date()
+
+
+def main():
+    import psycopg2
+    from ingestao_logs import conn_params_from_env
+
+    parser = argparse.ArgumentParser(description="Arquivamento dos dados frios de log_uso_sim")
+    parser.add_argument("--arquivar", action="store_true",
+                        help="Compacta os meses fora da janela quente em resumo diário + Parquet")
+    parser.add_argument("--janela", type=int, default=JANELA_DIAS, help="Dias mantidos em log_uso_sim")
+    parser.add_argument("--destino", default=DESTINO, help="Diretório dos arquivos Parquet")
+    parser.add_argument("--reanexar", type=_parse_month, metavar="AAAA-MM",
+                        help="Devolve o detalhe de um mês arquivado a log_uso_sim")
+    parser.add_argument("--listar", action="store_true", help="Mostra o catálogo de meses arquivados")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="VACUUM ANALYZE em log_uso_sim após arquivar (devolve o espaço para reuso)")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        if args.arquivar:
+            feitos = archive_cold_data(conn, args.janela, args.destino)
+            for mes, linhas, tamanho in feitos:
+                print(f"{mes:%Y-%m}: {linhas} registros -> {tamanho / 1e6:.1f} MB")
+            print(f"{len(feitos)} mês(es) arquivado(s).")
+            if feitos and args.vacuum:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("VACUUM ANALYZE log_uso_sim;")
+                conn.autocommit = False
+        if args.reanexar:
+            linhas = reattach_month(conn, args.reanexar.replace(day=1), args.destino)
+            print(f"{args.reanexar:%Y-%m}: {linhas} registros reanexados.")
+        if args.listar:
+            print(list_archives(conn).to_string(index=False))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# cache_memoria.py
+# Cache em memória com orçamento em bytes, particionado por empresa (tenant).
+# Cada empresa tem seu próprio LRU: o histórico de um cliente grande nunca
+# expulsa os dados de um cliente pequeno. As leituras devolvem visões
+# somente-leitura (sem cópia profunda) e cada cache conta hits, misses e
+# expulsões. As visões de DataFrame dependem do copy-on-write do pandas 3
+# (requirements.txt fixa pandas>=3).
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MB = 1024 * 1024
+DEFAULT_TENANT_BUDGET = 256 * MB
+
+_MISSING = object()
+
+
+def sizeof(value):
+    """Tamanho aproximado do objeto em bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(value)
+    if isinstance(getattr(value, "nbytes", None), int):
+        return value.nbytes   # objeto que informa a própria memória (ex.: cenarios.ScenarioSimulator)
+    # Objetos compostos (modelo, calendário...): tamanho serializado
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def is_empty(value):
+    """None ou coleção vazia (DataFrame, array, calendário sem dias...): resultado que não vai para o cache."""
+    if value is None:
+        return True
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.size == 0
+    return hasattr(value, "__len__") and len(value) == 0
+
+
+def readonly_view(value):
+    """
+    Visão sem cópia dos dados: DataFrame/Series ganham um objeto novo que
+    compartilha os arrays — com o copy-on-write do pandas 3, qualquer escrita
+    nele copia antes, então o cache não muda; arrays NumPy voltam como visão
+    com escrita bloqueada.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    return value
+
+
+class ByteBudgetLRU:
+    """LRU limitado pela soma dos tamanhos das entradas (e opcionalmente por TTL)."""
+
+    def __init__(self, max_bytes, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @property
+    def used_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._data)
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        """Valor cacheado como visão somente-leitura (ver readonly_view)."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[2] is not None and time.monotonic() > item[2]:
+                self._drop(key)
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return readonly_view(item[0])
+
+    def put(self, key, value, ttl=None):
+        """Guarda value (ttl próprio opcional). Retorna False se não couber no orçamento."""
+        size = sizeof(value)
+        ttl = self.ttl if ttl is None else ttl
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if size > self.max_bytes:
+                return False  # maior que o orçamento inteiro: não cacheia
+            while self._bytes + size > self.max_bytes and self._data:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+            self._data[key] = (value, size, None if ttl is None else time.monotonic() + ttl)
+            self._bytes += size
+            return True
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Retorna o valor cacheado ou executa loader() e guarda (None/vazio não é guardado)."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if not is_empty(value):
+                self.put(key, value, ttl)
+            value = readonly_view(value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entradas": len(self._data), "bytes": self._bytes, "orcamento": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "expirations": self.expirations, "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+
+class TenantCaches:
+    """Um ByteBudgetLRU por id_empresa, com orçamento próprio por tenant."""
+
+    def __init__(self, default_budget=DEFAULT_TENANT_BUDGET, budgets=None, ttl=None):
+        self.default_budget = default_budget
+        self.budgets = dict(budgets or {})
+        self.ttl = ttl
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def for_tenant(self, id_empresa):
+        with self._lock:
+            cache = self._caches.get(id_empresa)
+            if cache is None:
+                budget = self.budgets.get(id_empresa, self.default_budget)
+                cache = self._caches[id_empresa] = ByteBudgetLRU(budget, self.ttl)
+            return cache
+
+    def get_or_load(self, id_empresa, key, loader):
+        """Retorna o valor cacheado do tenant ou executa loader() e guarda (None/vazio não é guardado)."""
+        return self.for_tenant(id_empresa).get_or_load(key, loader)
+
+    def usage(self):
+        """Bytes usados / orçamento por tenant."""
+        with self._lock:
+            return {tid: (c.used_bytes, c.max_bytes) for tid, c in self._caches.items()}
+
+    def stats(self):
+        """Estatísticas (hits, misses, expulsões, bytes) por tenant."""
+        with self._lock:
+            caches = dict(self._caches)
+        return {tid: c.stats() for tid, c in caches.items()}
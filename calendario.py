@@ -0,0 +1,217 @@
+# calendario.py
+# Calendário de features: tabela "calendario" indexada por data com evento,
+# feriado e dia útil. É carregada uma vez em arrays NumPy indexados pelo
+# deslocamento em dias e consultada em O(1). O histórico mantém o evento de
+# cada registro (eventos_especiais); o calendário responde pelas datas
+# futuras, onde antes o último evento do usuário era repetido, e pelos dias
+# úteis do perfil semanal da previsão hierárquica (feriado = domingo).
+#
+# Uso:  python calendario.py --gerar 2024-01-01 2027-12-31
+#       (eventos passados vêm do log; futuros podem ser cadastrados na tabela)
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+EVENTO_PADRAO = "Nenhum"
+LIMIAR_EVENTO_DIA = 0.2   # fração mínima dos registros do dia para o evento valer para a data
+
+
+# --- FERIADOS NACIONAIS ---
+def _easter(year):
+    # Algoritmo de Meeus/Jones/Butcher (calendário gregoriano)
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def brazil_holidays(year):
+    """Feriados nacionais (fixos e móveis) de um ano: {data: nome}."""
+    easter = _easter(year)
+    return {
+        date(year, 1, 1): "Confraternização Universal",
+        easter - timedelta(days=48): "Carnaval",
+        easter - timedelta(days=47): "Carnaval",
+        easter - timedelta(days=2): "Sexta-feira Santa",
+        date(year, 4, 21): "Tiradentes",
+        date(year, 5, 1): "Dia do Trabalho",
+        easter + timedelta(days=60): "Corpus Christi",
+        date(year, 9, 7): "Independência",
+        date(year, 10, 12): "Nossa Senhora Aparecida",
+        date(year, 11, 2): "Finados",
+        date(year, 11, 15): "Proclamação da República",
+        date(year, 11, 20): "Consciência Negra",
+        date(year, 12, 25): "Natal",
+    }
+
+
+# --- STORE EM MEMÓRIA ---
+class CalendarStore:
+    """Arrays por deslocamento em dias a partir de start (consulta O(1))."""
+
+    def __init__(self, start, eventos, dia_util):
+        self.start = pd.Timestamp(start).normalize()
+        self.eventos = np.asarray(eventos, dtype=object)
+        self.dia_util = np.asarray(dia_util, dtype=bool)
+
+    def __len__(self):
+        return len(self.eventos)
+
+    @property
+    def end(self):
+        return self.start + pd.Timedelta(days=len(self) - 1)
+
+    def offsets(self, dates):
+        dates = pd.DatetimeIndex(pd.to_datetime(dates)).normalize()
+        return ((dates - self.start) // pd.Timedelta(days=1)).to_numpy()
+
+    def _lookup(self, arr, dates, default):
+        off = self.offsets(dates)
+        inside = (off >= 0) & (off < len(arr))
+        out = np.full(len(off), default, dtype=arr.dtype)
+        out[inside] = arr[off[inside]]
+        return out
+
+    def evento(self, dates):
+        return self._lookup(self.eventos, dates, EVENTO_PADRAO)
+
+    def evento_at(self, day):
+        off = int((pd.Timestamp(day).normalize() - self.start).days)
+        return self.eventos[off] if 0 <= off < len(self.eventos) else EVENTO_PADRAO
+
+    def is_business_day(self, dates):
+        # Fora do intervalo carregado: segunda a sexta
+        off = self.offsets(dates)
+        weekday = ((pd.DatetimeIndex(pd.to_datetime(dates)).dayofweek) < 5)
+        out = np.asarray(weekday, dtype=bool).copy()
+        inside = (off >= 0) & (off < len(self.dia_util))
+        out[inside] = self.dia_util[off[inside]]
+        return out
+
+    def day_type(self, dates):
+        """Dia da semana (0-6); dias de semana que não são úteis (feriados) contam como domingo."""
+        dow = np.asarray(pd.DatetimeIndex(pd.to_datetime(dates)).dayofweek)
+        return np.where((dow < 5) & ~self.is_business_day(dates), 6, dow)
+
+    @classmethod
+    def from_frame(cls, df):
+        """DataFrame com colunas data, evento, dia_util (uma linha por dia)."""
+        if df.empty:
+            return cls.empty()
+        df = df.assign(data=pd.to_datetime(df['data']).dt.normalize()).sort_values('data')
+        full = pd.date_range(df['data'].iloc[0], df['data'].iloc[-1])
+        df = df.set_index('data').reindex(full)
+        return cls(
+            full[0],
+            df['evento'].fillna(EVENTO_PADRAO).to_numpy(dtype=object),
+            df['dia_util'].fillna(pd.Series(full.dayofweek < 5, index=full)).to_numpy(dtype=bool),
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls(pd.Timestamp("1970-01-01"), np.array([], dtype=object), np.array([], bool))
+
+
+def build_calendar_frame(start, end, eventos_por_dia=None):
+    """Monta as linhas do calendário: feriados, dias úteis e eventos (série data -> evento)."""
+    days = pd.date_range(start, end)
+    holidays = {}
+    for year in range(days[0].year, days[-1].year + 1):
+        holidays.update(brazil_holidays(year))
+    nome_feriado = pd.Series([holidays.get(d.date()) for d in days], index=days)
+    feriado = nome_feriado.notna()
+    eventos = pd.Series(EVENTO_PADRAO, index=days)
+    if eventos_por_dia is not None and len(eventos_por_dia):
+        ev = pd.Series(eventos_por_dia)
+        ev.index = pd.to_datetime(ev.index).normalize()
+        eventos.update(ev.reindex(days).dropna())
+    return pd.DataFrame({
+        'data': days.date,
+        'evento': eventos.to_numpy(),
+        'feriado': feriado.to_numpy(),
+        'nome_feriado': nome_feriado.to_numpy(),
+        'dia_util': ((days.dayofweek < 5) & ~feriado.to_numpy()),
+    })
+
+
+# --- BANCO ---
+def load_calendar(conn):
+    """
+    Carrega a tabela calendario inteira para o CalendarStore. Sem a tabela (ou
+    vazia) o store sai vazio: quem usa deve avisar e cair no último evento de
+    cada usuário para as datas futuras (previsao_lote faz isso).
+    """
+    try:
+        df = pd.read_sql_query("SELECT data, evento, dia_util FROM calendario ORDER BY data;", conn)
+    except Exception:
+        conn.rollback()
+        return CalendarStore.empty()
+    return CalendarStore.from_frame(df)
+
+
+AVISO_CALENDARIO_VAZIO = ("Tabela calendario vazia ou ausente: as datas futuras repetem o último evento "
+                          "de cada usuário. Gere com: python calendario.py --gerar INICIO FIM")
+
+
+def events_from_logs(conn, limiar=LIMIAR_EVENTO_DIA):
+    """Evento dominante de cada dia do histórico (quando cobre ao menos `limiar` dos registros)."""
+    df = pd.read_sql_query("""
+        SELECT l.data_uso::date AS data, evt.nome_eventos AS evento, SUM(l.n_registros) AS n
+        FROM uso_consolidado l
+        JOIN eventos_especiais evt ON l.id_evento = evt.id_evento
+        GROUP BY 1, 2;
+    """, conn)
+    if df.empty:
+        return pd.Series(dtype=object)
+    df['share'] = df['n'] / df.groupby('data')['n'].transform('sum')
+    df = df[(df['evento'] != EVENTO_PADRAO) & (df['share'] >= limiar)]
+    top = df.sort_values('share').groupby('data').tail(1)
+    return top.set_index('data')['evento']
+
+
+def generate_calendar(conn, start, end):
+    """Regrava a tabela calendario no intervalo, preservando eventos futuros já cadastrados."""
+    from psycopg2.extras import execute_values
+
+    frame = build_calendar_frame(start, end, events_from_logs(conn))
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO calendario (data, evento, feriado, nome_feriado, dia_util)
+            VALUES %s
+            ON CONFLICT (data) DO UPDATE SET
+                evento = CASE WHEN EXCLUDED.evento <> 'Nenhum' THEN EXCLUDED.evento ELSE calendario.evento END,
+                feriado = EXCLUDED.feriado,
+                nome_feriado = EXCLUDED.nome_feriado,
+                dia_util = EXCLUDED.dia_util;
+        """, frame.astype(object).where(frame.notna(), None).values.tolist(), page_size=5_000)
+    conn.commit()
+    return len(frame)
+
+
+def main():
+    import psycopg2
+    from ingestao_logs import conn_params_from_env
+
+    parser = argparse.ArgumentParser(description="Gera a tabela calendario (feriados, dias úteis, eventos)")
+    parser.add_argument("--gerar", nargs=2, metavar=("INICIO", "FIM"), required=True)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        n = generate_calendar(conn, *args.gerar)
+    finally:
+        conn.close()
+    print(f"calendario: {n} dias gravados.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# cenarios.py
+# Simulador de cenários ("e se o cargo X for para um plano de 20 GB?",
+# "e se bloquearmos o roaming?") sobre a última previsão: o tensor da
+# previsão fica em memória e cada cenário é uma sequência de transformações
+# em arrays. Mudanças só de cobrança (plano, franquia) não tocam o modelo;
+# mudanças nas entradas (situação, evento, dispositivo) refazem a projeção apenas
+# dos usuários afetados, com memória das projeções já feitas.
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import custos
+import previsao_lote
+from calendario import EVENTO_PADRAO
+
+MEMORIA_PROJECOES = 8   # projeções parciais lembradas por simulador (as mais recentes)
+
+
+# --- TRANSFORMAÇÕES ---
+class ScenarioState:
+    """Cópia de trabalho de um cenário: entradas do modelo, perfil de cobrança e escala do consumo."""
+
+    def __init__(self, meta, users, tariffs):
+        self.meta = meta.copy()
+        self.users = users.copy()
+        self.tariffs = tariffs.copy()
+        self.scale = np.ones(len(meta))
+
+
+def _scope(frame, cargo=None, departamento=None):
+    mask = np.ones(len(frame), dtype=bool)
+    if cargo is not None:
+        mask &= (frame['cargo'] == cargo).to_numpy()
+    if departamento is not None:
+        mask &= (frame['departamento'] == departamento).to_numpy()
+    return mask
+
+
+class PlanChange:
+    """Novo limite de plano para um cargo; a mensalidade acompanha a franquia (mesmo preço por GB)."""
+
+    def __init__(self, cargo, limite_gb, mensalidade=None):
+        self.cargo, self.limite_gb, self.mensalidade = cargo, float(limite_gb), mensalidade
+
+    def apply(self, state):
+        mask = _scope(state.users, cargo=self.cargo)
+        if not mask.any():
+            return
+        antigo = float(state.users.loc[mask, 'limite_gigas'].iloc[0])
+        state.users.loc[mask, 'limite_gigas'] = self.limite_gb
+        if self.cargo in state.tariffs.index:
+            novo = self.mensalidade if self.mensalidade is not None else \
+                state.tariffs.at[self.cargo, 'mensalidade'] * self.limite_gb / max(antigo, 1e-9)
+            state.tariffs.at[self.cargo, 'mensalidade'] = novo
+
+    def __str__(self):
+        return f"Plano {self.cargo}: {self.limite_gb:.0f} GB"
+
+
+class SituacaoChange:
+    """Reatribui a situação das linhas do escopo (entrada do modelo)."""
+
+    def __init__(self, para, de=None, cargo=None, departamento=None):
+        self.para, self.de, self.cargo, self.departamento = para, de, cargo, departamento
+
+    def apply(self, state):
+        mask = _scope(state.meta, self.cargo, self.departamento)
+        if self.de is not None:
+            mask &= (state.meta['situacao'] == self.de).to_numpy()
+        state.meta.loc[mask, 'situacao'] = self.para
+
+    def __str__(self):
+        return f"Situação {self.de or 'todas'} → {self.para}"
+
+
+class BlockRoaming:
+    """
+    Bloqueia roaming: o tráfego em roaming (fração do GB com evento Roaming)
+    some e as linhas cujo último evento é Roaming passam ao evento padrão.
+    """
+
+    def __init__(self, cargo=None, departamento=None, evento_destino=EVENTO_PADRAO):
+        self.cargo, self.departamento, self.destino = cargo, departamento, evento_destino
+
+    def apply(self, state):
+        mask = _scope(state.meta, self.cargo, self.departamento)
+        share = state.users['roaming_share'].to_numpy()
+        state.scale[mask] *= 1 - share[mask]
+        state.users.loc[mask, 'roaming_share'] = 0.0
+        in_roaming = mask & custos._is_roaming(state.meta['evento'])
+        state.meta.loc[in_roaming, 'evento'] = self.destino
+
+    def __str__(self):
+        return "Bloqueio de roaming"
+
+
+class DeviceMix:
+    """Troca o dispositivo de uma fração das linhas do escopo (sorteio fixo, reproduzível)."""
+
+    def __init__(self, para, fracao=1.0, de=None, cargo=None, departamento=None, semente=0):
+        self.para, self.fracao, self.de = para, float(fracao), de
+        self.cargo, self.departamento, self.semente = cargo, departamento, semente
+
+    def apply(self, state):
+        mask = _scope(state.meta, self.cargo, self.departamento)
+        if self.de is not None:
+            mask &= (state.meta['dispositivo'] == self.de).to_numpy()
+        idx = np.flatnonzero(mask)
+        idx = np.random.default_rng(self.semente).permutation(idx)[:int(round(self.fracao * len(idx)))]
+        state.meta.loc[idx, 'dispositivo'] = self.para
+
+    def __str__(self):
+        return f"{self.fracao:.0%} dos dispositivos {self.de or ''} → {self.para}".replace("  ", " ")
+
+
+# --- SIMULADOR ---
+class ScenarioSimulator:
+    """
+    Guarda a projeção base (sem ruído, para que as diferenças venham só do
+    cenário) e o estado inicial de cada usuário. evaluate() aplica as
+    transformações e refaz só as projeções cujas entradas mudaram; as últimas
+    MEMORIA_PROJECOES ficam em memória.
+    """
+
+    def __init__(self, modelo, seed, future_dates, users, tariffs, calendar=None, realized=None):
+        self.modelo = modelo
+        self.uids, self.hist, self.meta = seed[0], seed[1], seed[2].reset_index(drop=True)
+        self.future_dates = future_dates
+        self.calendar = calendar
+        self.users = users.reindex(self.uids).reset_index()
+        self.tariffs = tariffs
+        self.realized = realized
+        self._base = None
+        self._rollouts = OrderedDict()   # (usuários, entradas) -> projeção (dias × usuários), LRU
+        self._fixed_bytes = None         # seed, usuários, tarifas e realizado: medidos uma vez
+
+    @classmethod
+    def build(cls, modelo, df_fe, df_raw, future_dates, tariffs, calendar=None, seed=None):
+        """Mesmo estado inicial da previsão (seed do histórico ou montado de df_fe)."""
+        seed = seed if seed is not None else previsao_lote.build_history_matrix(df_fe)
+        months = custos.monthly_usage(pd.DataFrame(index=future_dates))[0]
+        realized = custos.realized_usage(df_raw, months, seed[0])
+        return cls(modelo, seed, future_dates, custos.user_profile(df_raw), tariffs, calendar, realized)
+
+    def _rollout(self, rows, meta):
+        if not len(rows):
+            return np.empty((len(self.future_dates), 0))
+        key = (rows.tobytes(), pd.util.hash_pandas_object(meta.iloc[rows], index=False).to_numpy().tobytes())
+        if key in self._rollouts:
+            self._rollouts.move_to_end(key)
+            return self._rollouts[key]
+        fc = previsao_lote.forecast_users_batched(
+            self.modelo, None, self.future_dates, noise=False, calendar=self.calendar,
+            seed=(self.uids[rows], self.hist[rows], meta.iloc[rows].reset_index(drop=True))
+        )
+        self._rollouts[key] = fc.to_numpy()
+        while len(self._rollouts) > MEMORIA_PROJECOES:
+            self._rollouts.popitem(last=False)
+        return self._rollouts[key]
+
+    @property
+    def nbytes(self):
+        """
+        Memória própria do simulador (o modelo e o calendário são compartilhados
+        e ficam de fora). Só a base e as projeções lembradas crescem: o resto é
+        medido na primeira chamada.
+        """
+        if self._fixed_bytes is None:
+            frames = [self.meta, self.users, self.tariffs]
+            self._fixed_bytes = (self.hist.nbytes + sum(a.nbytes for a in (self.realized or ()))
+                                 + sum(int(f.memory_usage(index=True, deep=True).sum()) for f in frames))
+        grown = [self._base, *self._rollouts.values()]
+        return self._fixed_bytes + sum(a.nbytes for a in grown if a is not None)
+
+    @property
+    def base(self):
+        if self._base is None:
+            self._base = self._rollout(np.arange(len(self.uids)), self.meta)
+        return self._base
+
+    def evaluate(self, transforms=()):
+        """Projeção (datas × usuários) e faturas do cenário; usuários reprojetados em 'reprojetados'."""
+        state = ScenarioState(self.meta, self.users, self.tariffs)
+        for t in transforms:
+            t.apply(state)
+        cols = previsao_lote.CAT_COLS
+        before = self.meta[cols].astype(object).fillna("")
+        changed = np.flatnonzero((state.meta[cols].astype(object).fillna("") != before).any(axis=1).to_numpy())
+        fc = self.base.copy()
+        fc[:, changed] = self._rollout(changed, state.meta)
+        fc *= state.scale
+        fc_users = pd.DataFrame(fc, index=self.future_dates, columns=self.uids)
+        invoices = custos.project_invoices(fc_users, state.users.set_index('id_usuario'), state.tariffs,
+                                           realized=self.realized)
+        return fc_users, invoices, len(changed)
+
+    def compare(self, scenarios):
+        """scenarios: {nome: [transformações]} -> uma linha por cenário, com a base primeiro."""
+        rows = []
+        base_gb = base_cost = None
+        for name, transforms in {"Base": [], **scenarios}.items():
+            fc_users, invoices, n_changed = self.evaluate(transforms)
+            per_user = invoices.groupby('id_usuario')[['consumo_gb', 'excedente_gb', 'custo_total']].sum()
+            gb, cost = float(fc_users.to_numpy().sum()), float(per_user['custo_total'].sum())
+            if base_gb is None:
+                base_gb, base_cost = gb, cost
+            rows.append({
+                'Cenário': name,
+                'Transformações': "; ".join(str(t) for t in transforms) or "—",
+                'Consumo Projetado (GB)': gb,
+                'Fatura Projetada (R$)': cost,
+                'Δ Fatura (R$)': cost - base_cost,
+                'Δ Fatura (%)': 100 * (cost / base_cost - 1) if base_cost else 0.0,
+                'Excedente (GB)': float(per_user['excedente_gb'].sum()),
+                'Linhas com Excedente': int((per_user['excedente_gb'] > 0).sum()),
+                'Linhas Reprojetadas': n_changed,
+            })
+        return pd.DataFrame(rows)
@@ -0,0 +1,166 @@
+# custos.py
+# Projeção de fatura: a matriz de previsão (dias × usuários) vira consumo
+# mensal por linha, e franquia, excedente em faixas e roaming são aplicados
+# como funções por partes sobre arrays (meses × usuários) — sem laço por
+# usuário, a frota inteira sai de uma vez.
+#
+# Tarifas por cargo vêm de tarifa_cargo; cargos sem linha usam tarifas
+# calibradas pelo custo_total histórico (preço médio por GB). Roaming é o
+# evento do registro (eventos_especiais), coluna `evento` do histórico.
+import numpy as np
+import pandas as pd
+
+# Excedente em faixas, em frações da franquia: (início da faixa, multiplicador do preço)
+FAIXAS_EXCEDENTE = [(0.0, 1.0), (0.5, 1.5)]
+ROAMING_FATOR_PADRAO = 3.0   # roaming sem histórico: preço doméstico × fator
+PRECO_GB_PADRAO = 1.0        # sem custo_total no histórico do cargo
+TARIFA_COLS = ['mensalidade', 'preco_gb_excedente', 'preco_gb_roaming']
+
+
+# --- TARIFAS ---
+def _is_roaming(evento):
+    return evento.astype(str).str.contains('Roaming', case=False, na=False).to_numpy()
+
+
+def calibrate_tariffs(df_hist):
+    """
+    Tarifas por cargo a partir do histórico (colunas cargo, limite_gigas,
+    evento, consumo, custo_total): a franquia vale o preço médio doméstico
+    por GB × limite; o excedente parte do mesmo preço; roaming usa o preço
+    médio observado em roaming.
+    """
+    df = df_hist[['cargo', 'limite_gigas', 'consumo', 'custo_total']].copy()
+    df['roaming'] = _is_roaming(df_hist['evento'])
+    df['consumo'] = df['consumo'].astype(float)
+    df['custo_total'] = pd.to_numeric(df['custo_total'], errors='coerce')
+    df = df[df['custo_total'].notna()]
+
+    def price(part):
+        gb = part.groupby('cargo')['consumo'].sum()
+        return part.groupby('cargo')['custo_total'].sum() / gb.where(gb > 0)
+
+    cargos = df_hist.groupby('cargo')['limite_gigas'].first().astype(float)
+    dom = price(df[~df['roaming']]).reindex(cargos.index).fillna(PRECO_GB_PADRAO)
+    roam = price(df[df['roaming']]).reindex(cargos.index).fillna(dom * ROAMING_FATOR_PADRAO)
+    return pd.DataFrame({
+        'mensalidade': dom * cargos,
+        'preco_gb_excedente': dom,
+        'preco_gb_roaming': roam,
+    })
+
+
+def load_tariffs(conn):
+    """Tarifas cadastradas em tarifa_cargo, indexadas pelo nome do cargo (vazio se não houver)."""
+    try:
+        df = pd.read_sql_query("""
+            SELECT c.nome AS cargo, t.mensalidade, t.preco_gb_excedente, t.preco_gb_roaming
+            FROM tarifa_cargo t JOIN cargos c ON t.id_cargo = c.id_cargo;
+        """, conn)
+    except Exception:
+        conn.rollback()
+        return pd.DataFrame(columns=TARIFA_COLS)
+    return df.set_index('cargo')[TARIFA_COLS].astype(float)
+
+
+def resolve_tariffs(cadastradas, df_hist):
+    """Cadastradas têm prioridade; os demais cargos do histórico usam a calibração."""
+    calibradas = calibrate_tariffs(df_hist)
+    out = calibradas.copy()
+    comuns = cadastradas.index.intersection(out.index)
+    out.loc[comuns, TARIFA_COLS] = cadastradas.loc[comuns, TARIFA_COLS]
+    return pd.concat([out, cadastradas.drop(comuns)])[TARIFA_COLS].astype(float)
+
+
+# --- PERFIL DAS LINHAS ---
+def user_profile(df_raw):
+    """Por id_usuario: departamento, cargo, limite, empresa (se houver) e fração do GB em roaming."""
+    cols = [c for c in ['usuario', 'empresa', 'departamento', 'cargo', 'limite_gigas'] if c in df_raw.columns]
+    users = df_raw.groupby('id_usuario')[cols].last()
+    gb = df_raw['consumo'].astype(float).to_numpy()
+    roam = pd.Series(np.where(_is_roaming(df_raw['evento']), gb, 0.0), index=df_raw['id_usuario'])
+    total = pd.Series(gb, index=df_raw['id_usuario']).groupby(level=0).sum()
+    users['roaming_share'] = (roam.groupby(level=0).sum() / total.where(total > 0)).fillna(0.0)
+    return users
+
+
+def realized_usage(df_raw, months, uids):
+    """GB total e em roaming já consumidos (meses × usuários) nos meses da projeção."""
+    df = df_raw[['id_usuario', 'data_uso', 'consumo', 'evento']]
+    mes = pd.to_datetime(df['data_uso']).dt.to_period('M').dt.to_timestamp()
+    keep = mes.isin(months).to_numpy() & df['id_usuario'].isin(uids).to_numpy()
+    gb = df['consumo'].astype(float).to_numpy()[keep]
+    roam = np.where(_is_roaming(df['evento'])[keep], gb, 0.0)
+    m_idx = pd.Index(months).get_indexer(mes[keep])
+    u_idx = pd.Index(uids).get_indexer(df['id_usuario'][keep])
+    total = np.zeros((len(months), len(uids)))
+    roaming = np.zeros((len(months), len(uids)))
+    np.add.at(total, (m_idx, u_idx), gb)
+    np.add.at(roaming, (m_idx, u_idx), roam)
+    return total, roaming
+
+
+# --- MOTOR VETORIZADO ---
+def monthly_usage(fc_users):
+    """Soma a previsão diária por mês: (meses, matriz meses × usuários)."""
+    dates = pd.DatetimeIndex(fc_users.index)
+    codes, months = pd.factorize(dates.to_period('M'), sort=True)
+    starts = np.flatnonzero(np.r_[True, np.diff(codes) != 0])
+    return months.to_timestamp(), np.add.reduceat(fc_users.to_numpy(dtype=float), starts, axis=0)
+
+
+def overage_cost(excess_gb, limit_gb, price, faixas=FAIXAS_EXCEDENTE):
+    """Excedente por faixas (frações da franquia), cada uma com seu multiplicador de preço."""
+    cost = np.zeros_like(excess_gb)
+    for k, (inicio, mult) in enumerate(faixas):
+        fim = faixas[k + 1][0] if k + 1 < len(faixas) else np.inf
+        cost += mult * price * np.clip(excess_gb - inicio * limit_gb, 0, (fim - inicio) * limit_gb)
+    return cost
+
+
+def project_invoices(fc_users, users, tariffs, realized=None, faixas=FAIXAS_EXCEDENTE):
+    """
+    Fatura projetada por linha e mês.
+    fc_users: previsão (datas × id_usuario); users: user_profile; tariffs:
+    resolve_tariffs (por cargo); realized: (gb, gb_roaming) de realized_usage,
+    somado aos meses que já começaram. Retorna DataFrame longo (mes, id_usuario, ...).
+    """
+    uids = fc_users.columns.to_numpy()
+    months, gb = monthly_usage(fc_users)
+    prof = users.reindex(uids)
+    tar = tariffs.reindex(prof['cargo']).fillna(0.0)
+    limit = prof['limite_gigas'].astype(float).fillna(0.0).to_numpy()
+    share = prof['roaming_share'].fillna(0.0).to_numpy()
+
+    gb_roam = gb * share
+    if realized is not None:
+        gb = gb + realized[0]
+        gb_roam = gb_roam + realized[1]
+    gb_dom = gb - gb_roam
+    excess = np.maximum(gb_dom - limit, 0.0)
+
+    mensalidade = np.broadcast_to(tar['mensalidade'].to_numpy(), gb.shape)
+    custo_exc = overage_cost(excess, limit, tar['preco_gb_excedente'].to_numpy(), faixas)
+    custo_roam = gb_roam * tar['preco_gb_roaming'].to_numpy()
+
+    n_m, n_u = gb.shape
+    out = pd.DataFrame({
+        'mes': np.repeat(months, n_u),
+        'id_usuario': np.tile(uids, n_m),
+        'consumo_gb': gb.ravel(),
+        'excedente_gb': excess.ravel(),
+        'roaming_gb': gb_roam.ravel(),
+        'mensalidade': mensalidade.ravel(),
+        'custo_excedente': custo_exc.ravel(),
+        'custo_roaming': custo_roam.ravel(),
+    })
+    out['custo_total'] = out['mensalidade'] + out['custo_excedente'] + out['custo_roaming']
+    for c in [c for c in ['empresa', 'departamento', 'cargo'] if c in prof.columns]:
+        out[c] = np.tile(prof[c].to_numpy(), n_m)
+    return out
+
+
+def invoice_totals(invoices, by=None):
+    """Total por mês (e por `by`: 'departamento', 'empresa', ...) — meses × grupos."""
+    if by is None:
+        return invoices.groupby('mes')['custo_total'].sum()
+    return invoices.pivot_table(index='mes', columns=by, values='custo_total', aggfunc='sum', fill_value=0.0)
@@ -1,34 +1,210 @@
+import os
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import psycopg2
 import pickle
 import numpy as np
-from datetime import datetime, date
-import lightgbm as lgb 
+import graficos_dados
+import previsao_lote
+import amostragem
+import historico_usuarios
+import atribuicao
+import custos
+import cenarios
+import previsao_hierarquica
+import geoindice
+import acesso_dados
+from armazem_previsoes import TenantForecastStores
+from cache_memoria import ByteBudgetLRU, TenantCaches, MB, is_empty, readonly_view
+from servidor_inferencia import InferenceClient
+from preditor_compilado import CompiledPredictor
+from calendario import AVISO_CALENDARIO_VAZIO, load_calendar
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Orçamento de memória dos dados em cache, por empresa
+TENANT_CACHE_BUDGET = 256 * MB
+TENANT_CACHE_BUDGETS = {}   # id_empresa -> bytes (sobrescreve o padrão)
+# Recursos compartilhados entre empresas (modelo, calendário, lista de empresas)
+SHARED_CACHE_BUDGET = 512 * MB
+# Previsões geradas (uma cópia por previsão, compartilhada pelas sessões), por empresa
+FORECAST_STORE_BUDGET = 1024 * MB
+FORECAST_STORE_BUDGETS = {}   # id_empresa -> bytes (sobrescreve o padrão)
+# Prazo (s) de cada consulta disparada em paralelo (statement_timeout + espera do cliente)
+PRAZO_CONSULTA = {"empresas": 10, "main": 60, "amostra": 15, "ml": 90, "historico": 20, "tarifas": 10,
+                  "regioes": 15}
 
 # --- CONFIGURAÇÕES DO BANCO ---
+def db_params():
+    # Busca as credenciais dos Segredos do Streamlit
+    return dict(
+        host=st.secrets["DB_HOST"],
+        database=st.secrets["DB_NAME"],
+        user=st.secrets["DB_USER"],
+        password=st.secrets["DB_PASS"],
+        port=st.secrets.get("DB_PORT", "5432"),
+        sslmode="require"  # Obrigatório para o Neon
+    )
+
 @st.cache_resource(ttl=900)
 def init_db_conn():
     try:
-        # Busca as credenciais dos Segredos do Streamlit
-        conn = psycopg2.connect(
-            host=st.secrets["DB_HOST"],
-            database=st.secrets["DB_NAME"],
-            user=st.secrets["DB_USER"],
-            password=st.secrets["DB_PASS"],
-            port=st.secrets.get("DB_PORT", "5432"),
-            sslmode="require"  # Obrigatório para o Neon
-        )
-        return conn
+        return psycopg2.connect(**db_params())
     except Exception as e:
         st.error(f"Erro de Conexão DB: {e}")
         return None
 
-@st.cache_data(ttl=600)
-def load_main_data(_conn):
+@st.cache_resource
+def get_fetcher():
+    # Consultas independentes da página em paralelo, sobre um pool de conexões.
+    # Falha sobe (o cache_resource não guarda exceções): a próxima chamada tenta de novo
+    return acesso_dados.ParallelFetcher(acesso_dados.ConnectionPool(db_params()))
+
+@st.cache_resource
+def get_tenant_caches():
+    return TenantCaches(TENANT_CACHE_BUDGET, TENANT_CACHE_BUDGETS, ttl=600)
+
+@st.cache_resource
+def get_shared_cache():
+    return ByteBudgetLRU(SHARED_CACHE_BUDGET)
+
+_AUSENTE = object()
+
+def cached_query(cache, key, query, _conn, default=None, ttl=None, fetch_key=None, wait=True):
+    """
+    Valor em cache ou query(conn). Com o pool, a consulta roda numa thread
+    (compartilhada com quem já disparou a mesma fetch_key) e respeita
+    PRAZO_CONSULTA[key]; sem pool, usa a conexão da sessão. Resultado vazio
+    (falha ou prazo estourado) não vai para o cache. wait=False só dispara.
+    """
+    value = cache.get(key, _AUSENTE)
+    if value is not _AUSENTE:
+        return value
+
+    def job(conn):
+        result = query(conn)
+        if not is_empty(result):
+            cache.put(key, result, ttl)
+        return result
+
+    try:
+        fetcher = get_fetcher()
+    except Exception:
+        fetcher = None
+    if fetcher is None:
+        return readonly_view(job(_conn)) if wait else None
+    fut = fetcher.submit(fetch_key or key, job, PRAZO_CONSULTA.get(key, acesso_dados.PRAZO_PADRAO))
+    if not wait:
+        return fut
+    try:
+        return readonly_view(fetcher.result(fut))
+    except TimeoutError:
+        st.warning(f"⏱️ A consulta '{key}' excedeu o prazo de {fut.deadline:.0f} s. Tente novamente.")
+    except Exception:
+        pass
+    return default
+
+def prefetch_tenant(_conn, id_empresa, sampled):
+    """Dispara juntas as consultas da empresa que a página usa; cada load_* depois só aguarda a sua."""
+    if _conn is None: return
+    (load_sample_data if sampled else load_main_data)(_conn, id_empresa, wait=False)
+    load_ml_data(_conn, id_empresa, wait=False)
+    load_history(_conn, id_empresa, wait=False)
+    load_tariffs(_conn, wait=False)
+    load_region_rollup(_conn, id_empresa, wait=False)
+
+def _tenant_query(_conn, id_empresa, key, query, default, wait):
+    return cached_query(get_tenant_caches().for_tenant(id_empresa), key, lambda c: query(c, id_empresa),
+                        _conn, default, fetch_key=(id_empresa, key), wait=wait)
+
+# --- PREVISÕES DA SESSÃO ---
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+def _session_is_active(session_id):
+    from streamlit import runtime
+    return not runtime.exists() or runtime.get_instance().is_active_session(session_id)
+
+@st.cache_resource
+def get_forecast_stores():
+    return TenantForecastStores(FORECAST_STORE_BUDGET, FORECAST_STORE_BUDGETS, is_active=_session_is_active)
+
+def get_forecast_store(id_empresa):
+    return get_forecast_stores().for_tenant(id_empresa)
+
+def drop_forecast():
+    """Solta a previsão da sessão; o armazém da empresa libera a memória quando ninguém mais a usa."""
+    handle = st.session_state.pop('forecast', None)
+    for key in ['forecast_done', 'fc_data', 'hist_data', 'scenarios']:
+        st.session_state.pop(key, None)
+    if handle is not None:
+        get_forecast_store(st.session_state.get('empresa_ativa')).release(handle, _session_id())
+
+def load_calendar_store(_conn):
+    return get_shared_cache().get_or_load("calendario", lambda: load_calendar(_conn), ttl=3600)
+
+def load_empresas(_conn):
+    if _conn is None: return pd.DataFrame()
+    return cached_query(get_shared_cache(), "empresas", _query_empresas, _conn, pd.DataFrame(), ttl=600)
+
+def _query_empresas(_conn):
+    try:
+        return pd.read_sql_query("SELECT id_empresa, nome FROM empresas ORDER BY nome;", _conn)
+    except:
+        return pd.DataFrame()
+
+def load_main_data(_conn, id_empresa, wait=True):
     if _conn is None: return pd.DataFrame()
+    return _tenant_query(_conn, id_empresa, "main", _query_main_data, pd.DataFrame(), wait)
+
+def load_sample_data(_conn, id_empresa, wait=True):
+    # Amostra estratificada (modo exploratório): alguns milhares de linhas por empresa
+    if _conn is None: return pd.DataFrame()
+    return _tenant_query(_conn, id_empresa, "amostra", _query_sample_data, pd.DataFrame(), wait)
+
+def _query_sample_data(_conn, id_empresa):
+    try:
+        return amostragem.load_sample(_conn, id_empresa)
+    except:
+        return pd.DataFrame()
+
+def load_history(_conn, id_empresa, wait=True):
+    # Janelas recentes por usuário (historico_usuario): estado inicial da previsão
+    if _conn is None: return None
+    return _tenant_query(_conn, id_empresa, "historico", _query_history, None, wait)
+
+def _query_history(_conn, id_empresa):
+    try:
+        return historico_usuarios.load_history_seed(_conn, id_empresa, load_calendar_store(_conn))
+    except:
+        return None
+
+def load_region_rollup(_conn, id_empresa, wait=True):
+    # Consumo mensal por célula geográfica (consumo_celula_dia): mapa e causas regionais
+    if _conn is None: return pd.DataFrame()
+    return _tenant_query(_conn, id_empresa, "regioes", _query_regions, pd.DataFrame(), wait)
+
+def _query_regions(_conn, id_empresa):
+    try:
+        return geoindice.load_region_rollup(_conn, id_empresa)
+    except:
+        return pd.DataFrame()
+
+def region_context(regions, cargo, departamentos):
+    if regions.empty:
+        return regions
+    return regions[(regions['cargo'] == cargo) & regions['departamento'].isin(departamentos)]
+
+def history_seed(_conn, id_empresa, mask_fn, end):
+    """Seed da previsão (janelas alinhadas ao dia `end`); None se indisponível (usa o log)."""
+    store = load_history(_conn, id_empresa)
+    if store is None or not len(store):
+        return None
+    seed = store.select(mask_fn(store.meta), end=end)
+    return seed if len(seed[0]) else None
+
+def _query_main_data(_conn, id_empresa):
     query = """
     SELECT
         l.data_uso,
@@ -38,15 +214,16 @@ def load_main_data(_conn):
         c.nome AS "Cargo",
         c.limite_gigas AS "Plano (GB)", 
         emp.nome AS "Empresa"
-    FROM log_uso_sim l
+    FROM uso_consolidado l
     JOIN usuario u ON l.id_usuario = u.id_usuario
     JOIN departamentos dep ON u.id_departamento = dep.id_departamento
     JOIN cargos c ON u.id_cargo = c.id_cargo
     JOIN empresas emp ON u.id_empresa = emp.id_empresa
+    WHERE u.id_empresa = %s
     ORDER BY l.data_uso;
     """
     try:
-        df = pd.read_sql_query(query, _conn)
+        df = pd.read_sql_query(query, _conn, params=(int(id_empresa),))
         if not df.empty:
             df['data_uso'] = pd.to_datetime(df['data_uso'])
             df['Mês'] = df['data_uso'].dt.to_period('M').astype(str)
@@ -54,41 +231,104 @@ def load_main_data(_conn):
     except:
         return pd.DataFrame()
 
-@st.cache_data(ttl=600)
-def load_ml_data(_conn):
+def load_ml_data(_conn, id_empresa, wait=True):
     if _conn is None: return pd.DataFrame()
+    return _tenant_query(_conn, id_empresa, "ml", _query_ml_data, pd.DataFrame(), wait)
+
+def _query_ml_data(_conn, id_empresa):
     query = """
     SELECT
         l.data_uso,
         l.consumo_dados_gb AS consumo,
+        l.custo_total,
         u.id_usuario,
         u.nome AS usuario,
         dep.nome AS departamento,
         c.nome AS cargo,
+        c.limite_gigas,
         evt.nome_eventos AS evento,
         disp.nome_dispositivo AS dispositivo,
         s.situacao AS situacao
-    FROM log_uso_sim l
+    FROM uso_consolidado l
     JOIN usuario u ON l.id_usuario = u.id_usuario
     JOIN departamentos dep ON u.id_departamento = dep.id_departamento
     JOIN cargos c ON u.id_cargo = c.id_cargo
     JOIN eventos_especiais evt ON l.id_evento = evt.id_evento
     JOIN dispositivos disp ON l.id_dispositivo = disp.id_dispositivo
     JOIN situacao s ON l.id_situacao = s.id_situacao
+    WHERE u.id_empresa = %s
     ORDER BY l.data_uso;
     """
     try:
-        return pd.read_sql_query(query, _conn)
+        return pd.read_sql_query(query, _conn, params=(int(id_empresa),))
     except:
         return pd.DataFrame()
 
-@st.cache_resource 
 def load_model():
+    # Modelo fica no cache compartilhado (contabilizado no orçamento de memória)
+    return get_shared_cache().get_or_load("modelo", _load_model_uncached)
+
+def _load_model_uncached():
+    # Modo cliente: com INFERENCE_URL definido, usa o servidor de inferência
+    # compartilhado do host em vez de carregar uma cópia do modelo por réplica
+    url = os.environ.get("INFERENCE_URL")
+    if url:
+        # Se o servidor cair depois, o cliente passa a usar o modelo local
+        client = InferenceClient(url, fallback=_load_local_model)
+        if client.ping():
+            return client
+    return _load_local_model()
+
+def _load_local_model():
     try:
         with open('modelo_lightgbm_consumo.pkl', 'rb') as f:
-            return pickle.load(f)
+            modelo = pickle.load(f)
     except:
         return None
+    # Backend opcional: árvores achatadas em NumPy (exportadas pelo treino)
+    if os.environ.get("PREDICTOR_BACKEND") == "compilado":
+        try:
+            if os.path.exists('modelo_lightgbm_consumo_arvores.npz'):
+                return CompiledPredictor.load('modelo_lightgbm_consumo_arvores.npz')
+            return CompiledPredictor.from_model(modelo)
+        except Exception:
+            pass
+    return modelo
+
+def load_tariffs(_conn, wait=True):
+    return cached_query(get_shared_cache(), "tarifas", custos.load_tariffs, _conn,
+                        pd.DataFrame(columns=custos.TARIFA_COLS), ttl=600, wait=wait)
+
+def tenant_tariffs(_conn, id_empresa, df_ml):
+    # Cadastradas + calibradas pelo custo_total da empresa (cache por empresa)
+    return get_tenant_caches().get_or_load(
+        id_empresa, "tarifas", lambda: custos.resolve_tariffs(load_tariffs(_conn), df_ml)
+    )
+
+def load_explainer():
+    # pred_contrib só existe no LightGBM: com preditor compilado ou servidor de
+    # inferência, a atribuição usa o pickle local (None se não houver)
+    return get_shared_cache().get_or_load("explicador", _load_explainer_uncached)
+
+def _load_explainer_uncached():
+    modelo = load_model()
+    if atribuicao.booster_of(modelo) is not None:
+        return modelo
+    try:
+        with open('modelo_lightgbm_consumo.pkl', 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+def cache_stats_frame(nomes_empresa=None):
+    """Uso de memória e hit rate dos caches (compartilhado + um por empresa)."""
+    stats = {"Compartilhado": get_shared_cache().stats()}
+    for tid, st_tenant in get_tenant_caches().stats().items():
+        stats[(nomes_empresa or {}).get(tid, tid)] = st_tenant
+    df = pd.DataFrame.from_dict(stats, orient='index')
+    df['MB'] = df['bytes'] / MB
+    df['Orçamento (MB)'] = df['orcamento'] / MB
+    return df[['entradas', 'MB', 'Orçamento (MB)', 'hits', 'misses', 'evictions', 'hit_rate']]
 
 def prepare_features(df):
     df = df.copy()
@@ -97,7 +337,52 @@ def prepare_features(df):
     return df
 
 # --- FUNÇÃO: DETETIVE DE CAUSAS ---
-def analyze_root_cause(df_history, forecast_val, df_raw_context):
+GROUP_LABELS = {
+    'lags': ("📈", "Histórico Recente"),
+    'calendario': ("📆", "Calendário"),
+    'cargo': ("💼", "Perfil do Cargo"),
+    'departamento': ("🏢", "Departamento"),
+    'dispositivo': ("📱", "Perfil de Hardware"),
+    'situacao': ("🌍", "Situação da Linha"),
+    'evento': ("📅", "Eventos"),
+}
+
+def model_causes(attribution, df_raw_context):
+    """Causas a partir das contribuições SHAP da previsão (grupos e usuários)."""
+    causes = []
+    by_group = attribution.by_group
+    explained = by_group.abs().sum()
+    if explained <= 0:
+        return causes
+
+    for group, gb in by_group.head(3).items():
+        share = abs(gb) / explained * 100
+        if share < 10:
+            continue
+        emoji, label = GROUP_LABELS[group]
+        verbo = "eleva" if gb > 0 else "reduz"
+        causes.append(f"{emoji} **{label}:** {verbo} a projeção em **{abs(gb):.1f} GB** "
+                      f"({share:.0f}% do efeito explicado pelo modelo).")
+
+    top_users = attribution.top_users(3)
+    push = attribution.by_user.sum(axis=1).clip(lower=0).sum()
+    names = df_raw_context.groupby('id_usuario')['usuario'].last()
+    for uid, gb in top_users.items():
+        share = gb / push * 100
+        if share > 20:
+            causes.append(f"👤 **Principal Usuário:** *{names.get(uid, uid)}* responde por **{share:.1f}%** "
+                          f"do que a projeção coloca acima da base do modelo (+{gb:.1f} GB).")
+    return causes
+
+def region_causes(regions):
+    """Regiões cuja fatia do consumo cresceu nos últimos meses (índice geográfico)."""
+    if regions is None:
+        return []
+    return [f"📍 **Região:** *{r.regiao}* passou a concentrar **{r.fatia_recente:.0f}%** do consumo "
+            f"nos últimos meses (antes {r.fatia_anterior:.0f}%)."
+            for r in geoindice.region_shifts(regions).head(2).itertuples()]
+
+def analyze_root_cause(df_history, forecast_val, df_raw_context, attribution=None, regions=None):
     # 1. Análise Estatística
     recent_avg = df_history['Consumo'].mean()
     recent_std = df_history['Consumo'].std()
@@ -130,6 +415,13 @@ def analyze_root_cause(df_history, forecast_val, df_raw_context):
     
     if total_vol == 0: return status, color, msg, causes
 
+    # Com atribuição do modelo, as causas vêm do que a previsão de fato usou
+    if attribution is not None:
+        causes = model_causes(attribution, df_raw_context) + region_causes(regions)
+        if not causes:
+            causes.append("📈 **Crescimento Orgânico:** Aumento de volume distribuído, sem um ofensor isolado.")
+        return status, color, msg, causes
+
     # A. Top Usuários
     top_users = df_raw_context.groupby('usuario')['consumo'].sum().sort_values(ascending=False).head(3)
     for user, vol in top_users.items():
@@ -175,11 +467,96 @@ def analyze_root_cause(df_history, forecast_val, df_raw_context):
         if weekend_share > 20:
             causes.append(f"📆 **Padrão Temporal:** {weekend_share:.0f}% do consumo ocorre aos finais de semana.")
 
+    # F. Regiões (agregado por célula, sem varrer o log)
+    causes += region_causes(regions)
+
     if not causes:
         causes.append("📈 **Crescimento Orgânico:** Aumento de volume distribuído, sem um ofensor isolado.")
 
     return status, color, msg, causes
 
+# --- SIMULADOR DE CENÁRIOS ---
+def show_scenario_simulator(sim, cargo_label):
+    with st.expander("🧪 Simulador de Cenários (e se...?)"):
+        tipos = ["Mudar plano do cargo", "Bloquear roaming", "Trocar situação", "Trocar dispositivos"]
+        tipo = st.selectbox("Tipo de cenário:", tipos)
+        depts = ["Todos"] + sorted(sim.meta['departamento'].dropna().unique())
+        situacoes = sorted(sim.meta['situacao'].dropna().unique())
+        dispositivos = sorted(sim.meta['dispositivo'].dropna().unique())
+
+        c1, c2, c3 = st.columns(3)
+        if tipo == tipos[0]:
+            limite_atual = float(sim.users['limite_gigas'].dropna().iloc[0]) if sim.users['limite_gigas'].notna().any() else 0.0
+            novo = c1.number_input(f"Novo limite de {cargo_label} (GB):", min_value=1.0, value=max(limite_atual, 1.0), step=5.0)
+            transform = cenarios.PlanChange(cargo_label, novo)
+        elif tipo == tipos[1]:
+            dep = c1.selectbox("Departamento:", depts)
+            transform = cenarios.BlockRoaming(departamento=None if dep == "Todos" else dep)
+        elif tipo == tipos[2]:
+            de = c1.selectbox("De:", ["Todas"] + situacoes)
+            para = c2.selectbox("Para:", situacoes)
+            transform = cenarios.SituacaoChange(para, de=None if de == "Todas" else de)
+        else:
+            de = c1.selectbox("De:", ["Todos"] + dispositivos)
+            para = c2.selectbox("Para:", dispositivos)
+            fracao = c3.slider("Fração das linhas:", 0.1, 1.0, 0.5, step=0.1)
+            transform = cenarios.DeviceMix(para, fracao, de=None if de == "Todos" else de)
+
+        nome = st.text_input("Nome do cenário:", value=str(transform))
+        b1, b2 = st.columns(2)
+        if b1.button("Adicionar Cenário"):
+            usados = {n for n, _ in st.session_state['scenarios']}
+            if nome in usados:
+                nome = f"{nome} ({len(st.session_state['scenarios']) + 1})"
+            st.session_state['scenarios'].append((nome, transform))
+        if b2.button("Limpar Cenários"):
+            st.session_state['scenarios'] = []
+
+        if st.session_state['scenarios']:
+            with st.spinner("Reprojetando apenas as linhas afetadas..."):
+                df_cmp = sim.compare({n: [t] for n, t in st.session_state['scenarios']})
+            st.dataframe(df_cmp.style.format({
+                'Consumo Projetado (GB)': '{:.0f}', 'Fatura Projetada (R$)': 'R$ {:,.2f}',
+                'Δ Fatura (R$)': 'R$ {:+,.2f}', 'Δ Fatura (%)': '{:+.1f}%', 'Excedente (GB)': '{:.1f}'
+            }), use_container_width=True, hide_index=True)
+            st.bar_chart(df_cmp.set_index('Cenário')['Fatura Projetada (R$)'])
+            st.caption("Base sem ruído aleatório: as diferenças vêm só do cenário. "
+                       "Mudanças de plano não reprojetam; situação e dispositivo reprojetam só as linhas afetadas.")
+
+# --- PREVISÃO HIERÁRQUICA ---
+def show_hierarchy_detail(hier, conn, df_raw_context):
+    gap = hier.divergence()
+    if gap['divergencia'].iloc[0] > previsao_hierarquica.LIMITE_DIVERGENCIA:
+        total = gap.iloc[0]
+        st.warning(f"⚖️ Os níveis da hierarquia discordam: o perfil do total projeta {total['perfil_gb']:,.0f} GB "
+                   f"e a soma dos segmentos (modelo) {total['folhas_gb']:,.0f} GB. top_down segue o total, "
+                   f"bottom_up os segmentos e mint pondera os dois — compare os métodos antes de usar o número.")
+    with st.expander("🏛️ Previsão Hierárquica (reconciliada)"):
+        st.caption(f"Reconciliação: {hier.method} — {hier.n_predicoes} linhas avaliadas pelo modelo por dia "
+                   f"projetado (de {len(hier.seed[0])} usuários).")
+        if hier.exact:
+            st.caption(f"Todos os segmentos têm até {previsao_hierarquica.AMOSTRA_FOLHA} linhas e foram projetados "
+                       "por inteiro: o custo é o mesmo da previsão por usuário.")
+        st.dataframe(gap.rename(columns={'perfil_gb': 'Perfil (GB)', 'folhas_gb': 'Soma dos Segmentos (GB)',
+                                         'divergencia': 'Divergência'})
+                     .style.format({'Perfil (GB)': '{:,.0f}', 'Soma dos Segmentos (GB)': '{:,.0f}',
+                                    'Divergência': '{:.0%}'}), use_container_width=True)
+        by_dept = hier.by_level('departamento').resample('MS').sum()
+        by_dept.index = by_dept.index.strftime('%m/%Y')
+        st.dataframe(by_dept.style.format('{:.0f} GB'), use_container_width=True)
+
+        labels = [" / ".join(leaf) for leaf in hier.hierarchy.leaves]
+        escolha = st.selectbox("Detalhar usuários do segmento:", labels)
+        if st.button("Detalhar Usuários"):
+            modelo = load_model()
+            with st.spinner("Projetando as linhas do segmento..."):
+                detail = hier.user_detail(modelo, *hier.hierarchy.leaves[labels.index(escolha)],
+                                          calendar=load_calendar_store(conn))
+            names = df_raw_context.groupby('id_usuario')['usuario'].last()
+            totals = detail.sum(axis=0).rename(index=lambda u: names.get(u, u)).sort_values(ascending=False)
+            st.dataframe(totals.rename("Previsto (GB)").to_frame().style.format('{:.1f}'),
+                         use_container_width=True)
+
 # --- UI PRINCIPAL ---
 def show_dashboard_ui():
     st.title("🔗 Dashboard de Previsão Inteligente")
@@ -189,44 +566,160 @@ def show_dashboard_ui():
         st.error("Falha na conexão com o banco.")
         return
 
-    df_main = load_main_data(conn)
+    # --- EMPRESA (TENANT) ---
+    df_empresas = load_empresas(conn)
+    if df_empresas.empty:
+        st.warning("Nenhuma empresa cadastrada ou banco inacessível.")
+        return
+    nomes_empresa = dict(zip(df_empresas['id_empresa'], df_empresas['nome']))
+    id_empresa = st.selectbox("Empresa:", list(nomes_empresa), format_func=nomes_empresa.get)
+
+    # Resultados de uma empresa nunca aparecem na sessão de outra
+    if st.session_state.get('empresa_ativa') != id_empresa:
+        drop_forecast()
+        st.session_state.pop('watchlist', None)
+        st.session_state['empresa_ativa'] = id_empresa
+    get_forecast_stores().collect()
+
+    with st.sidebar.expander("🧠 Cache em memória"):
+        st.dataframe(cache_stats_frame(nomes_empresa).style.format(
+            {'MB': '{:.1f}', 'Orçamento (MB)': '{:.0f}', 'hit_rate': '{:.0%}'}
+        ), use_container_width=True)
+        fs = get_forecast_store(id_empresa).stats()
+        st.caption(f"Previsões em memória (empresa): {fs['handles']} ({fs['bytes'] / MB:.1f} de "
+                   f"{fs['orcamento'] / MB:.0f} MB), "
+                   f"{fs['referencias']} sessão(ões) referenciando, {fs['coletados']} liberadas.")
+
+    # Modo amostrado: filtros e totais sobre a amostra estratificada, com margem de erro
+    sampled = st.toggle("⚡ Modo amostrado (exploração rápida)", value=False,
+                        help="Estimativas a partir de uma amostra por departamento/cargo/mês. Desligue para o valor exato.")
+    # Dados da página, histórico, base do modelo e tarifas saem juntos; a página
+    # segue assim que os dados principais chegam e o resto termina em segundo plano
+    prefetch_tenant(conn, id_empresa, sampled)
+    df_main = load_sample_data(conn, id_empresa) if sampled else pd.DataFrame()
+    if sampled and df_main.empty:
+        st.info("Amostra indisponível para esta empresa — usando os dados completos.")
+        sampled = False
+    if not sampled:
+        df_main = load_main_data(conn, id_empresa)
     if df_main.empty:
         st.warning("Banco de dados vazio ou inacessível.")
         return
 
+    # --- WATCHLIST DE EXCESSO (FROTA INTEIRA) ---
+    with st.expander("🚨 Watchlist de Excesso de Plano (todas as linhas)"):
+        top_n = st.slider("Quantidade de linhas no ranking:", 10, 200, 50, step=10)
+        if st.button("Atualizar Watchlist"):
+            with st.spinner("Projetando o fechamento do mês para toda a frota..."):
+                modelo = load_model()
+                if not modelo:
+                    st.error("Modelo não encontrado.")
+                else:
+                    df_ml = load_ml_data(conn, id_empresa)
+                    st.session_state['watchlist'] = previsao_lote.fleet_over_quota(
+                        modelo, df_ml, top_n=top_n, calendar=load_calendar_store(conn),
+                        seed=history_seed(conn, id_empresa, lambda meta: None,
+                                          end=pd.to_datetime(df_ml['data_uso']).max().normalize()),
+                        tariffs=tenant_tariffs(conn, id_empresa, df_ml)
+                    )
+        if 'watchlist' in st.session_state:
+            df_watch = st.session_state['watchlist']
+            if df_watch.empty:
+                st.info("Nenhuma linha com projeção disponível.")
+            else:
+                n_excede = int(df_watch['Excede'].sum())
+                st.metric("Linhas com excesso projetado (no ranking)", n_excede)
+                st.dataframe(
+                    df_watch.drop(columns=['id_usuario']).style.format({
+                        'Plano (GB)': '{:.0f}', 'Realizado (GB)': '{:.1f}',
+                        'Projetado (GB)': '{:.1f}', '% do Plano': '{:.0f}%',
+                        'Fatura Projetada (R$)': 'R$ {:,.2f}'
+                    }),
+                    use_container_width=True, hide_index=True
+                )
+
     # --- FILTROS ---
     st.subheader("Filtros de Cenário")
+    # Hierárquica: prevê a empresa ou departamentos inteiros (filtros vazios = todos)
+    hierarquico = st.toggle("🏛️ Previsão hierárquica (custo fixo)", value=False,
+                            help="Prevê departamento × cargo com uma amostra fixa de linhas e reconcilia com "
+                                 "os níveis agregados; vale para a empresa inteira ou para os departamentos "
+                                 "escolhidos. O detalhe por usuário sai sob demanda.")
     c1, c2 = st.columns(2)
     all_depts = sorted(df_main['Departamento'].unique())
     selected_depts = c1.multiselect("1. Departamento(s):", all_depts, default=[])
     
-    if selected_depts:
-        avail_cargos = sorted(df_main[df_main['Departamento'].isin(selected_depts)]['Cargo'].unique())
+    if selected_depts or hierarquico:
+        avail_cargos = sorted(df_main[df_main['Departamento'].isin(selected_depts or all_depts)]['Cargo'].unique())
     else:
         avail_cargos = []
     selected_cargos = c2.multiselect("2. Cargo (Alvo da IA):", avail_cargos, default=[])
 
-    if not selected_depts or not selected_cargos:
-        st.info("👆 Selecione Departamento e Cargo para habilitar a IA.")
-        if 'forecast_done' in st.session_state: del st.session_state['forecast_done']
+    if hierarquico:
+        escopo = ", ".join(selected_depts) if selected_depts else "Empresa inteira"
+        selected_depts = selected_depts or all_depts
+        selected_cargos = selected_cargos or avail_cargos
+    elif not selected_depts or not selected_cargos:
+        st.info("👆 Selecione Departamento e Cargo para habilitar a IA "
+                "(ou ligue a previsão hierárquica para a empresa inteira).")
+        drop_forecast()
         return
 
-    df_filtered = df_main[
-        (df_main['Departamento'].isin(selected_depts)) &
-        (df_main['Cargo'].isin(selected_cargos))
-    ]
-    st.metric("Histórico Total do Filtro", f"{df_filtered['Consumo (GB)'].sum():.2f} GB")
+    filter_mask = (df_main['Departamento'].isin(selected_depts)) & (df_main['Cargo'].isin(selected_cargos))
+    if sampled:
+        total, margin = amostragem.estimate_total(df_main, 'Consumo (GB)', filter_mask)
+        st.metric("Histórico Total do Filtro (estimado)", f"{total:.2f} GB")
+        st.caption(f"Amostra estratificada: ± {margin:.2f} GB (IC 95%). Desligue o modo amostrado para o valor exato.")
+        monthly = amostragem.estimate_by(df_main, 'Consumo (GB)', 'Mês', filter_mask)
+    else:
+        df_filtered = df_main[filter_mask]
+        st.metric("Histórico Total do Filtro", f"{df_filtered['Consumo (GB)'].sum():.2f} GB")
+        monthly = df_filtered.groupby('Mês')['Consumo (GB)'].sum().to_frame('total')
+
+    with st.expander("📊 Distribuição Mensal do Filtro"):
+        fig = go.Figure(go.Bar(
+            x=monthly.index, y=monthly['total'], marker_color='#1F77B4',
+            error_y=dict(type='data', array=monthly['margem']) if sampled else None,
+            hovertemplate="<b>%{x}</b><br>%{y:.0f} GB<extra></extra>"
+        ))
+        fig.update_layout(xaxis_title="Mês", yaxis_title="GB", height=320, margin=dict(t=20))
+        st.plotly_chart(fig, use_container_width=True)
+
+    regions = region_context(load_region_rollup(conn, id_empresa), selected_cargos[0], selected_depts) \
+        if len(selected_cargos) == 1 else pd.DataFrame()
+    if not regions.empty:
+        with st.expander("🗺️ Consumo por Região"):
+            nivel = st.select_slider("Nível do mapa:", list(geoindice.NIVEIS), value=list(geoindice.NIVEIS)[1])
+            cells = geoindice.by_level(regions, geoindice.NIVEIS[nivel])
+            mapped = cells.dropna(subset=['lat'])
+            if not mapped.empty:
+                fig = go.Figure(go.Scattergeo(
+                    lat=mapped['lat'], lon=mapped['lon'], text=mapped['rotulo'],
+                    marker=dict(size=6 + 30 * np.sqrt(mapped['consumo_gb'] / mapped['consumo_gb'].max()),
+                                color='#E60000', opacity=0.6),
+                    customdata=mapped['consumo_gb'],
+                    hovertemplate="<b>%{text}</b><br>%{customdata:.1f} GB<extra></extra>"
+                ))
+                fig.update_geos(fitbounds="locations", showcountries=True, showsubunits=True)
+                fig.update_layout(height=420, margin=dict(t=10, b=10, l=10, r=10))
+                st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(cells[['rotulo', 'consumo_gb', 'n_registros']].head(20).rename(columns={
+                'rotulo': 'Região', 'consumo_gb': 'Consumo (GB)', 'n_registros': 'Registros'
+            }).style.format({'Consumo (GB)': '{:.1f}'}), use_container_width=True, hide_index=True)
+            st.caption("Somado do índice geográfico (consumo por célula e dia), não do log bruto.")
     st.divider()
 
     # --- GERAÇÃO DE PREVISÃO ---
     st.subheader("🔮 Gerar Previsão")
     
-    if len(selected_cargos) > 1:
-        st.warning("⚠️ Selecione apenas **1 Cargo**.")
+    if len(selected_cargos) > 1 and not hierarquico:
+        st.warning("⚠️ Selecione apenas **1 Cargo** (ou ligue a previsão hierárquica).")
     else:
-        cargo_target = selected_cargos[0]
+        cargo_target = selected_cargos[0] if len(selected_cargos) == 1 else None
+        target_label = cargo_target if cargo_target is not None else escopo
         col_in1, col_in2 = st.columns(2)
         horizon = col_in1.slider("Projetar meses:", 1, 12, 6)
+        metodo_rec = col_in2.selectbox("Reconciliação:", previsao_hierarquica.METODOS) if hierarquico else "mint"
         
         if st.button("Gerar Previsão", type="primary"):
             with st.spinner("Processando algoritmos LightGBM..."):
@@ -235,9 +728,9 @@ def show_dashboard_ui():
                     st.error("Modelo não encontrado.")
                     return
 
-                df_raw = load_ml_data(conn)
+                df_raw = load_ml_data(conn, id_empresa)
                 df_context = df_raw[
-                    (df_raw['cargo'] == cargo_target) &
+                    (df_raw['cargo'].isin(selected_cargos)) &
                     (df_raw['departamento'].isin(selected_depts))
                 ]
                 
@@ -245,46 +738,30 @@ def show_dashboard_ui():
                     st.error("Sem dados.")
                     return
 
+                if not len(load_calendar_store(conn)):
+                    st.warning(f"📆 {AVISO_CALENDARIO_VAZIO}")
+
                 df_fe = prepare_features(df_context)
-                unique_users = df_fe['id_usuario'].unique()
                 last_date = df_fe['data'].max()
                 future_dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=horizon*30)
                 
-                cols_model = ["year", "month", "day", "dayofweek", "weekofyear", "is_weekend",
-                              "lag_1", "lag_7", "lag_30", "rolling_7", "rolling_30",
-                              "cargo", "departamento", "evento", "dispositivo", "situacao"]
-                cat_cols = ["cargo", "departamento", "evento", "dispositivo", "situacao"]
-                
-                all_forecasts = []
-                for uid in unique_users:
-                    user_hist = df_fe[df_fe['id_usuario'] == uid].sort_values('data')
-                    if len(user_hist) < 15: continue
-                    hist_vals = user_hist['consumo_dados_gb'].tail(60).tolist()
-                    user_std = np.std(hist_vals) if len(hist_vals) > 1 else 1.0
-                    meta = user_hist.iloc[-1]
-                    preds = []
-                    for date_fc in future_dates:
-                        feat = {
-                            'year': date_fc.year, 'month': date_fc.month, 'day': date_fc.day,
-                            'dayofweek': date_fc.dayofweek, 'weekofyear': date_fc.isocalendar().week,
-                            'is_weekend': 1 if date_fc.dayofweek >= 5 else 0,
-                            'lag_1': hist_vals[-1],
-                            'lag_7': hist_vals[-7] if len(hist_vals)>=7 else hist_vals[-1],
-                            'lag_30': hist_vals[-30] if len(hist_vals)>=30 else hist_vals[-1],
-                            'rolling_7': np.mean(hist_vals[-7:]), 'rolling_30': np.mean(hist_vals[-30:]),
-                        }
-                        for c in cat_cols: feat[c] = meta[c]
-                        X = pd.DataFrame([feat])
-                        for c in cat_cols: X[c] = X[c].astype('category')
-                        base_pred = modelo.predict(X[cols_model])[0]
-                        noise = np.random.normal(0, user_std * 0.6) 
-                        val = max(0, (base_pred + noise) * 1.001)
-                        hist_vals.append(val)
-                        preds.append(val)
-                    all_forecasts.append(pd.Series(preds, index=future_dates))
+                seed = history_seed(conn, id_empresa, lambda meta: (meta['cargo'].isin(selected_cargos)) &
+                                    (meta['departamento'].isin(selected_depts)), end=last_date)
+                steps, fc_users, hier = [], None, None
+                if hierarquico:
+                    # Custo fixo: amostra por departamento × cargo + perfis agregados, reconciliados
+                    hier = previsao_hierarquica.forecast_hierarchy(
+                        modelo, df_fe, future_dates, method=metodo_rec, calendar=load_calendar_store(conn), seed=seed
+                    )
+                    fc_daily = hier.total if hier is not None else pd.Series(dtype=float)
+                else:
+                    # Todos os usuários do cargo avançam juntos: um predict por dia projetado
+                    fc_users = previsao_lote.forecast_users_batched(
+                        modelo, df_fe, future_dates, calendar=load_calendar_store(conn), seed=seed, features=steps
+                    )
+                    fc_daily = fc_users.sum(axis=1) if not fc_users.empty else pd.Series(dtype=float)
                 
-                if all_forecasts:
-                    fc_daily = pd.concat(all_forecasts, axis=1).sum(axis=1)
+                if not fc_daily.empty:
                     fc_monthly = fc_daily.resample('MS').sum().reset_index()
                     fc_monthly.columns = ['Data', 'Consumo']
                     fc_monthly['Tipo'] = 'Previsão'
@@ -294,27 +771,69 @@ def show_dashboard_ui():
                     hist_monthly.columns = ['Data', 'Consumo'] 
                     hist_monthly['Tipo'] = 'Histórico'
 
+                    # Resultados pesados vão para o armazém compartilhado; a sessão fica
+                    # só com o handle e os agregados mensais
+                    result = {'fc_daily': fc_daily, 'hist_daily': hist_daily, 'raw_context': df_context,
+                              'hierarchy': hier, 'attribution': None, 'invoices': None, 'simulator': None}
+                    if fc_users is not None:
+                        # Atribuição SHAP: uma chamada sobre todos os dias projetados, guardada com a previsão
+                        result['attribution'] = atribuicao.explain_forecast(
+                            load_explainer(), steps, fc_users.columns.to_numpy()
+                        )
+                        # Fatura: franquia, excedente e roaming sobre a mesma matriz da previsão
+                        months = custos.monthly_usage(fc_users)[0]
+                        result['invoices'] = custos.project_invoices(
+                            fc_users, custos.user_profile(df_context), tenant_tariffs(conn, id_empresa, df_raw),
+                            realized=custos.realized_usage(df_context, months, fc_users.columns)
+                        )
+                        # Simulador: mesmo estado inicial; a base sem ruído só é projetada no primeiro cenário
+                        result['simulator'] = cenarios.ScenarioSimulator.build(
+                            modelo, df_fe, df_context, future_dates, tenant_tariffs(conn, id_empresa, df_raw),
+                            calendar=load_calendar_store(conn), seed=seed
+                        )
+                    drop_forecast()
+                    st.session_state['forecast'] = get_forecast_store(id_empresa).put(result, _session_id())
                     st.session_state['fc_data'] = fc_monthly
                     st.session_state['hist_data'] = hist_monthly
-                    st.session_state['raw_context'] = df_context
                     st.session_state['target_cargo'] = cargo_target
+                    st.session_state['target_label'] = target_label
+                    st.session_state['scenarios'] = []
                     st.session_state['forecast_done'] = True
                     st.success("Previsão Gerada!")
+                    m = modelo.last_metrics if isinstance(modelo, InferenceClient) else {}
+                    if m.get('local'):
+                        st.caption("Servidor de inferência indisponível — previsão feita com o modelo local.")
+                    elif m:
+                        st.caption(f"Servidor de inferência — último lote: {m['batch_rows']} linhas "
+                                   f"({m['batch_requests']} pedidos), fila {m['queue_ms']:.1f} ms, "
+                                   f"predict {m['predict_ms']:.1f} ms, ida e volta {m['roundtrip_ms']:.1f} ms")
                 else:
                     st.error("Dados insuficientes.")
 
         # --- VISUALIZAÇÃO ---
+        forecast = None
         if st.session_state.get('forecast_done'):
-            
+            forecast = get_forecast_store(id_empresa).get(st.session_state['forecast'], _session_id())
+            if forecast is None:
+                drop_forecast()
+                st.info("A previsão desta sessão expirou. Gere novamente.")
+
+        if forecast is not None:
             fc_monthly = st.session_state['fc_data']
             hist_monthly = st.session_state['hist_data']
-            df_raw_context = st.session_state['raw_context']
-            cargo_label = st.session_state['target_cargo']
+            df_raw_context = forecast['raw_context']
+            cargo_target = st.session_state['target_cargo']
+            cargo_label = st.session_state['target_label']
 
             # Diagnóstico
             st.markdown("### 🕵️ Diagnóstico e Composição")
             forecast_avg_val = fc_monthly['Consumo'].mean()
-            status, color, msg, causes = analyze_root_cause(hist_monthly, forecast_avg_val, df_raw_context)
+            attribution = forecast['attribution']
+            regions_ctx = region_context(load_region_rollup(conn, id_empresa), cargo_target,
+                                         df_raw_context['departamento'].unique()) \
+                if cargo_target is not None else pd.DataFrame()
+            status, color, msg, causes = analyze_root_cause(hist_monthly, forecast_avg_val, df_raw_context,
+                                                            attribution, regions_ctx)
             
             if status == "NORMAL": st.success(msg, icon="✅")
             elif status == "WARNING": st.warning(msg, icon="⚠️")
@@ -323,7 +842,27 @@ def show_dashboard_ui():
             if causes:
                 with st.expander("🔍 Ver Detalhes da Composição (Dispositivos, Usuários, etc.)", expanded=True):
                     for cause in causes: st.markdown(f"- {cause}")
-                    st.caption("Análise baseada nos padrões históricos associados a este cargo.")
+                    if attribution is not None:
+                        st.caption("Contribuições do modelo (TreeSHAP) somadas sobre os dias projetados.")
+                        by_group = attribution.by_group.rename(lambda g: GROUP_LABELS[g][1])
+                        st.bar_chart(by_group.rename("GB"))
+                    else:
+                        st.caption("Análise baseada nos padrões históricos associados a este cargo.")
+
+            invoices = forecast['invoices']
+            if invoices is not None and not invoices.empty:
+                with st.expander("💰 Fatura Projetada por Departamento"):
+                    by_dept = custos.invoice_totals(invoices, by='departamento')
+                    by_dept.index = by_dept.index.strftime('%m/%Y')
+                    by_dept['Total'] = by_dept.sum(axis=1)
+                    st.dataframe(by_dept.style.format('R$ {:,.2f}'), use_container_width=True)
+                    st.caption("Franquia do cargo + excedente em faixas + roaming (fração histórica de cada linha).")
+
+            if forecast['simulator'] is not None:
+                show_scenario_simulator(forecast['simulator'], cargo_label)
+
+            if forecast['hierarchy'] is not None:
+                show_hierarchy_detail(forecast['hierarchy'], conn, df_raw_context)
 
             st.divider()
 
@@ -336,10 +875,12 @@ def show_dashboard_ui():
             with c_vis1:
                 tipo_grafico = st.radio(
                     "Visualização:",
-                    ["Tendência Conectada", "Volumetria vs Média", "Variação % (MoM)"]
+                    ["Tendência Conectada", "Volumetria vs Média", "Variação % (MoM)", "Detalhamento Diário"]
                 )
                 st.markdown("---")
                 st.metric("Total Previsto", f"{fc_monthly['Consumo'].sum():.0f} GB")
+                if invoices is not None and not invoices.empty:
+                    st.metric("Fatura Projetada", f"R$ {invoices['custo_total'].sum():,.2f}")
 
             with c_vis2:
                 
@@ -457,4 +998,42 @@ def show_dashboard_ui():
                         elif max_increase < 1 and max_decrease > -1:
                             texto_analise += "- O consumo apresenta estabilidade quase total."
                             
-                        st.info(texto_analise)
\ No newline at end of file
+                        st.info(texto_analise)
+
+                # --- GRÁFICO 4: DETALHAMENTO DIÁRIO (reduzido no servidor) ---
+                elif tipo_grafico == "Detalhamento Diário":
+                    fc_daily = forecast['fc_daily']
+                    users = sorted(df_raw_context['usuario'].unique())
+                    user_sel = st.selectbox("Usuário:", ["Todos"] + users)
+
+                    if user_sel == "Todos":
+                        hist_series = forecast['hist_daily']
+                        series_list = [hist_series, fc_daily]
+                    else:
+                        df_user = df_raw_context[df_raw_context['usuario'] == user_sel]
+                        hist_series = df_user.groupby(pd.to_datetime(df_user['data_uso']).dt.floor('D'))['consumo'].sum().astype(float)
+                        series_list = [hist_series]
+
+                    d_min = min(s.index.min() for s in series_list).date()
+                    d_max = max(s.index.max() for s in series_list).date()
+                    window = st.slider("Janela de zoom:", min_value=d_min, max_value=d_max, value=(d_min, d_max))
+
+                    def build_daily(reduced, label, unidade):
+                        fig = go.Figure()
+                        fig.add_trace(go.Scattergl(
+                            x=reduced[0].index, y=reduced[0].values,
+                            mode='lines', name='Histórico', line=dict(color='#1F77B4', width=2),
+                            hovertemplate=f"<b>📅 %{{x|%d/%m/%Y}}</b><br>📉 <b>Consumo:</b> %{{y:.1f}} {unidade}<extra></extra>"
+                        ))
+                        if len(reduced) > 1:
+                            fig.add_trace(go.Scattergl(
+                                x=reduced[1].index, y=reduced[1].values,
+                                mode='lines', name='Projeção IA', line=dict(color='#E60000', width=2, dash='dot'),
+                                hovertemplate=f"<b>📅 %{{x|%d/%m/%Y}}</b><br>🚀 <b>Estimativa:</b> %{{y:.1f}} {unidade}<extra></extra>"
+                            ))
+                        fig.update_layout(title=f"Detalhamento ({label}): {user_sel}", xaxis_title="Data", yaxis_title=unidade)
+                        return fig
+
+                    fig = graficos_dados.fit_figure(build_daily, series_list, window=window)
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.caption(f"Payload do gráfico: {graficos_dados.figure_payload_bytes(fig) / 1024:.0f} KB")
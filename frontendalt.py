@@ -1,7 +1,6 @@
 import streamlit as st
 import os
-import pandas as pd
-import psycopg2
+import time
 from streamlit_option_menu import option_menu
 
 # --- 1. CONFIGURAÇÃO DA PÁGINA ---
@@ -14,78 +13,113 @@ st.set_page_config(
 
 # --- 2. FUNÇÕES DE BANCO DE DADOS (CORRIGIDO) ---
 # REMOVI O @st.cache_resource PARA EVITAR O ERRO "CONNECTION CLOSED"
+def db_params():
+    return dict(
+        host=st.secrets["DB_HOST"],
+        database=st.secrets["DB_NAME"],
+        user=st.secrets["DB_USER"],
+        password=st.secrets["DB_PASS"],
+        port=st.secrets.get("DB_PORT", "5432"),
+        sslmode="require"
+    )
+
 def init_connection():
     """
     Estabelece a conexão com o banco PostgreSQL.
     Retorna None se falhar.
     """
+    import psycopg2  # adiado: só carrega quando o banco é realmente usado
     try:
-        return psycopg2.connect(
-            host=st.secrets["DB_HOST"],
-            database=st.secrets["DB_NAME"],
-            user=st.secrets["DB_USER"],
-            password=st.secrets["DB_PASS"],
-            port=st.secrets.get("DB_PORT", "5432"),
-            sslmode="require"
-        )
+        return psycopg2.connect(**db_params())
     except Exception:
         return None
 
-def get_kpis_from_db():
-    """
-    Busca métricas reais. 
-    Se falhar, retorna 0 (Zero). Não inventa dados.
-    """
+@st.cache_data(ttl=60, show_spinner=False)
+def check_db_status():
+    """Testa a conexão (cacheado para não abrir conexão a cada rerun)."""
     conn = init_connection()
-
-    # Inicializa zerado
-    dados = {
-        "usuarios": 0,
-        "consumo_hoje": 0.0,
-        "alertas": 0,
-        "status": "Offline" 
-    }
-
     if conn:
-        try:
-            cur = conn.cursor()
-
-            # 1. Total de Usuários
-            cur.execute("SELECT COUNT(*) FROM usuario;")
-            result_users = cur.fetchone()
-            if result_users:
-                dados["usuarios"] = result_users[0]
-
-            # 2. Consumo
-            cur.execute("""
-                SELECT SUM(consumo_dados_gb)
-                FROM log_uso_sim
-                WHERE data_referencia = (SELECT MAX(data_referencia) FROM log_uso_sim);
-            """)
-            result_consumo = cur.fetchone()
-            if result_consumo and result_consumo[0]:
-                dados["consumo_hoje"] = result_consumo[0]
-
-            # 3. Alertas
-            cur.execute("""
-                SELECT COUNT(*)
-                FROM log_uso_sim l
-                JOIN altera_excesso a ON l.id_alerta = a.id_alerta
-                WHERE a.nome_alerta = 'True';
-            """)
-            result_alertas = cur.fetchone()
-            if result_alertas:
-                dados["alertas"] = result_alertas[0]
-
-            dados["status"] = "Online"
-            cur.close()
-            conn.close()
-        except Exception as e:
-            st.error(f"Erro na query SQL: {e}")
-            if conn:
-                conn.close()
-
-    return dados
+        conn.close()
+        return True
+    return False
+
+# Indicadores da página inicial: consultas independentes, disparadas juntas
+KPI_QUERIES = {
+    # 1. Total de Usuários
+    "usuarios": "SELECT COUNT(*) FROM usuario;",
+    # 2. Consumo do último dia registrado
+    "consumo_hoje": """
+        SELECT SUM(consumo_dados_gb)
+        FROM log_uso_sim
+        WHERE data_referencia = (SELECT MAX(data_referencia) FROM log_uso_sim);
+    """,
+    # 3. Alertas: linhas acima do plano no mês (estado_consumo_mes, mantido pelo
+    # motor_alertas). Enquanto a tabela estiver vazia — banco anterior ao motor,
+    # antes de `ingestao_logs.py --backfill` e `motor_alertas.py --rebuild` —
+    # conta os registros marcados em altera_excesso, como antes
+    "alertas": """
+        SELECT CASE WHEN EXISTS (SELECT 1 FROM estado_consumo_mes) THEN (
+            SELECT COUNT(*)
+            FROM estado_consumo_mes
+            WHERE nivel_alerta >= 100
+              AND mes = (SELECT MAX(mes) FROM estado_consumo_mes)
+        ) ELSE (
+            SELECT COUNT(*)
+            FROM log_uso_sim l
+            JOIN altera_excesso a ON l.id_alerta = a.id_alerta
+            WHERE a.nome_alerta = 'True'
+        ) END;
+    """,
+}
+KPI_PRAZO = 5      # segundos por indicador
+KPI_TTL = 60       # segundos em cache
+
+@st.cache_resource(show_spinner=False)
+def get_kpi_fetcher():
+    """Pool com uma conexão por indicador. Com o banco fora, a exceção sobe e nada fica em cache."""
+    import acesso_dados  # adiado junto com o psycopg2
+    pool = acesso_dados.ConnectionPool(db_params(), maxconn=len(KPI_QUERIES))
+    return acesso_dados.ParallelFetcher(pool, max_workers=len(KPI_QUERIES))
+
+@st.cache_resource(show_spinner=False)
+def get_kpi_cache():
+    return {}   # nome -> (valor, expira_em)
+
+def _run_kpi(sql, conn):
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        row = cur.fetchone()
+    return row[0] if row and row[0] is not None else 0
+
+def iter_kpis():
+    """
+    (nome, valor) de cada indicador assim que sua consulta termina — a página
+    não espera a mais lenta para mostrar as outras. valor None = indisponível
+    (banco fora, erro ou prazo estourado). Não inventa dados.
+    """
+    cache = get_kpi_cache()
+    agora = time.monotonic()
+    faltam = []
+    for nome in KPI_QUERIES:
+        valor, expira = cache.get(nome, (None, 0))
+        if expira > agora:
+            yield nome, valor
+        else:
+            faltam.append(nome)
+    if not faltam:
+        return
+    try:
+        fetcher = get_kpi_fetcher()
+    except Exception:
+        for nome in faltam:
+            yield nome, None
+        return
+    jobs = {nome: fetcher.submit(("kpi", nome), lambda conn, sql=KPI_QUERIES[nome]: _run_kpi(sql, conn), KPI_PRAZO)
+            for nome in faltam}
+    for nome, valor, erro in fetcher.as_completed(jobs):
+        if erro is None:
+            cache[nome] = (valor, time.monotonic() + KPI_TTL)
+        yield nome, (None if erro else valor)
 
 # --- 3. ESTILO CSS ---
 def local_css():
@@ -179,13 +213,8 @@ with st.sidebar:
     st.markdown("---")
     st.caption("Versão 1.2.1 | Fulltime")
     
-    # Verificação de status na Sidebar
-    db_conn = init_connection()
-    if db_conn:
-        st.success("Conectado ao BD")
-        db_conn.close()
-    else:
-        st.error("BD desconectado")
+    # Status do BD: preenchido ao final do script, depois da primeira renderização
+    db_status_slot = st.empty()
 
 # --- 5. CONTEÚDO ---
 
@@ -195,15 +224,9 @@ if selected == "Página Inicial":
     
     st.markdown("### ⚡ Visão Rápida")
     
-    kpis = get_kpis_from_db()
-
-    k1, k2, k3 = st.columns(3)
-    k1.metric("Sim Cards Ativos", f"{kpis['usuarios']}", kpis['status'])
-    k2.metric("Consumo Hoje", f"{kpis['consumo_hoje']:.1f} GB", "Dados")
-    k3.metric("Alertas de Excesso", f"{kpis['alertas']}", "Crítico", delta_color="inverse")
-    
-    if kpis['status'] == "Offline":
-        st.warning("⚠️ O sistema não detectou conexão com o banco de dados 'ANALISE'. Os valores acima estão zerados.")
+    # KPIs consultam o banco: reserva o espaço e preenche após desenhar os cards
+    kpi_slot = st.empty()
+    kpi_slot.caption("Carregando indicadores...")
 
     st.divider()
 
@@ -233,6 +256,29 @@ if selected == "Página Inicial":
         </div>
         """, unsafe_allow_html=True)
 
+    # Cada card é preenchido quando a sua consulta termina
+    with kpi_slot.container():
+        k1, k2, k3 = st.columns(3)
+        slots = {"usuarios": k1.empty(), "consumo_hoje": k2.empty(), "alertas": k3.empty()}
+        for slot in slots.values():
+            slot.caption("Carregando...")
+        aviso = st.empty()
+
+    online = False
+    for nome, valor in iter_kpis():
+        status = "Offline" if valor is None else "Online"
+        online = online or valor is not None
+        valor = valor or 0
+        if nome == "usuarios":
+            slots[nome].metric("Sim Cards Ativos", f"{valor}", status)
+        elif nome == "consumo_hoje":
+            slots[nome].metric("Consumo Hoje", f"{float(valor):.1f} GB", "Dados")
+        else:
+            slots[nome].metric("Alertas de Excesso", f"{valor}", "Crítico", delta_color="inverse")
+
+    if not online:
+        aviso.warning("⚠️ O sistema não detectou conexão com o banco de dados 'ANALISE'. Os valores acima estão zerados.")
+
 
 elif selected == "Dashboard":
     st.title("Painel de Controle 📈")
@@ -243,13 +289,14 @@ elif selected == "Dashboard":
         import dashboard
         dashboard.show_dashboard_ui()
     except ImportError:
+        import pandas as pd
         conn = init_connection()
         if conn:
             st.markdown("#### Consumo Real por Departamento")
             try:
                 query = """
                 SELECT d.nome, SUM(l.consumo_dados_gb) as total
-                FROM log_uso_sim l
+                FROM uso_consolidado l
                 JOIN usuario u ON l.id_usuario = u.id_usuario
                 JOIN departamentos d ON u.id_departamento = d.id_departamento
                 GROUP BY d.nome
@@ -341,4 +388,14 @@ elif selected == "Sobre Nós":
                     Instagram 📸
                 </a>
             </div>
-            """, unsafe_allow_html=True)
\ No newline at end of file
+            """, unsafe_allow_html=True)
+
+# --- 6. PÓS-RENDERIZAÇÃO ---
+if check_db_status():
+    db_status_slot.success("Conectado ao BD")
+else:
+    db_status_slot.error("BD desconectado")
+
+if selected != "Dashboard":
+    import aquecimento
+    aquecimento.start_warmup()
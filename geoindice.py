@@ -0,0 +1,322 @@
+# geoindice.py
+# Índice geográfico do consumo: o texto livre de log_uso_sim.localizacao vira
+# uma célula na ingestão — geohash de PRECISAO caracteres quando há
+# coordenadas ("-23.55, -46.63"), código da UF ("uf:SP") quando o texto
+# termina numa sigla de estado, ou o nome normalizado ("loc:campinas").
+# O consumo é acumulado por célula × empresa × departamento × cargo × dia em
+# consumo_celula_dia; mapas e o detector de causas regionais leem esse
+# agregado (níveis mais grossos do geohash = prefixo), nunca o log.
+#
+# Uso:  python geoindice.py --rebuild   (refaz o índice a partir de log_uso_sim)
+import argparse
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+PRECISAO = 5            # caracteres do geohash gravado (~4,9 km × 4,9 km)
+NIVEIS = {"Estado / região (~156 km)": 3, "Cidade (~39 km)": 4, "Bairro (~5 km)": 5}
+MAX_TEXTOS = 200_000    # textos distintos lembrados na ingestão (o resto é recalculado)
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Capitais (lat, lon): posição das células 'uf:XX' no mapa
+UF_CENTROS = {
+    "AC": (-9.97, -67.81), "AL": (-9.67, -35.74), "AP": (0.03, -51.07), "AM": (-3.12, -60.02),
+    "BA": (-12.97, -38.50), "CE": (-3.73, -38.52), "DF": (-15.79, -47.88), "ES": (-20.32, -40.34),
+    "GO": (-16.69, -49.26), "MA": (-2.53, -44.30), "MT": (-15.60, -56.10), "MS": (-20.47, -54.62),
+    "MG": (-19.92, -43.94), "PA": (-1.46, -48.50), "PB": (-7.12, -34.86), "PR": (-25.43, -49.27),
+    "PE": (-8.05, -34.88), "PI": (-5.09, -42.80), "RJ": (-22.91, -43.17), "RN": (-5.79, -35.21),
+    "RS": (-30.03, -51.23), "RO": (-8.76, -63.90), "RR": (2.82, -60.67), "SC": (-27.59, -48.55),
+    "SP": (-23.55, -46.63), "SE": (-10.91, -37.07), "TO": (-10.18, -48.33),
+}
+
+_COORD = re.compile(r"^\s*\(?\s*(-?\d{1,2}(?:\.\d+)?)\s*[,; ]\s*(-?\d{1,3}(?:\.\d+)?)\s*\)?\s*$")
+_UF = re.compile(r"(?:^|[\s,/\-])([A-Za-z]{2})\s*$")
+
+
+# --- GEOHASH ---
+def geohash_encode(lat, lon, precision=PRECISAO):
+    """Geohash de arrays de lat/lon (vetorizado: bits intercalados em inteiros)."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    nbits = 5 * precision
+    lon_bits, lat_bits = (nbits + 1) // 2, nbits // 2
+    lon_q = np.clip(((lon + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    lat_q = np.clip(((lat + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    code = np.zeros(lat.shape, dtype=np.int64)
+    for i in range(nbits):
+        src, width = (lon_q, lon_bits) if i % 2 == 0 else (lat_q, lat_bits)
+        code = (code << 1) | ((src >> (width - 1 - i // 2)) & 1)
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    chars = np.array(list(BASE32))[(code[:, None] >> shifts) & 31]
+    return np.ascontiguousarray(chars).view(f"<U{precision}").ravel()
+
+
+def geohash_center(cell):
+    """Centro (lat, lon) de um geohash de qualquer tamanho."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for ch in cell:
+        v = BASE32.index(ch)
+        for b in (16, 8, 4, 2, 1):
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if v & b else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if v & b else (lat_lo, mid)
+            even = not even
+    return (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+
+
+def is_geohash(cell):
+    return ":" not in cell
+
+
+def parent(cell, nivel):
+    """Célula no nível pedido: prefixo do geohash; códigos de região não mudam."""
+    return cell[:nivel] if is_geohash(cell) else cell
+
+
+# --- TEXTO -> CÉLULA ---
+def _slug(texto):
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z0-9]+", "-", texto).strip("-")[:56] or "desconhecido"
+
+
+def cells_for(textos, precision=PRECISAO):
+    """
+    Célula e rótulo de cada texto de localizacao (Series alinhadas à entrada;
+    None para texto vazio). Cada texto distinto é interpretado uma vez.
+    """
+    textos = pd.Series(textos, dtype=object)
+    distintos = pd.Series(textos.dropna().astype(str).str.strip().unique())
+    distintos = distintos[distintos != ""]
+    cell = pd.Series(index=distintos, dtype=object)
+    label = pd.Series(index=distintos, dtype=object)
+
+    coords = distintos.str.extract(_COORD).astype(float)
+    ok = coords[0].between(-90, 90) & coords[1].between(-180, 180)
+    if ok.any():
+        gh = geohash_encode(coords.loc[ok, 0].to_numpy(), coords.loc[ok, 1].to_numpy(), precision)
+        cell[distintos[ok].to_numpy()] = gh
+        label[distintos[ok].to_numpy()] = gh
+
+    rest = distintos[~ok]
+    uf = rest.str.extract(_UF)[0].str.upper()
+    is_uf = uf.isin(UF_CENTROS.keys())
+    cell[rest[is_uf].to_numpy()] = ("uf:" + uf[is_uf]).to_numpy()
+    label[rest[is_uf].to_numpy()] = uf[is_uf].to_numpy()
+    outros = rest[~is_uf]
+    cell[outros.to_numpy()] = ["loc:" + _slug(t) for t in outros]
+    label[outros.to_numpy()] = outros.to_numpy()
+
+    chave = textos.where(textos.isna(), textos.astype(str).str.strip())
+    cells, labels = chave.map(cell).astype(object), chave.map(label).astype(object)
+    return cells.where(cells.notna(), None), labels.where(cells.notna(), None)
+
+
+def cell_position(cell):
+    """(lat, lon) para o mapa: centro do geohash ou capital da UF; None para 'loc:'."""
+    if is_geohash(cell):
+        return geohash_center(cell)
+    if cell.startswith("uf:"):
+        return UF_CENTROS.get(cell[3:])
+    return None
+
+
+# --- MANUTENÇÃO NA INGESTÃO ---
+class CellRollup:
+    """
+    Acumula o consumo do lote por célula × estrato × dia e grava com upsert
+    aditivo. Textos já vistos não são reinterpretados. Textos novos, células e
+    somas do lote só passam a valer no commit(); rollback() os descarta.
+    """
+
+    def __init__(self, user_stratum, precision=PRECISAO):
+        self.user_stratum = user_stratum   # id_usuario -> (id_empresa, id_departamento, id_cargo)
+        self.precision = precision
+        self.known = {}                    # texto -> célula (já gravada)
+        self.pending = {}                  # texto -> célula, interpretados no lote
+        self.labels = {}                   # células novas -> rótulo
+        self.acc = defaultdict(lambda: [0.0, 0])
+
+    def observe_batch(self, batch):
+        """batch: tuplas do parse_record (localizacao na última posição)."""
+        novos = list({r[7] for r in batch if r[7] and r[7] not in self.known and r[7] not in self.pending})
+        if novos:
+            cells, labels = cells_for(novos, self.precision)
+            for texto, c, lbl in zip(novos, cells, labels):
+                if c is not None:
+                    self.pending[texto] = c
+                    self.labels.setdefault(c, lbl)
+        for uid, _, _, _, data_uso, consumo, _, loc in batch:
+            cell = (self.known.get(loc) or self.pending.get(loc)) if loc else None
+            if cell is None:
+                continue
+            agg = self.acc[(cell, *self.user_stratum[uid], data_uso.date())]
+            agg[0] += consumo
+            agg[1] += 1
+
+    def persist(self, cur):
+        """Grava células novas e somas do lote (sem commit — usa a transação do chamador)."""
+        if self.labels:
+            execute_values(cur, """
+                INSERT INTO celula_geo (celula, lat, lon, rotulo) VALUES %s
+                ON CONFLICT (celula) DO NOTHING;
+            """, [(c, *(cell_position(c) or (None, None)), str(lbl)[:255]) for c, lbl in self.labels.items()])
+        if self.acc:
+            execute_values(cur, """
+                INSERT INTO consumo_celula_dia
+                    (celula, id_empresa, id_departamento, id_cargo, data, consumo_gb, n_registros)
+                VALUES %s
+                ON CONFLICT (id_empresa, data, celula, id_departamento, id_cargo) DO UPDATE SET
+                    consumo_gb = consumo_celula_dia.consumo_gb + EXCLUDED.consumo_gb,
+                    n_registros = consumo_celula_dia.n_registros + EXCLUDED.n_registros;
+            """, [(*k, round(v[0], 2), v[1]) for k, v in self.acc.items()], page_size=10_000)
+
+    def commit(self):
+        """Depois do commit do chamador: as células do lote já existem em celula_geo."""
+        if len(self.known) + len(self.pending) > MAX_TEXTOS:
+            self.known.clear()
+        self.known.update(self.pending)
+        self.rollback()
+
+    def rollback(self):
+        """Descarta textos, células e somas do lote (transação desfeita ou já incorporados)."""
+        self.pending = {}
+        self.labels = {}
+        self.acc = defaultdict(lambda: [0.0, 0])
+
+
+def rebuild_index(conn, precision=PRECISAO):
+    """
+    Refaz o índice dos dias presentes em log_uso_sim: cada texto distinto é
+    interpretado uma vez e a soma roda no banco. Dias já arquivados (sem
+    detalhe bruto) mantêm os agregados existentes.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT localizacao FROM log_uso_sim WHERE localizacao IS NOT NULL;")
+        textos = [r[0] for r in cur.fetchall()]
+        cells, labels = cells_for(textos, precision)
+        mapa = [(t, c) for t, c in zip(textos, cells) if c is not None]
+        novas = dict(zip(cells.dropna(), labels[cells.notna()]))
+
+        cur.execute("CREATE TEMP TABLE loc_celula (localizacao VARCHAR(255), celula VARCHAR(64)) ON COMMIT DROP;")
+        execute_values(cur, "INSERT INTO loc_celula VALUES %s;", mapa, page_size=10_000)
+        execute_values(cur, """
+            INSERT INTO celula_geo (celula, lat, lon, rotulo) VALUES %s
+            ON CONFLICT (celula) DO NOTHING;
+        """, [(c, *(cell_position(c) or (None, None)), str(lbl)[:255]) for c, lbl in novas.items()])
+        cur.execute("DELETE FROM consumo_celula_dia WHERE data >= (SELECT MIN(data_uso)::date FROM log_uso_sim);")
+        cur.execute("""
+            INSERT INTO consumo_celula_dia
+                (celula, id_empresa, id_departamento, id_cargo, data, consumo_gb, n_registros)
+            SELECT m.celula, u.id_empresa, u.id_departamento, u.id_cargo, l.data_uso::date,
+                   SUM(l.consumo_dados_gb), COUNT(*)
+            FROM log_uso_sim l
+            JOIN loc_celula m ON m.localizacao = l.localizacao
+            JOIN usuario u ON l.id_usuario = u.id_usuario
+            GROUP BY 1, 2, 3, 4, 5;
+        """)
+    conn.commit()
+
+
+# --- LEITURA E ANÁLISE ---
+def load_region_rollup(conn, id_empresa):
+    """Consumo mensal por célula × departamento × cargo da empresa (do agregado, não do log)."""
+    df = pd.read_sql_query("""
+        SELECT r.celula, g.rotulo, g.lat, g.lon, dep.nome AS departamento, c.nome AS cargo,
+               date_trunc('month', r.data)::date AS mes,
+               SUM(r.consumo_gb)::float8 AS consumo_gb, SUM(r.n_registros) AS n_registros
+        FROM consumo_celula_dia r
+        JOIN celula_geo g ON g.celula = r.celula
+        JOIN departamentos dep ON r.id_departamento = dep.id_departamento
+        JOIN cargos c ON r.id_cargo = c.id_cargo
+        WHERE r.id_empresa = %s
+        GROUP BY 1, 2, 3, 4, 5, 6, 7;
+    """, conn, params=(int(id_empresa),))
+    df['mes'] = pd.to_datetime(df['mes'])
+    return df
+
+
+def by_level(rollup, nivel=PRECISAO):
+    """Soma o agregado no nível pedido (prefixo do geohash), com posição e rótulo de cada célula."""
+    if rollup.empty:
+        return pd.DataFrame(columns=['celula', 'rotulo', 'lat', 'lon', 'consumo_gb', 'n_registros'])
+    cells = rollup['celula'].map(lambda c: parent(c, nivel))
+    out = rollup.groupby(cells)[['consumo_gb', 'n_registros']].sum()
+    out.index.name = 'celula'
+    out = out.reset_index()
+    rotulos = rollup.drop_duplicates('celula').set_index('celula')['rotulo']
+    out['rotulo'] = [region_label(c, rotulos.get(c)) for c in out['celula']]
+    pos = [cell_position(c) or (np.nan, np.nan) for c in out['celula']]
+    out['lat'] = [p[0] for p in pos]
+    out['lon'] = [p[1] for p in pos]
+    return out.sort_values('consumo_gb', ascending=False, ignore_index=True)
+
+
+def region_label(cell, rotulo=None):
+    """Nome legível: geohash com o centro, UF/local com o rótulo gravado."""
+    if is_geohash(cell):
+        lat, lon = geohash_center(cell)
+        return f"{cell} ({lat:.2f}, {lon:.2f})"
+    return rotulo or cell
+
+
+def region_shifts(rollup, nivel=4, meses_recentes=3, limiar_pp=10.0):
+    """
+    Detector regional: compara a fatia de cada região (célula no `nivel`) no
+    consumo dos últimos `meses_recentes` meses com a dos meses anteriores.
+    Retorna as regiões cuja fatia subiu pelo menos `limiar_pp` pontos, com
+    colunas regiao, fatia_recente, fatia_anterior, consumo_gb.
+    """
+    cols = ['regiao', 'fatia_recente', 'fatia_anterior', 'consumo_gb']
+    if rollup.empty:
+        return pd.DataFrame(columns=cols)
+    meses = np.sort(rollup['mes'].unique())
+    if len(meses) <= meses_recentes:
+        return pd.DataFrame(columns=cols)
+    piv = pd.DataFrame({
+        'celula': rollup['celula'].map(lambda c: parent(c, nivel)).to_numpy(),
+        'recente': rollup['mes'].isin(meses[-meses_recentes:]).to_numpy(),
+        'gb': rollup['consumo_gb'].to_numpy(),
+    }).pivot_table(index='celula', columns='recente', values='gb', aggfunc='sum', fill_value=0.0)
+    piv = piv.reindex(columns=[False, True], fill_value=0.0)
+    tot = piv.sum(axis=0)
+    if (tot <= 0).any():
+        return pd.DataFrame(columns=cols)
+    rotulos = rollup.drop_duplicates('celula').set_index('celula')['rotulo']
+    out = pd.DataFrame({
+        'regiao': [region_label(c, rotulos.get(c)) for c in piv.index],
+        'fatia_recente': (piv[True] / tot[True] * 100).to_numpy(),
+        'fatia_anterior': (piv[False] / tot[False] * 100).to_numpy(),
+        'consumo_gb': piv[True].to_numpy(),
+    })
+    out = out[out['fatia_recente'] - out['fatia_anterior'] >= limiar_pp]
+    return out.sort_values('fatia_recente', ascending=False, ignore_index=True)[cols]
+
+
+def main():
+    import psycopg2
+    from ingestao_logs import conn_params_from_env
+
+    parser = argparse.ArgumentParser(description="Manutenção do índice geográfico do consumo")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Refaz consumo_celula_dia a partir de log_uso_sim")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        if args.rebuild:
+            rebuild_index(conn)
+            print("Índice geográfico reconstruído.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# grade_diaria.py
+# Grade diária densa: os registros viram uma matriz usuários × dias (float32),
+# somando os registros do mesmo dia e marcando explicitamente os dias sem
+# registro (NaN + máscara `observed`). Lags e médias móveis passam a ser
+# deslocamentos em dias, calculados sobre a matriz inteira de uma vez.
+import numpy as np
+import pandas as pd
+
+
+class DailyGrid:
+    """values[u, d] = consumo do usuário uids[u] no dia start + d (NaN = sem registro)."""
+
+    def __init__(self, uids, start, values):
+        self.uids = np.asarray(uids)
+        self.start = pd.Timestamp(start).normalize()
+        self.values = values
+        self.observed = ~np.isnan(values)
+
+    @property
+    def days(self):
+        return pd.date_range(self.start, periods=self.values.shape[1])
+
+    @classmethod
+    def from_records(cls, df, value_col='consumo_dados_gb', date_col='data', user_col='id_usuario',
+                     start=None, end=None):
+        """Pivota os registros (soma do dia por usuário); start/end estendem ou cortam a grade."""
+        day = pd.to_datetime(df[date_col]).dt.normalize()
+        start = pd.Timestamp(start).normalize() if start is not None else day.min()
+        end = pd.Timestamp(end).normalize() if end is not None else day.max()
+        n_days = max((end - start).days + 1, 0)
+
+        codes, uids = pd.factorize(df[user_col], sort=True)
+        d_idx = ((day - start) // pd.Timedelta(days=1)).to_numpy()
+        inside = (d_idx >= 0) & (d_idx < n_days)
+        flat = codes[inside] * n_days + d_idx[inside]
+        size = len(uids) * n_days
+        sums = np.bincount(flat, weights=df[value_col].to_numpy(dtype=float)[inside], minlength=size)
+        counts = np.bincount(flat, minlength=size)
+        values = np.where(counts > 0, sums, np.nan).astype(np.float32).reshape(len(uids), n_days)
+        return cls(np.asarray(uids), start, values)
+
+    def lag(self, k):
+        """Valor de k dias antes (NaN se o dia não existe na grade ou não teve registro)."""
+        out = np.full_like(self.values, np.nan)
+        if k < self.values.shape[1]:
+            out[:, k:] = self.values[:, :-k]
+        return out
+
+    def rolling_mean(self, window):
+        """Média dos dias com registro entre d - window e d - 1 (não inclui o próprio dia)."""
+        filled = np.where(self.observed, self.values, 0).astype(np.float64)
+        zeros = np.zeros((len(filled), 1))
+        csum = np.concatenate([zeros, np.cumsum(filled, axis=1)], axis=1)
+        ccnt = np.concatenate([zeros, np.cumsum(self.observed, axis=1)], axis=1)
+        # Janela [d - window, d): csum[d] - csum[max(d - window, 0)]
+        hi = np.arange(filled.shape[1])
+        lo = np.maximum(hi - window, 0)
+        total = csum[:, hi] - csum[:, lo]
+        count = ccnt[:, hi] - ccnt[:, lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan).astype(np.float32)
+
+    def observed_cells(self):
+        """(índice do usuário, índice do dia) de cada célula com registro, por usuário e data."""
+        return np.nonzero(self.observed)
+
+    def window(self, size):
+        """Últimos `size` dias de cada usuário (alinhados ao fim da grade), NaN onde não há dia."""
+        n_days = self.values.shape[1]
+        out = np.full((len(self.uids), size), np.nan)
+        take = min(size, n_days)
+        if take:
+            out[:, size - take:] = self.values[:, n_days - take:]
+        return out
+
+
+def compact(hist):
+    """
+    Janelas (usuários × dias) sem os dias vazios: valores observados alinhados
+    à direita, NaN à esquerda (previsão com modelos de lags por registro).
+    """
+    observed = ~np.isnan(hist)
+    order = np.argsort(observed, axis=1, kind="stable")   # vazios primeiro, observados na ordem original
+    return np.take_along_axis(hist, order, axis=1)
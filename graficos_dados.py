@@ -0,0 +1,172 @@
+# graficos_dados.py
+# Camada de dados dos gráficos: reduz séries longas (diárias / por usuário)
+# no servidor antes de serializar a figura Plotly para o navegador.
+import numpy as np
+import pandas as pd
+
+# --- LIMITES DE PAYLOAD ---
+MAX_BYTES_FIGURA = 400_000      # teto do JSON da figura enviado ao navegador
+BYTES_POR_PONTO = 48            # estimativa conservadora (x ISO + y float + separadores)
+MIN_PONTOS_TRACE = 50
+
+# Granularidade escolhida pelo tamanho da janela de zoom (em dias)
+GRANULARIDADES = [
+    (120, "D", "Diário"),
+    (730, "W-MON", "Semanal"),
+    (None, "MS", "Mensal"),
+]
+# Cada ponto agregado é a soma do balde: o eixo Y diz de qual balde
+UNIDADES = {"D": "GB por dia", "W-MON": "GB por semana", "MS": "GB por mês"}
+ROTULOS = {freq: label for _, freq, label in GRANULARIDADES}
+
+
+# --- ALGORITMOS DE REDUÇÃO ---
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: mantém a forma visual da série
+    escolhendo, em cada balde, o ponto que forma o maior triângulo.
+    x deve ser numérico e crescente. Retorna os índices escolhidos.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Baldes internos (primeiro e último ponto são sempre mantidos)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Média do próximo balde (ou último ponto)
+        if i + 2 < len(edges):
+            nxt_s, nxt_e = edges[i + 1], edges[i + 2]
+        else:
+            nxt_s, nxt_e = n - 1, n
+        avg_x = x[nxt_s:nxt_e].mean()
+        avg_y = y[nxt_s:nxt_e].mean()
+
+        bx = x[start:end]
+        by = y[start:end]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def minmax_downsample(x, y, n_out):
+    """
+    Mantém o mínimo e o máximo de cada balde (preserva picos).
+    Retorna os índices escolhidos em ordem crescente.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+    if n_out >= n or n_buckets >= n:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    # argmin/argmax por balde via reduceat sobre blocos contíguos
+    mins = np.minimum.reduceat(y, starts)
+    maxs = np.maximum.reduceat(y, starts)
+    bucket_id = np.repeat(np.arange(n_buckets), np.diff(edges))
+    is_min = y == mins[bucket_id]
+    is_max = y == maxs[bucket_id]
+    # primeiro índice de cada balde que atinge o min / max
+    pos = np.arange(n)
+    first_min = np.full(n_buckets, n, dtype=np.int64)
+    first_max = np.full(n_buckets, n, dtype=np.int64)
+    np.minimum.at(first_min, bucket_id[is_min], pos[is_min])
+    np.minimum.at(first_max, bucket_id[is_max], pos[is_max])
+    idx = np.unique(np.concatenate([first_min, first_max, [0, n - 1]]))
+    return idx[idx < n]
+
+
+# --- GRANULARIDADE PELA JANELA DE ZOOM ---
+def choose_granularity(start, end):
+    """Escolhe a frequência de agregação a partir do tamanho da janela."""
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for max_days, freq, label in GRANULARIDADES:
+        if max_days is None or days <= max_days:
+            return freq, label
+    return "MS", "Mensal"
+
+
+def points_budget(n_traces, max_bytes=MAX_BYTES_FIGURA):
+    """Quantidade máxima de pontos por trace que cabe no orçamento de bytes."""
+    n_traces = max(1, n_traces)
+    return max(MIN_PONTOS_TRACE, int(max_bytes / BYTES_POR_PONTO / n_traces))
+
+
+def reduce_series(series, window=None, n_traces=1, method="lttb", max_bytes=MAX_BYTES_FIGURA, freq=None,
+                  n_points=None):
+    """
+    Recorta a série (índice de datas) na janela de zoom, agrega na granularidade
+    `freq` (padrão: a do tamanho da janela, ou do trecho da série sem janela)
+    e reduz para caber no orçamento de pontos (n_points, ou o que cabe em max_bytes).
+    Retorna (serie_reduzida, rótulo_da_granularidade).
+    """
+    s = series.dropna().sort_index()
+    if window is not None:
+        s = s.loc[pd.Timestamp(window[0]):pd.Timestamp(window[1])]
+    if freq is None:
+        if s.empty:
+            return s, "Diário"
+        freq, _ = choose_granularity(*(window if window is not None else (s.index.min(), s.index.max())))
+    label = ROTULOS[freq]
+    if s.empty:
+        return s, label
+    s = s.resample(freq).sum()
+
+    n_out = n_points or points_budget(n_traces, max_bytes)
+    if len(s) > n_out:
+        x = s.index.asi8.astype(np.float64)
+        if method == "minmax":
+            idx = minmax_downsample(x, s.values, n_out)
+        else:
+            idx = lttb(x, s.values, n_out)
+        s = s.iloc[idx]
+    return s, label
+
+
+def figure_payload_bytes(fig):
+    """Tamanho (bytes) do JSON que o st.plotly_chart envia ao navegador."""
+    return len(fig.to_json())
+
+
+def fit_figure(build_fn, series_list, window=None, method="lttb", max_bytes=MAX_BYTES_FIGURA):
+    """
+    Monta a figura com build_fn(series_reduzidas, rótulo, unidade_do_eixo_y)
+    e, se o JSON passar do teto, reduz novamente com menos pontos por trace.
+    Uma granularidade só para todas as séries, escolhida pela janela de zoom
+    (sem janela, pelo período coberto pelas séries); se nem com
+    MIN_PONTOS_TRACE couber, passa para o balde seguinte (semana, mês) e, no
+    mês, desce até 3 pontos. ValueError se nem assim a figura couber no teto.
+    """
+    if window is None:
+        spans = [s.dropna().index for s in series_list]
+        spans = [ix for ix in spans if len(ix)]
+        window = (min(ix.min() for ix in spans), max(ix.max() for ix in spans)) if spans else None
+    freq = choose_granularity(*window)[0] if window is not None else "D"
+    freqs = [f for _, f, _ in GRANULARIDADES]
+    size = 0
+    for freq in freqs[freqs.index(freq):]:
+        floor = 3 if freq == freqs[-1] else MIN_PONTOS_TRACE
+        n_points = points_budget(len(series_list), max_bytes)
+        while True:
+            reduced = [reduce_series(s, window, len(series_list), method, freq=freq, n_points=n_points)[0]
+                       for s in series_list]
+            fig = build_fn(reduced, ROTULOS[freq], UNIDADES[freq])
+            size = figure_payload_bytes(fig)
+            if size <= max_bytes:
+                return fig
+            n_points = min(n_points, max((len(r) for r in reduced), default=0))
+            smaller = max(floor, min(n_points - 1, int(n_points * max_bytes / size * 0.9)))
+            if smaller >= n_points:
+                break   # no piso desta granularidade: balde mais grosso
+            n_points = smaller
+    raise ValueError(f"Figura não cabe em {max_bytes} bytes ({size} com o mínimo de pontos).")
@@ -0,0 +1,317 @@
+# historico_usuarios.py
+# Histórico recente por usuário: o consumo dos últimos HIST_WINDOW dias de
+# cada linha (soma do dia; dia sem registro = NaN) em um buffer circular
+# (matriz usuários × dias), mantido na ingestão e persistido em historico_usuario.
+# A previsão parte direto dessa matriz — sem filtrar, ordenar e cortar o log
+# inteiro a cada clique.
+#
+# Uso:  python historico_usuarios.py --rebuild   (refaz a tabela a partir do uso consolidado)
+import argparse
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from previsao_lote import CAT_COLS, HIST_WINDOW, MIN_HIST
+
+
+# --- BUFFER CIRCULAR ---
+def _shift_to(hist, last_day, end_day):
+    """Realinha janelas que terminam em last_day para terminar em end_day (dias vazios = NaN)."""
+    window = hist.shape[1]
+    shift = np.clip(end_day - np.asarray(last_day), 0, window)
+    cols = np.arange(window) + shift[:, None]
+    out = hist[np.arange(len(hist))[:, None], np.minimum(cols, window - 1)]
+    out[cols >= window] = np.nan
+    return out
+
+
+class RingHistory:
+    """
+    Buffer circular de dias por usuário: a posição head - 1 é o último dia com
+    registro (last_day, ordinal); dias pulados entram como NaN. n_total conta
+    os dias com registro (filtro de MIN_HIST).
+    """
+
+    def __init__(self, window=HIST_WINDOW, capacity=1024):
+        self.window = window
+        self.index = {}                                   # id_usuario -> linha
+        self.uids = np.empty(capacity, dtype=np.int64)
+        self.buf = np.full((capacity, window), np.nan)
+        self.head = np.zeros(capacity, dtype=np.int64)
+        self.last_day = np.full(capacity, -1, dtype=np.int64)
+        self.n_total = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _grow(self, needed):
+        cap = len(self.uids)
+        if needed <= cap:
+            return
+        new_cap = max(needed, 2 * cap)
+        extra = new_cap - cap
+        self.uids = np.resize(self.uids, new_cap)
+        self.buf = np.vstack([self.buf, np.full((extra, self.window), np.nan)])
+        self.head = np.concatenate([self.head, np.zeros(extra, dtype=np.int64)])
+        self.last_day = np.concatenate([self.last_day, np.full(extra, -1, dtype=np.int64)])
+        self.n_total = np.concatenate([self.n_total, np.zeros(extra, dtype=np.int64)])
+
+    def rows_for(self, uids):
+        """Linhas dos usuários (cria as que faltam)."""
+        missing = [u for u in dict.fromkeys(int(u) for u in uids) if u not in self.index]
+        if missing:
+            start = len(self.index)
+            self._grow(start + len(missing))
+            for k, u in enumerate(missing):
+                self.index[u] = start + k
+            self.uids[start:start + len(missing)] = missing
+        return np.fromiter((self.index[int(u)] for u in uids), dtype=np.int64, count=len(uids))
+
+    def set_series(self, uid, values, n_total, last_day):
+        """Carrega a janela diária de um usuário terminando em last_day (ex.: lida do banco)."""
+        row = self.rows_for([uid])[0]
+        values = np.asarray(values, dtype=float)[-self.window:]
+        self.buf[row] = np.nan
+        self.buf[row, :len(values)] = values
+        self.head[row] = len(values) % self.window
+        self.last_day[row] = last_day
+        self.n_total[row] = n_total
+
+    def add(self, uids, days, values):
+        """Soma registros (dia ordinal) ao dia certo: mesmo dia acumula, dia novo avança o buffer."""
+        w = self.window
+        for row, day, v in zip(self.rows_for(uids), days, values):
+            last = self.last_day[row]
+            if last >= 0 and day <= last:
+                back = last - day
+                if back >= w:
+                    continue   # atrasado demais para a janela
+                pos = (self.head[row] - 1 - back) % w
+                if np.isnan(self.buf[row, pos]):
+                    self.buf[row, pos] = v
+                    self.n_total[row] += 1
+                else:
+                    self.buf[row, pos] += v
+                continue
+            gap = min(day - last - 1, w) if last >= 0 else 0
+            for _ in range(gap):
+                self.buf[row, self.head[row]] = np.nan
+                self.head[row] = (self.head[row] + 1) % w
+            self.buf[row, self.head[row]] = v
+            self.head[row] = (self.head[row] + 1) % w
+            self.last_day[row] = day
+            self.n_total[row] += 1
+
+    def matrix(self, rows, end_day=None):
+        """Janelas do mais antigo ao mais recente; com end_day, alinhadas a esse dia."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = (self.head[rows, None] + np.arange(self.window)) % self.window
+        hist = self.buf[rows[:, None], cols]
+        return hist if end_day is None else _shift_to(hist, self.last_day[rows], end_day)
+
+    def series(self, row):
+        return self.matrix([row])[0]
+
+
+# --- MANUTENÇÃO NA INGESTÃO ---
+class HistoryUpdater:
+    """
+    Carrega sob demanda os usuários do lote, acrescenta e grava os alterados.
+    As janelas do lote só valem depois do commit; rollback() volta às gravadas.
+    """
+
+    def __init__(self, conn, window=HIST_WINDOW):
+        self.conn = conn
+        self.ring = RingHistory(window)
+        self.last = {}     # id_usuario -> (data_uso, id_dispositivo, id_situacao, id_evento) do último registro
+        self.dirty = set()
+        self._undo = {}    # id_usuario -> (janela, head, last_day, n_total, last) antes do lote
+
+    def _load_users(self, uids):
+        missing = [u for u in uids if u not in self.ring.index]
+        if not missing:
+            return
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT id_usuario, valores, n_total, ultima_data, id_dispositivo, id_situacao, id_evento
+                FROM historico_usuario WHERE id_usuario = ANY(%s);
+            """, (missing,))
+            for uid, valores, n_total, ultima, disp, sit, evt in cur.fetchall():
+                self.ring.set_series(uid, valores, n_total, ultima.date().toordinal())
+                self.last[uid] = (ultima, disp, sit, evt)
+        self.ring.rows_for(missing)   # usuários sem histórico começam vazios
+
+    def observe_batch(self, batch):
+        """batch: tuplas do parse_record já em ordem cronológica."""
+        if not batch:
+            return
+        uids = [r[0] for r in batch]
+        unique = list(dict.fromkeys(uids))
+        self._load_users(unique)
+        ring = self.ring
+        for uid, row in zip(unique, ring.rows_for(unique)):
+            if uid not in self._undo:
+                self._undo[uid] = (ring.buf[row].copy(), ring.head[row], ring.last_day[row],
+                                   ring.n_total[row], self.last.get(uid))
+        self.ring.add(uids, [r[4].date().toordinal() for r in batch], [r[5] for r in batch])
+        for uid, id_sit, id_evt, id_disp, data_uso, *_ in batch:
+            if uid not in self.last or self.last[uid][0] is None or data_uso >= self.last[uid][0]:
+                self.last[uid] = (data_uso, id_disp, id_sit, id_evt)
+        self.dirty.update(uids)
+
+    def persist(self, cur):
+        """Grava as janelas alteradas (sem commit — usa a transação do chamador)."""
+        if not self.dirty:
+            return
+        rows = []
+        for uid in self.dirty:
+            row = self.ring.index[uid]
+            ultima, disp, sit, evt = self.last[uid]
+            rows.append((uid, self.ring.series(row).tolist(), int(self.ring.n_total[row]), ultima, disp, sit, evt))
+        execute_values(cur, """
+            INSERT INTO historico_usuario
+                (id_usuario, valores, n_total, ultima_data, id_dispositivo, id_situacao, id_evento)
+            VALUES %s
+            ON CONFLICT (id_usuario) DO UPDATE SET
+                valores = EXCLUDED.valores,
+                n_total = EXCLUDED.n_total,
+                ultima_data = EXCLUDED.ultima_data,
+                id_dispositivo = EXCLUDED.id_dispositivo,
+                id_situacao = EXCLUDED.id_situacao,
+                id_evento = EXCLUDED.id_evento;
+        """, rows, template="(%s, %s::float8[], %s, %s, %s, %s, %s)", page_size=5_000)
+
+    def commit(self):
+        """Depois do commit do chamador: as janelas do lote passam a valer."""
+        self.dirty = set()
+        self._undo = {}
+
+    def rollback(self):
+        """Transação desfeita: janelas e último registro voltam ao que estava gravado."""
+        ring = self.ring
+        for uid, (buf, head, last_day, n_total, last) in self._undo.items():
+            row = ring.index[uid]
+            ring.buf[row], ring.head[row], ring.last_day[row], ring.n_total[row] = buf, head, last_day, n_total
+            if last is None:
+                self.last.pop(uid, None)
+            else:
+                self.last[uid] = last
+        self.commit()
+
+
+def rebuild_history(conn, window=HIST_WINDOW):
+    """Refaz historico_usuario a partir de todo o log (soma diária, dias sem registro = NaN)."""
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE historico_usuario;")
+        cur.execute("""
+            WITH diario AS (
+                SELECT id_usuario, data_uso::date AS dia, SUM(consumo_dados_gb)::float8 AS consumo
+                FROM uso_consolidado GROUP BY 1, 2
+            ),
+            resumo AS (
+                SELECT id_usuario, MAX(dia) AS ultimo_dia, COUNT(*) AS n_total FROM diario GROUP BY 1
+            ),
+            ultimo AS (
+                SELECT DISTINCT ON (id_usuario) id_usuario, data_uso, id_dispositivo, id_situacao, id_evento
+                FROM uso_consolidado ORDER BY id_usuario, data_uso DESC, id_log DESC NULLS LAST
+            )
+            INSERT INTO historico_usuario
+                (id_usuario, valores, n_total, ultima_data, id_dispositivo, id_situacao, id_evento)
+            SELECT r.id_usuario,
+                   ARRAY(
+                       SELECT COALESCE(d.consumo, 'NaN'::float8)
+                       FROM generate_series(r.ultimo_dia - (%s - 1), r.ultimo_dia, interval '1 day') AS g(dia)
+                       LEFT JOIN diario d ON d.id_usuario = r.id_usuario AND d.dia = g.dia::date
+                       ORDER BY g.dia
+                   ),
+                   r.n_total, u.data_uso, u.id_dispositivo, u.id_situacao, u.id_evento
+            FROM resumo r JOIN ultimo u USING (id_usuario);
+        """, (window,))
+    conn.commit()
+
+
+# --- LEITURA (DASHBOARD) ---
+class HistorySeed:
+    """Estado inicial da previsão de uma empresa: ids, janelas diárias e categóricas por usuário."""
+
+    def __init__(self, uids, hist, meta, n_total, last_day):
+        self.uids = np.asarray(uids)
+        self.hist = hist
+        self.meta = meta.reset_index(drop=True)
+        self.n_total = np.asarray(n_total)
+        self.last_day = np.asarray(last_day, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.uids)
+
+    def select(self, mask=None, end=None, min_hist=MIN_HIST):
+        """
+        (ids, matriz, metadados) no formato de previsao_lote.build_history_matrix,
+        com as janelas alinhadas ao dia `end` (padrão: o último dia da empresa).
+        """
+        end_day = pd.Timestamp(end).toordinal() if end is not None else int(self.last_day.max(initial=0))
+        hist = _shift_to(self.hist, self.last_day, end_day)
+        keep = (self.n_total >= min_hist) & (~np.isnan(hist)).any(axis=1)
+        if mask is not None:
+            keep &= np.asarray(mask, dtype=bool)
+        return self.uids[keep], hist[keep], self.meta[keep].reset_index(drop=True)[CAT_COLS]
+
+
+def load_history_seed(conn, id_empresa, calendar=None, window=HIST_WINDOW):
+    """
+    Lê as janelas da empresa (uma linha por usuário) e monta o HistorySeed.
+    As categóricas são as do último registro, como no build_history_matrix;
+    linhas gravadas antes de historico_usuario guardar o evento (id_evento
+    nulo até o --rebuild) usam o evento do calendário nessa data.
+    """
+    df = pd.read_sql_query("""
+        SELECT h.id_usuario, h.valores, h.n_total, h.ultima_data,
+               c.nome AS cargo, dep.nome AS departamento,
+               disp.nome_dispositivo AS dispositivo, s.situacao AS situacao,
+               evt.nome_eventos AS evento
+        FROM historico_usuario h
+        JOIN usuario u ON h.id_usuario = u.id_usuario
+        JOIN cargos c ON u.id_cargo = c.id_cargo
+        JOIN departamentos dep ON u.id_departamento = dep.id_departamento
+        JOIN dispositivos disp ON h.id_dispositivo = disp.id_dispositivo
+        JOIN situacao s ON h.id_situacao = s.id_situacao
+        LEFT JOIN eventos_especiais evt ON h.id_evento = evt.id_evento
+        WHERE u.id_empresa = %s
+        ORDER BY h.id_usuario;
+    """, conn, params=(int(id_empresa),))
+    hist = np.full((len(df), window), np.nan)
+    for i, vals in enumerate(df['valores']):
+        vals = np.asarray(vals, dtype=float)[-window:]
+        hist[i, window - len(vals):] = vals
+    sem_evento = df['evento'].isna()
+    if sem_evento.any():
+        if calendar is not None:
+            df.loc[sem_evento, 'evento'] = calendar.evento(df.loc[sem_evento, 'ultima_data'])
+        else:
+            from calendario import EVENTO_PADRAO
+            df.loc[sem_evento, 'evento'] = EVENTO_PADRAO
+    last_day = pd.to_datetime(df['ultima_data']).map(pd.Timestamp.toordinal).to_numpy(dtype=np.int64)
+    return HistorySeed(df['id_usuario'].to_numpy(), hist, df[CAT_COLS], df['n_total'].to_numpy(), last_day)
+
+
+def main():
+    import psycopg2
+    from ingestao_logs import conn_params_from_env
+
+    parser = argparse.ArgumentParser(description="Manutenção do histórico recente por usuário")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Refaz historico_usuario a partir do uso consolidado")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        if args.rebuild:
+            rebuild_history(conn)
+            print("historico_usuario reconstruído.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# ingestao_logs.py
+# Ingestão contínua de registros de uso (CDR) em log_uso_sim.
+# Lê CSV ou JSON Lines de arquivos ou stdin, valida, agrupa em lotes grandes
+# e grava com COPY FROM STDIN, atualizando o consumo_diario, o motor de alertas,
+# a amostra estratificada do modo exploratório, o histórico recente por usuário
+# e o índice geográfico (consumo por célula de localizacao).
+#
+# Uso:  python ingestao_logs.py arquivo1.csv arquivo2.jsonl
+#       cat eventos.jsonl | python ingestao_logs.py --formato jsonl
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+from amostragem import StratifiedReservoir
+from geoindice import CellRollup
+from historico_usuarios import HistoryUpdater
+from motor_alertas import QuotaAlertEngine
+from monitor_deriva import DriftMonitor, needs_retraining
+
+BATCH_SIZE = 50_000
+
+LOG_COLUMNS = ["id_usuario", "id_situacao", "id_alerta", "id_evento", "id_dispositivo",
+               "data_uso", "consumo_dados_gb", "custo_total", "localizacao", "data_referencia"]
+
+
+def conn_params_from_env():
+    """Parâmetros de conexão (variáveis de ambiente, com os padrões do treino)."""
+    return {
+        "database": os.environ.get("DB_NAME", "ANALISE"),
+        "user": os.environ.get("DB_USER", "postgres"),
+        "password": os.environ.get("DB_PASS", "1234"),
+        "host": os.environ.get("DB_HOST", "localhost"),
+        "port": os.environ.get("DB_PORT", "5433"),
+    }
+
+
+# --- CACHE DE DIMENSÕES ---
+class DimensionCache:
+    """
+    Mantém em memória o mapeamento nome -> id das tabelas de dimensão.
+    Dispositivos, situações e eventos novos são cadastrados na primeira
+    ocorrência; usuários desconhecidos são rejeitados.
+    """
+    # tabela: (coluna id, coluna nome)
+    TABLES = {
+        "dispositivos": ("id_dispositivo", "nome_dispositivo"),
+        "situacao": ("id_situacao", "situacao"),
+        "eventos_especiais": ("id_evento", "nome_eventos"),
+    }
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.maps = {}
+        self.names = {}
+        self.reload()
+
+    def reload(self):
+        with self.conn.cursor() as cur:
+            for table, (id_col, name_col) in self.TABLES.items():
+                cur.execute(f"SELECT {name_col}, {id_col} FROM {table};")
+                pairs = cur.fetchall()
+                self.maps[table] = {str(n).strip().lower(): i for n, i in pairs}
+                self.names[table] = {i: n for n, i in pairs}
+
+            cur.execute("""
+                SELECT u.id_usuario, u.nome, c.limite_gigas, u.id_empresa, c.nome, dep.nome,
+                       u.id_departamento, u.id_cargo
+                FROM usuario u
+                JOIN cargos c ON u.id_cargo = c.id_cargo
+                JOIN departamentos dep ON u.id_departamento = dep.id_departamento;
+            """)
+            rows = cur.fetchall()
+            self.user_limit = {r[0]: float(r[2]) for r in rows}
+            self.user_empresa = {r[0]: r[3] for r in rows}
+            self.user_by_name = {str(r[1]).strip().lower(): r[0] for r in rows}
+            self.user_cargo = {r[0]: r[4] for r in rows}
+            self.user_departamento = {r[0]: r[5] for r in rows}
+            self.user_stratum = {r[0]: (r[3], r[6], r[7]) for r in rows}
+
+            cur.execute("SELECT nome_alerta, id_alerta FROM altera_excesso;")
+            self.alert_ids = {bool(flag): i for flag, i in cur.fetchall()}
+            for flag in (False, True):
+                if flag not in self.alert_ids:
+                    cur.execute("INSERT INTO altera_excesso (nome_alerta) VALUES (%s) RETURNING id_alerta;", (flag,))
+                    self.alert_ids[flag] = cur.fetchone()[0]
+        self.conn.commit()
+
+    def resolve(self, table, name):
+        key = str(name).strip().lower()
+        found = self.maps[table].get(key)
+        if found is None:
+            id_col, name_col = self.TABLES[table]
+            with self.conn.cursor() as cur:
+                cur.execute(f"INSERT INTO {table} ({name_col}) VALUES (%s) RETURNING {id_col};", (str(name).strip(),))
+                found = cur.fetchone()[0]
+            self.conn.commit()
+            self.maps[table][key] = found
+            self.names[table][found] = str(name).strip()
+        return found
+
+    def resolve_user(self, value):
+        try:
+            uid = int(value)
+            return uid if uid in self.user_limit else None
+        except (TypeError, ValueError):
+            return self.user_by_name.get(str(value).strip().lower())
+
+
+# --- LEITURA E VALIDAÇÃO ---
+def read_records(stream, formato):
+    if formato == "jsonl":
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)
+
+
+def parse_record(rec, dims):
+    """
+    Converte um registro bruto para a tupla de colunas de log_uso_sim
+    (sem o id_alerta, calculado depois). Retorna None se inválido.
+    """
+    try:
+        uid = dims.resolve_user(rec.get("id_usuario") or rec.get("usuario"))
+        if uid is None:
+            return None
+        data_uso = datetime.fromisoformat(str(rec["data_uso"]).strip())
+        consumo = round(float(rec["consumo_dados_gb"]), 2)
+        if consumo < 0:
+            return None
+        custo = rec.get("custo_total")
+        custo = round(float(custo), 2) if custo not in (None, "") else None
+        return (
+            uid,
+            dims.resolve("situacao", rec.get("situacao") or "Ativo"),
+            dims.resolve("eventos_especiais", rec.get("evento") or "Nenhum"),
+            dims.resolve("dispositivos", rec["dispositivo"]),
+            data_uso,
+            consumo,
+            custo,
+            (rec.get("localizacao") or None),
+        )
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+# --- ESCRITA EM LOTE ---
+def _csv_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.isoformat(sep=" ")
+    return v
+
+
+def drift_frame(batch, dims):
+    """Lote já resolvido -> colunas com os nomes usados no treino (para o monitor de deriva)."""
+    uids = [r[0] for r in batch]
+    return pd.DataFrame({
+        "departamento": [dims.user_departamento[u] for u in uids],
+        "cargo": [dims.user_cargo[u] for u in uids],
+        "situacao": [dims.names["situacao"][r[1]] for r in batch],
+        "dispositivo": [dims.names["dispositivos"][r[3]] for r in batch],
+        "consumo_dados_gb": [r[5] for r in batch],
+    })
+
+
+def flush_batch(conn, batch, dims, alerts, sampler=None, history=None, geo=None):
+    """
+    Grava o lote via COPY e atualiza consumo_diario, o estado de alertas, a
+    amostra estratificada, o histórico recente por usuário e o índice
+    geográfico na mesma transação. Se algo falha, a transação é desfeita e a
+    exceção sobe; o LogIngestor mantém o lote para reenvio.
+    """
+    if not batch:
+        return 0
+    batch.sort(key=lambda r: r[4])  # ordem cronológica para o acumulado do mês
+    try:
+        if history is not None:
+            history.observe_batch(batch)
+        if geo is not None:
+            geo.observe_batch(batch)
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        daily = defaultdict(lambda: [0.0, 0.0, 0])
+        for uid, id_sit, id_evt, id_disp, data_uso, consumo, custo, loc in batch:
+            _, over = alerts.observe(uid, data_uso, consumo)
+            if sampler is not None:
+                sampler.observe(uid, data_uso, consumo)
+            writer.writerow([_csv_value(v) for v in (
+                uid, id_sit, dims.alert_ids[over], id_evt, id_disp,
+                data_uso, consumo, custo, loc, data_uso.date()
+            )])
+            agg = daily[(uid, data_uso.date())]
+            agg[0] += consumo
+            agg[1] += custo or 0.0
+            agg[2] += 1
+        buf.seek(0)
+
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY log_uso_sim ({', '.join(LOG_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf
+            )
+            execute_values(cur, """
+                INSERT INTO consumo_diario (id_usuario, id_empresa, data, consumo_gb, custo_total, n_registros)
+                VALUES %s
+                ON CONFLICT (id_usuario, data) DO UPDATE SET
+                    consumo_gb = consumo_diario.consumo_gb + EXCLUDED.consumo_gb,
+                    custo_total = consumo_diario.custo_total + EXCLUDED.custo_total,
+                    n_registros = consumo_diario.n_registros + EXCLUDED.n_registros;
+            """, [(uid, dims.user_empresa[uid], d, round(v[0], 2), round(v[1], 2), v[2])
+                  for (uid, d), v in daily.items()],
+                page_size=10_000)
+            alerts.persist(cur)
+            if sampler is not None:
+                sampler.persist(cur)
+            if history is not None:
+                history.persist(cur)
+            if geo is not None:
+                geo.persist(cur)
+        conn.commit()
+    except Exception:
+        # Nada do lote fica gravado: a transação volta e o lote pode ser reenviado
+        conn.rollback()
+        alerts.rollback()
+        if sampler is not None:
+            sampler.rollback()
+        if history is not None:
+            history.rollback()
+        if geo is not None:
+            geo.rollback()
+        raise
+    emitted = alerts.commit()
+    if sampler is not None:
+        sampler.commit()
+    if history is not None:
+        history.commit()
+    if geo is not None:
+        geo.commit()
+    for uid, mes, faixa, total, limite, _ in emitted:
+        print(f"ALERTA: usuário {uid} atingiu {faixa}% do plano em {mes:%m/%Y} "
+              f"({total:.2f} de {limite:.0f} GB)", file=sys.stderr)
+    return len(batch)
+
+
+class LogIngestor:
+    """Acumula registros válidos e descarrega em lotes de batch_size."""
+
+    def __init__(self, conn, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.dims = DimensionCache(conn)
+        self.alerts = QuotaAlertEngine(conn, self.dims.user_limit)
+        self.sampler = StratifiedReservoir(conn, self.dims.user_stratum)
+        self.history = HistoryUpdater(conn)
+        self.geo = CellRollup(self.dims.user_stratum)
+        self.drift = DriftMonitor()
+        self.batch = []
+        self.written = 0
+        self.rejected = 0
+
+    def feed(self, stream, formato="csv"):
+        for rec in read_records(stream, formato):
+            row = parse_record(rec, self.dims)
+            if row is None:
+                self.rejected += 1
+                continue
+            self.batch.append(row)
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+                print(f"{self.written} registros gravados ({self.rejected} rejeitados)", file=sys.stderr)
+
+    def flush(self):
+        self.written += flush_batch(self.conn, self.batch, self.dims, self.alerts, self.sampler, self.history,
+                                    self.geo)
+        if self.batch and self.drift.enabled:
+            self.drift.update(drift_frame(self.batch, self.dims))
+            self.drift.save()
+        self.batch = []
+
+
+def backfill_daily(conn):
+    """Reconstrói consumo_diario a partir do uso consolidado (log_uso_sim + meses arquivados)."""
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE consumo_diario;")
+        cur.execute("""
+            INSERT INTO consumo_diario (id_usuario, id_empresa, data, consumo_gb, custo_total, n_registros)
+            SELECT l.id_usuario, u.id_empresa, l.data_uso::date, SUM(l.consumo_dados_gb),
+                   COALESCE(SUM(l.custo_total), 0), SUM(l.n_registros)
+            FROM uso_consolidado l
+            JOIN usuario u ON l.id_usuario = u.id_usuario
+            GROUP BY l.id_usuario, u.id_empresa, l.data_uso::date;
+        """)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestão de registros de uso em log_uso_sim")
+    parser.add_argument("arquivos", nargs="*", help="Arquivos CSV/JSONL (padrão: stdin)")
+    parser.add_argument("--formato", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--lote", type=int, default=BATCH_SIZE)
+    parser.add_argument("--backfill", action="store_true",
+                        help="Reconstrói consumo_diario a partir do log existente e sai")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        if args.backfill:
+            backfill_daily(conn)
+            print("consumo_diario reconstruído.")
+            return
+
+        ingestor = LogIngestor(conn, args.lote)
+        if args.arquivos:
+            for path in args.arquivos:
+                formato = args.formato or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+                with open(path, encoding="utf-8", newline="") as f:
+                    ingestor.feed(f, formato)
+        else:
+            ingestor.feed(sys.stdin, args.formato or "csv")
+        ingestor.flush()
+    finally:
+        conn.close()
+    print(f"Ingestão concluída: {ingestor.written} gravados, {ingestor.rejected} rejeitados.")
+    if needs_retraining(ingestor.drift.report()):
+        print("AVISO: deriva detectada nos dados frente ao treino — veja `python monitor_deriva.py`.",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
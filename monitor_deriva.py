@@ -0,0 +1,331 @@
+# monitor_deriva.py
+# Monitor de qualidade e deriva dos dados: mantém sketches por segmento
+# (departamento) — count-min para as categóricas e histograma de bins fixos
+# para consumo_dados_gb — atualizados a cada lote ingerido e comparados com
+# a referência gravada junto do modelo no treino. Nada do histórico é relido.
+#
+# Uso:  python monitor_deriva.py            (relatório; código de saída 1 se precisa retreinar)
+#       python monitor_deriva.py --zerar    (descarta o estado corrente)
+import argparse
+import json
+import os
+import sys
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+CAT_MONITORADAS = ["cargo", "dispositivo", "situacao"]
+NUM_MONITORADA = "consumo_dados_gb"
+SEGMENTO = "departamento"
+TOTAL = "__total__"          # segmento com a frota inteira
+
+CMS_LARGURA = 256
+CMS_PROFUNDIDADE = 4
+N_BINS = 20
+MAX_CHAVES = 500             # categorias distintas guardadas por coluna/segmento
+MEIA_VIDA_REGISTROS = 200_000  # decaimento do estado corrente (picos recentes pesam mais)
+
+PSI_ALERTA = 0.25            # PSI acima disso indica deriva relevante
+NOVA_CATEGORIA_ALERTA = 0.01 # fração mínima de uma categoria nunca vista no treino
+MIN_REGISTROS = 500          # segmentos com menos registros (decaídos) não são avaliados
+
+ESTADO_PADRAO = "estado_deriva.json"
+
+
+def reference_path(model_path):
+    """Arquivo da referência gravado ao lado do modelo."""
+    return os.path.splitext(model_path)[0] + "_deriva.json"
+
+
+# --- SKETCHES ---
+class CountMinSketch:
+    """Contagem aproximada por categoria em memória fixa (profundidade × largura)."""
+
+    def __init__(self, width=CMS_LARGURA, depth=CMS_PROFUNDIDADE, table=None, keys=None):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width)) if table is None else np.asarray(table, dtype=float)
+        self.keys = set(keys or [])
+
+    def _cells(self, key):
+        raw = str(key).encode("utf-8")
+        return [zlib.crc32(raw, seed * 0x9E3779B1 & 0xFFFFFFFF) % self.width for seed in range(self.depth)]
+
+    def add(self, values):
+        # Agrupa antes: um hash por categoria distinta do lote, não por registro
+        keys, counts = np.unique(np.asarray(values, dtype=object).astype(str), return_counts=True)
+        rows = np.arange(self.depth)
+        for key, n in zip(keys, counts):
+            self.table[rows, self._cells(key)] += n
+            if len(self.keys) < MAX_CHAVES:
+                self.keys.add(str(key))
+
+    def estimate(self, key):
+        return float(self.table[np.arange(self.depth), self._cells(key)].min())
+
+    @property
+    def total(self):
+        return float(self.table[0].sum())
+
+    def scale(self, factor):
+        self.table *= factor
+
+    def distribution(self, keys=None):
+        keys = sorted(self.keys if keys is None else keys)
+        est = np.array([self.estimate(k) for k in keys])
+        return pd.Series(est / max(self.total, 1e-12), index=keys)
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth,
+                "table": self.table.round(4).tolist(), "keys": sorted(self.keys)}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["width"], d["depth"], d["table"], d["keys"])
+
+
+class FixedHistogram:
+    """Histograma com limites definidos na referência (os mesmos em treino e produção)."""
+
+    def __init__(self, edges, counts=None, n=0.0, total=0.0, total_sq=0.0):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) + 1) if counts is None else np.asarray(counts, dtype=float)
+        self.n, self.total, self.total_sq = n, total, total_sq
+
+    @classmethod
+    def quantile_edges(cls, values, bins=N_BINS):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return np.array([0.0])
+        return np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side="right"),
+                                   minlength=len(self.counts))
+        self.n += len(values)
+        self.total += float(values.sum())
+        self.total_sq += float((values ** 2).sum())
+
+    def scale(self, factor):
+        self.counts *= factor
+        self.n *= factor
+        self.total *= factor
+        self.total_sq *= factor
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else float("nan")
+
+    def distribution(self):
+        return self.counts / max(self.counts.sum(), 1e-12)
+
+    def to_dict(self):
+        return {"edges": self.edges.tolist(), "counts": self.counts.round(4).tolist(),
+                "n": self.n, "total": self.total, "total_sq": self.total_sq}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["edges"], d["counts"], d["n"], d["total"], d["total_sq"])
+
+
+# --- PERFIL POR SEGMENTO ---
+class DriftProfile:
+    """Sketches de um conjunto de dados, por departamento e para a frota inteira."""
+
+    def __init__(self, edges, segments=None, created=None, reference=None):
+        self.edges = np.asarray(edges, dtype=float)
+        self.segments = segments or {}
+        self.created = created or datetime.now().isoformat(timespec="seconds")
+        self.reference = reference     # created da referência à qual o estado corrente se compara
+
+    def _segment(self, name):
+        seg = self.segments.get(name)
+        if seg is None:
+            seg = self.segments[name] = {
+                "cat": {c: CountMinSketch() for c in CAT_MONITORADAS},
+                "num": FixedHistogram(self.edges),
+            }
+        return seg
+
+    @property
+    def n(self):
+        seg = self.segments.get(TOTAL)
+        return seg["num"].n if seg else 0.0
+
+    def update(self, df, half_life=None):
+        """Acrescenta um lote (colunas de CAT_MONITORADAS, departamento e consumo_dados_gb)."""
+        if df.empty:
+            return
+        if half_life:
+            factor = 0.5 ** (len(df) / half_life)
+            for seg in self.segments.values():
+                seg["num"].scale(factor)
+                for sketch in seg["cat"].values():
+                    sketch.scale(factor)
+        groups = [(TOTAL, df)]
+        if SEGMENTO in df.columns:
+            groups += list(df.groupby(SEGMENTO, observed=True))
+        for name, part in groups:
+            seg = self._segment(str(name))
+            seg["num"].add(part[NUM_MONITORADA].to_numpy(dtype=float))
+            for c in CAT_MONITORADAS:
+                if c in part.columns:
+                    seg["cat"][c].add(part[c].to_numpy())
+
+    @classmethod
+    def from_frame(cls, df):
+        """Referência do treino: bins por quantis do consumo e sketches do conjunto inteiro."""
+        profile = cls(FixedHistogram.quantile_edges(df[NUM_MONITORADA]))
+        profile.update(df)
+        return profile
+
+    def to_dict(self):
+        return {
+            "created": self.created, "reference": self.reference, "edges": self.edges.tolist(),
+            "segments": {name: {"num": seg["num"].to_dict(),
+                                "cat": {c: s.to_dict() for c, s in seg["cat"].items()}}
+                         for name, seg in self.segments.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        segments = {name: {"num": FixedHistogram.from_dict(seg["num"]),
+                           "cat": {c: CountMinSketch.from_dict(s) for c, s in seg["cat"].items()}}
+                    for name, seg in d["segments"].items()}
+        return cls(d["edges"], segments, d.get("created"), d.get("reference"))
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+# --- COMPARAÇÃO ---
+def psi(expected, actual, eps=1e-4):
+    """Population Stability Index entre duas distribuições (mesmos bins/categorias)."""
+    e = np.clip(np.asarray(expected, dtype=float), eps, None)
+    a = np.clip(np.asarray(actual, dtype=float), eps, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def compare(reference, current, min_registros=MIN_REGISTROS):
+    """
+    Compara o estado corrente com a referência do treino, segmento a segmento.
+    Retorna DataFrame (segmento, variavel, registros, psi, novas_categorias, deriva).
+    """
+    rows = []
+    for name, cur in current.segments.items():
+        n = cur["num"].n
+        if n < min_registros:
+            continue
+        ref = reference.segments.get(name)
+        if ref is None:
+            rows.append({"segmento": name, "variavel": SEGMENTO, "registros": n, "psi": np.nan,
+                         "novas_categorias": [name], "deriva": True})
+            continue
+
+        rows.append({"segmento": name, "variavel": NUM_MONITORADA, "registros": n,
+                     "psi": psi(ref["num"].distribution(), cur["num"].distribution()),
+                     "novas_categorias": [], "deriva": False})
+        for c in CAT_MONITORADAS:
+            ref_s, cur_s = ref["cat"][c], cur["cat"][c]
+            keys = ref_s.keys | cur_s.keys
+            cur_dist = cur_s.distribution(keys)
+            unseen = [k for k in sorted(cur_s.keys - ref_s.keys) if cur_dist[k] >= NOVA_CATEGORIA_ALERTA]
+            rows.append({"segmento": name, "variavel": c, "registros": n,
+                         "psi": psi(ref_s.distribution(keys).to_numpy(), cur_dist.to_numpy()),
+                         "novas_categorias": unseen, "deriva": bool(unseen)})
+
+    report = pd.DataFrame(rows, columns=["segmento", "variavel", "registros", "psi", "novas_categorias", "deriva"])
+    report["deriva"] = report["deriva"] | (report["psi"] >= PSI_ALERTA)
+    return report.sort_values(["deriva", "psi"], ascending=False, ignore_index=True)
+
+
+def needs_retraining(report):
+    return bool(len(report)) and bool(report["deriva"].any())
+
+
+# --- MONITOR INCREMENTAL ---
+class DriftMonitor:
+    """
+    Estado corrente persistido em arquivo; cada lote só atualiza os sketches.
+    O estado é descartado automaticamente quando a referência (modelo) muda.
+    """
+
+    def __init__(self, model_path="modelo_lightgbm_consumo.pkl", state_path=ESTADO_PADRAO,
+                 half_life=MEIA_VIDA_REGISTROS):
+        self.state_path = state_path
+        self.half_life = half_life
+        ref_path = reference_path(model_path)
+        self.reference = DriftProfile.load(ref_path) if os.path.exists(ref_path) else None
+        self.current = None
+        if self.reference is not None:
+            if os.path.exists(state_path):
+                state = DriftProfile.load(state_path)
+                if state.reference == self.reference.created:
+                    self.current = state
+            if self.current is None:
+                self.current = DriftProfile(self.reference.edges, reference=self.reference.created)
+
+    @property
+    def enabled(self):
+        return self.reference is not None
+
+    def update(self, df):
+        if self.enabled:
+            self.current.update(df, self.half_life)
+
+    def save(self):
+        if self.enabled:
+            self.current.save(self.state_path)
+
+    def report(self):
+        return compare(self.reference, self.current) if self.enabled else pd.DataFrame()
+
+    def reset(self):
+        if self.enabled:
+            self.current = DriftProfile(self.reference.edges, reference=self.reference.created)
+            self.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatório de deriva dos dados frente ao treino")
+    parser.add_argument("--modelo", default="modelo_lightgbm_consumo.pkl")
+    parser.add_argument("--estado", default=ESTADO_PADRAO)
+    parser.add_argument("--zerar", action="store_true", help="Descarta o estado corrente e sai")
+    args = parser.parse_args()
+
+    monitor = DriftMonitor(args.modelo, args.estado)
+    if not monitor.enabled:
+        print(f"Referência {reference_path(args.modelo)} não encontrada — retreine o modelo.")
+        sys.exit(2)
+    if args.zerar:
+        monitor.reset()
+        print("Estado de deriva zerado.")
+        return
+
+    report = monitor.report()
+    if report.empty:
+        print(f"Registros insuficientes desde o treino ({monitor.current.n:.0f}).")
+        return
+    with pd.option_context("display.max_rows", 200, "display.width", 160):
+        print(report.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if needs_retraining(report):
+        print("\nDeriva detectada: recomenda-se retreinar o modelo.")
+        sys.exit(1)
+    print("\nSem deriva relevante.")
+
+
+if __name__ == "__main__":
+    main()
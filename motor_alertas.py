@@ -0,0 +1,152 @@
+# motor_alertas.py
+# Motor de alertas de cota: mantém o consumo acumulado do mês por usuário
+# (memória + tabela estado_consumo_mes) e emite um alerta em alertas_quota
+# no momento em que cada faixa do plano (80% / 100% / 120%) é ultrapassada.
+import argparse
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+FAIXAS = (80, 100, 120)   # % de cargos.limite_gigas
+
+
+def month_of(dt):
+    return dt.date().replace(day=1) if isinstance(dt, datetime) else dt.replace(day=1)
+
+
+class QuotaAlertEngine:
+    """
+    Estado incremental por (usuário, mês): total em GB e maior faixa já
+    alertada. Cada observação custa O(1); nada é reagregado. O estado do lote
+    só vale depois do commit: rollback() volta ao último estado gravado.
+    """
+
+    def __init__(self, conn, limits):
+        self.conn = conn
+        self.limits = limits            # id_usuario -> limite_gigas
+        self.state = {}                 # (id_usuario, mes) -> [consumo_gb, nivel]
+        self.loaded_months = set()
+        self.dirty = set()
+        self.pending_alerts = []
+        self._undo = {}                 # (id_usuario, mes) -> estado antes do lote (None = não existia)
+
+    def _load_month(self, mes):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT id_usuario, consumo_gb, nivel_alerta FROM estado_consumo_mes WHERE mes = %s;",
+                (mes,)
+            )
+            for uid, total, nivel in cur.fetchall():
+                self.state.setdefault((uid, mes), [float(total), nivel])
+        self.loaded_months.add(mes)
+
+    def level_of(self, uid, total):
+        limit = self.limits.get(uid)
+        if not limit:
+            return 0
+        pct = 100 * total / limit
+        reached = [f for f in FAIXAS if pct >= f]
+        return reached[-1] if reached else 0
+
+    def observe(self, uid, data_uso, consumo):
+        """
+        Soma o consumo ao total do mês. Retorna (total_mes, acima_do_plano)
+        e enfileira um alerta para cada faixa recém-cruzada.
+        """
+        mes = month_of(data_uso)
+        if mes not in self.loaded_months:
+            self._load_month(mes)
+        key = (uid, mes)
+        entry = self.state.get(key)
+        if key not in self._undo:
+            self._undo[key] = None if entry is None else list(entry)
+        if entry is None:
+            entry = self.state[key] = [0.0, 0]
+        entry[0] += consumo
+        new_level = self.level_of(uid, entry[0])
+        if new_level > entry[1]:
+            for faixa in FAIXAS:
+                if entry[1] < faixa <= new_level:
+                    self.pending_alerts.append((uid, mes, faixa, round(entry[0], 2), self.limits[uid], data_uso))
+            entry[1] = new_level
+        self.dirty.add(key)
+        return entry[0], entry[1] >= 100
+
+    def persist(self, cur):
+        """Grava estado alterado e alertas pendentes (sem commit — usa a transação do chamador)."""
+        if self.dirty:
+            execute_values(cur, """
+                INSERT INTO estado_consumo_mes (id_usuario, mes, consumo_gb, nivel_alerta)
+                VALUES %s
+                ON CONFLICT (id_usuario, mes) DO UPDATE SET
+                    consumo_gb = EXCLUDED.consumo_gb,
+                    nivel_alerta = EXCLUDED.nivel_alerta;
+            """, [(uid, mes, round(self.state[(uid, mes)][0], 2), self.state[(uid, mes)][1])
+                  for uid, mes in self.dirty], page_size=10_000)
+        if self.pending_alerts:
+            execute_values(cur, """
+                INSERT INTO alertas_quota (id_usuario, mes, faixa, consumo_gb, limite_gb, disparado_em)
+                VALUES %s;
+            """, self.pending_alerts, page_size=10_000)
+
+    def commit(self):
+        """Depois do commit do chamador: o estado do lote passa a valer; retorna os alertas emitidos."""
+        emitted = self.pending_alerts
+        self.dirty = set()
+        self.pending_alerts = []
+        self._undo = {}
+        return emitted
+
+    def rollback(self):
+        """Transação desfeita: totais e faixas voltam ao que estava gravado, sem alertas pendentes."""
+        for key, before in self._undo.items():
+            if before is None:
+                self.state.pop(key, None)
+            else:
+                self.state[key] = before
+        self.dirty = set()
+        self.pending_alerts = []
+        self._undo = {}
+
+
+def rebuild_state(conn):
+    """Recalcula estado_consumo_mes a partir de consumo_diario (sem emitir alertas)."""
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE estado_consumo_mes;")
+        cur.execute("""
+            INSERT INTO estado_consumo_mes (id_usuario, mes, consumo_gb, nivel_alerta)
+            SELECT d.id_usuario, date_trunc('month', d.data)::date, SUM(d.consumo_gb),
+                   CASE
+                       WHEN SUM(d.consumo_gb) >= 1.2 * c.limite_gigas THEN 120
+                       WHEN SUM(d.consumo_gb) >= 1.0 * c.limite_gigas THEN 100
+                       WHEN SUM(d.consumo_gb) >= 0.8 * c.limite_gigas THEN 80
+                       ELSE 0
+                   END
+            FROM consumo_diario d
+            JOIN usuario u ON d.id_usuario = u.id_usuario
+            JOIN cargos c ON u.id_cargo = c.id_cargo
+            GROUP BY d.id_usuario, date_trunc('month', d.data), c.limite_gigas;
+        """)
+    conn.commit()
+
+
+def main():
+    from ingestao_logs import conn_params_from_env
+
+    parser = argparse.ArgumentParser(description="Manutenção do estado de alertas de cota")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Recalcula estado_consumo_mes a partir de consumo_diario")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        if args.rebuild:
+            rebuild_state(conn)
+            print("estado_consumo_mes reconstruído.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# perfil_inicializacao.py
+# Relatório de tempo de importação por ponto de entrada (python -X importtime).
+# Mede, em processo limpo, os imports de topo de cada script e lista os
+# imports adiados (dentro de funções / ramos de página) separadamente.
+#
+# Uso:  python perfil_inicializacao.py [--top 10]
+import argparse
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+ENTRY_POINTS = ["app.py", "frontendalt.py", "dashboard.py"]
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def collect_imports(path):
+    """Retorna (imports_de_topo, imports_adiados) de um script."""
+    tree = ast.parse(Path(path).read_text(encoding="utf-8"))
+    top, deferred = [], []
+
+    def names(node):
+        if isinstance(node, ast.Import):
+            return [a.name for a in node.names]
+        if node.level == 0 and node.module:
+            return [node.module]
+        return []
+
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            top.extend(names(node))
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for n in names(node):
+                if n not in top and n not in deferred:
+                    deferred.append(n)
+    return top, deferred
+
+
+def _importtime(code):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    return proc.stderr.splitlines()
+
+
+def profile_imports(modules):
+    """
+    Importa os módulos em um interpretador novo com -X importtime.
+    Retorna lista de (módulo, cumulativo_ms) dos imports de primeiro nível,
+    descontando o que o próprio interpretador já carrega na inicialização.
+    """
+    if not modules:
+        return []
+    startup = {line.rsplit("|", 1)[-1].strip() for line in _importtime("pass")}
+    rows = []
+    for line in _importtime("; ".join(f"import {m}" for m in modules)):
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   self_us |   cumulative_us |   <indentação>pacote"
+        _, cumul_us, name = line.split(":", 1)[1].split("|")
+        depth = len(name) - len(name.lstrip()) - 1
+        if depth == 0 and name.strip() not in startup:  # pacotes importados diretamente
+            rows.append((name.strip(), int(cumul_us) / 1000))
+    return rows
+
+
+def report(top_n=10):
+    for entry in ENTRY_POINTS:
+        path = BASE_DIR / entry
+        if not path.exists():
+            continue
+        top, deferred = collect_imports(path)
+        rows = profile_imports(top)
+        total = sum(ms for _, ms in rows)
+        print(f"\n=== {entry} — imports de topo: {total:.0f} ms ===")
+        for name, ms in sorted(rows, key=lambda r: -r[1])[:top_n]:
+            print(f"  {ms:8.1f} ms  {name}")
+        if deferred:
+            print(f"  adiados: {', '.join(deferred)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação por ponto de entrada")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    report(args.top)
+
+
+if __name__ == "__main__":
+    main()
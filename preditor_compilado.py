@@ -0,0 +1,231 @@
+# preditor_compilado.py
+# Preditor compilado do ensemble LightGBM: as árvores são achatadas em
+# arrays NumPy (feature, limiar, filhos, folhas, conjuntos categóricos) e o
+# lote inteiro percorre todas as árvores ao mesmo tempo, nível a nível.
+# Evita a validação do wrapper sklearn, a conversão do pandas e a chamada à
+# C-API em cada passo da previsão recursiva. Cada par (linha, árvore) sai do
+# laço ao chegar na folha. Ganho nos lotes pequenos (dezenas de linhas, já
+# codificadas); a partir de ~1000 linhas o LightGBM nativo volta a ser mais rápido.
+import json
+
+import numpy as np
+import pandas as pd
+
+ZERO_THRESHOLD = 1e-35   # kZeroThreshold do LightGBM
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_CODES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+
+class CompiledPredictor:
+    """
+    Ensemble em arrays planos. Nós internos têm índice >= 0; folhas são
+    codificadas como ~índice_da_folha (negativas) em left/right/roots.
+    """
+
+    def __init__(self, arrays, feature_names, categorical_features, pandas_categorical, lag_semantics=None):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.default_left = arrays["default_left"]
+        self.missing_type = arrays["missing_type"]
+        self.cat_idx = arrays["cat_idx"]          # -1 para split numérico
+        self.cat_sets = arrays["cat_sets"]        # bool [n_cat_splits, max_categoria + 1]
+        self.leaf_value = arrays["leaf_value"]
+        self.roots = arrays["roots"]
+        self.feature_names = list(feature_names)
+        self.categorical_features = list(categorical_features)
+        self.pandas_categorical = pandas_categorical or []
+        self.lag_semantics = lag_semantics   # marca do treino (previsao_lote.lag_semantics)
+        self.max_depth = int(arrays["max_depth"])
+        self._build_encoders()
+        self._build_traversal()
+
+    # --- EXPORTAÇÃO ---
+    @classmethod
+    def from_model(cls, modelo):
+        """Achata um LGBMRegressor / Booster treinado (respeitando best_iteration)."""
+        booster = getattr(modelo, "booster_", modelo)
+        best = getattr(modelo, "best_iteration_", None) or booster.best_iteration or -1
+        dump = booster.dump_model(num_iteration=best if best > 0 else None)
+        if dump.get("num_tree_per_iteration", 1) != 1 or dump.get("objective", "").split()[0] not in ("regression", "regression_l1", "huber", "fair", "quantile"):
+            raise ValueError("Preditor compilado suporta apenas regressão com saída identidade.")
+
+        feature, threshold, left, right = [], [], [], []
+        default_left, missing_type, cat_idx, cat_lists = [], [], [], []
+        leaf_value, roots = [], []
+        max_depth = 0
+
+        def walk(node, depth):
+            nonlocal max_depth
+            if "split_index" not in node:
+                leaf_value.append(node["leaf_value"])
+                max_depth = max(max_depth, depth)
+                return ~(len(leaf_value) - 1)
+            i = len(feature)
+            feature.append(node["split_feature"])
+            default_left.append(bool(node["default_left"]))
+            missing_type.append(_MISSING_CODES[node["missing_type"]])
+            if node["decision_type"] == "==":
+                cats = [int(c) for c in str(node["threshold"]).split("||")]
+                cat_idx.append(len(cat_lists))
+                cat_lists.append(cats)
+                threshold.append(np.nan)
+            else:
+                cat_idx.append(-1)
+                threshold.append(float(node["threshold"]))
+            left.append(0)
+            right.append(0)
+            left[i] = walk(node["left_child"], depth + 1)
+            right[i] = walk(node["right_child"], depth + 1)
+            return i
+
+        for tree in dump["tree_info"]:
+            roots.append(walk(tree["tree_structure"], 0))
+
+        n_cat = max((max(c) for c in cat_lists), default=-1) + 1
+        cat_sets = np.zeros((max(1, len(cat_lists)), max(1, n_cat)), dtype=bool)
+        for k, cats in enumerate(cat_lists):
+            cat_sets[k, cats] = True
+
+        arrays = {
+            "feature": np.asarray(feature, dtype=np.int32),
+            "threshold": np.asarray(threshold, dtype=np.float64),
+            "left": np.asarray(left, dtype=np.int32),
+            "right": np.asarray(right, dtype=np.int32),
+            "default_left": np.asarray(default_left, dtype=bool),
+            "missing_type": np.asarray(missing_type, dtype=np.int8),
+            "cat_idx": np.asarray(cat_idx, dtype=np.int32),
+            "cat_sets": cat_sets,
+            "leaf_value": np.asarray(leaf_value, dtype=np.float64),
+            "roots": np.asarray(roots, dtype=np.int32),
+            "max_depth": np.int32(max_depth),
+        }
+        # Features categóricas: feature_infos traz a lista de categorias em "values"
+        infos = dump.get("feature_infos", {})
+        categorical = [f for f in dump["feature_names"] if infos.get(f, {}).get("values")]
+        return cls(arrays, dump["feature_names"], categorical, dump.get("pandas_categorical"),
+                   getattr(modelo, "lag_semantics", None))
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+            default_left=self.default_left, missing_type=self.missing_type, cat_idx=self.cat_idx,
+            cat_sets=self.cat_sets, leaf_value=self.leaf_value, roots=self.roots,
+            max_depth=np.int32(self.max_depth),
+            meta=np.array(json.dumps({"feature_names": self.feature_names,
+                                      "categorical_features": self.categorical_features,
+                                      "pandas_categorical": self.pandas_categorical,
+                                      "lag_semantics": self.lag_semantics}))
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {k: data[k] for k in data.files if k != "meta"}
+            meta = json.loads(str(data["meta"]))
+        return cls(arrays, meta["feature_names"], meta["categorical_features"], meta["pandas_categorical"],
+                   meta.get("lag_semantics"))
+
+    # --- CODIFICAÇÃO DA ENTRADA ---
+    def _build_encoders(self):
+        # Mesmo mapeamento do wrapper sklearn: categoria -> posição na lista do treino
+        self.encoders = {}
+        for name, cats in zip(self.categorical_features, self.pandas_categorical):
+            self.encoders[name] = {c: float(i) for i, c in enumerate(cats)}
+
+    def encode(self, X):
+        """DataFrame (ou array já numérico) -> matriz float64 na ordem do modelo."""
+        if not isinstance(X, pd.DataFrame):
+            return np.asarray(X, dtype=np.float64)
+        out = np.empty((len(X), len(self.feature_names)), dtype=np.float64)
+        for j, name in enumerate(self.feature_names):
+            # .array: o array da coluna sem montar Series intermediárias (custo fixo por lote pequeno)
+            col = X[name].array
+            enc = self.encoders.get(name)
+            if enc is None:
+                if col.dtype.kind not in "biuf":
+                    col = pd.to_numeric(pd.Series(col)).array
+                out[:, j] = col.to_numpy(dtype=np.float64, na_value=np.nan)
+            elif isinstance(col, pd.Categorical):
+                # Traduz só as categorias da coluna e indexa pelos códigos
+                lookup = np.append(np.array([enc.get(c, np.nan) for c in col.categories]), np.nan)
+                out[:, j] = lookup[col.codes]   # código -1 (NaN) cai no último
+            else:
+                # Categoria desconhecida vira NaN (igual ao LightGBM)
+                out[:, j] = pd.Series(col, dtype=object).map(enc).astype(np.float64).to_numpy()
+        return out
+
+    # --- AVALIAÇÃO VETORIZADA ---
+    def _build_traversal(self):
+        # Folhas viram índices >= n_int (nó interno + posição da folha): cada par
+        # (linha, árvore) avança um nível por passada e sai assim que chega
+        # numa folha — o custo segue a profundidade real, não a máxima.
+        n_int, n_leaf = len(self.feature), len(self.leaf_value)
+        as_node = lambda a: np.where(a >= 0, a, n_int + ~a).astype(np.intp)
+        self._n_int = n_int
+        self._feat = self.feature.astype(np.intp)
+        self._thr = self.threshold
+        self._left = as_node(self.left)
+        self._right = as_node(self.right)
+        self._cat = self.cat_idx.astype(np.intp)
+        self._is_cat = self._cat >= 0
+        self._any_cat = bool(self._is_cat.any())
+        self._leaf = np.concatenate([np.zeros(n_int), self.leaf_value])
+        self._roots = as_node(self.roots)
+        # NaN: NaN-missing e Zero-missing seguem default_left; sem tratamento, NaN vale 0
+        self._nan_left = np.where(self.missing_type == MISSING_NONE, 0.0 <= self.threshold, self.default_left)
+        self._zero_missing = self.missing_type == MISSING_ZERO
+        self._has_zero_missing = bool(self._zero_missing.any())
+
+    def predict(self, X):
+        data = np.ascontiguousarray(self.encode(X))
+        n, n_feat = data.shape
+        flat = data.ravel()
+        n_int, n_cat = self._n_int, self.cat_sets.shape[1]
+        row = np.repeat(np.arange(n, dtype=np.intp), len(self._roots))
+        node = np.tile(self._roots, n)
+        out = np.zeros(n)
+
+        while len(node):
+            leaf = node >= n_int
+            if leaf.any():
+                out += np.bincount(row[leaf], weights=self._leaf[node[leaf]], minlength=n)
+                inner = ~leaf
+                row, node = row[inner], node[inner]
+                if not len(node):
+                    break
+
+            fval = flat[row * n_feat + self._feat[node]]
+            go_left = fval <= self._thr[node]
+            is_nan = np.isnan(fval)
+            if is_nan.any():
+                go_left[is_nan] = self._nan_left[node[is_nan]]
+            if self._has_zero_missing:
+                zero = self._zero_missing[node] & (np.abs(fval) <= ZERO_THRESHOLD)
+                go_left[zero] = self.default_left[node[zero]]
+
+            # Categórico: pertence ao conjunto -> esquerda; negativo/NaN/fora do conjunto -> direita
+            if self._any_cat:
+                is_cat = self._is_cat[node]
+                if is_cat.any():
+                    cnode = node[is_cat]
+                    code = fval[is_cat]
+                    ok = (code >= 0) & (code < n_cat)   # NaN falha as duas comparações
+                    in_set = np.zeros(len(code), dtype=bool)
+                    in_set[ok] = self.cat_sets[self._cat[cnode[ok]], code[ok].astype(np.intp)]
+                    go_left[is_cat] = in_set
+
+            node = np.where(go_left, self._left[node], self._right[node])
+
+        return out
+
+
+def verify(predictor, modelo, X, atol=1e-6):
+    """Compara com o LightGBM no mesmo lote. Retorna a maior diferença absoluta."""
+    ref = np.asarray(modelo.predict(X))
+    diff = float(np.max(np.abs(predictor.predict(X) - ref))) if len(ref) else 0.0
+    if diff > atol:
+        raise AssertionError(f"Preditor compilado diverge do LightGBM (máx. |Δ| = {diff:.3g})")
+    return diff
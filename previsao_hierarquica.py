@@ -0,0 +1,212 @@
+# previsao_hierarquica.py
+# Previsão hierárquica: empresa → departamento → departamento × cargo.
+# Em vez de projetar cada usuário e somar, cada nível é previsto direto:
+#   - níveis agregados: perfil semanal (média por dia da semana) da série somada;
+#   - folhas (departamento × cargo): LightGBM em uma amostra fixa de usuários
+#     por folha (ou previsões por usuário já em cache), escalada pelo total de linhas.
+# As previsões são reconciliadas (MinT diagonal, top-down ou bottom-up) para
+# que as somas batam em todos os níveis. O custo do modelo é fixo por folha,
+# não cresce com o número de linhas; o detalhe por usuário sai sob demanda.
+# Quando perfil e modelo discordam muito (divergence), os métodos de
+# reconciliação dão totais bem diferentes — o Dashboard avisa.
+import numpy as np
+import pandas as pd
+
+import previsao_lote
+
+AMOSTRA_FOLHA = 8      # usuários projetados pelo modelo por departamento × cargo
+JANELA_PERFIL = 56     # dias (8 semanas) do perfil semanal dos níveis agregados
+METODOS = ("mint", "top_down", "bottom_up")
+LIMITE_DIVERGENCIA = 0.25   # diferença relativa perfil × soma das folhas que merece aviso
+
+
+# --- HIERARQUIA ---
+class Hierarchy:
+    """Nós (total, departamentos, folhas) e a matriz de soma S (nós × folhas)."""
+
+    def __init__(self, leaves):
+        self.leaves = list(leaves)                      # [(departamento, cargo), ...]
+        depts = sorted({d for d, _ in self.leaves})
+        self.nodes = [("Total",)] + [(d,) for d in depts] + self.leaves
+        S = np.zeros((len(self.nodes), len(self.leaves)))
+        S[0] = 1.0
+        for j, (d, _) in enumerate(self.leaves):
+            S[1 + depts.index(d), j] = 1.0
+        S[1 + len(depts):] = np.eye(len(self.leaves))
+        self.S = S
+
+    @property
+    def labels(self):
+        return [" / ".join(n) for n in self.nodes]
+
+    def level(self, node):
+        return {1: "empresa" if node == ("Total",) else "departamento", 2: "segmento"}[len(node)]
+
+
+# --- PREVISÕES BASE ---
+def weekly_profile_forecast(Y, last_date, future_dates, window=JANELA_PERFIL, calendar=None):
+    """
+    Y: (dias × nós) somas diárias até last_date. Previsão = média por dia da
+    semana nas últimas `window` observações; variância = resíduo desse perfil.
+    Com calendar, feriados em dia de semana entram no perfil de domingo
+    (CalendarStore.day_type), no histórico e nas datas futuras.
+    Uma passada vetorizada para todos os nós.
+    """
+    Y = Y[-window:]
+    dates = pd.date_range(end=last_date, periods=len(Y))
+    day_type = calendar.day_type if calendar is not None else (lambda d: pd.DatetimeIndex(d).dayofweek.to_numpy())
+    dow = day_type(dates)
+    profile = np.zeros((7, Y.shape[1]))
+    for d in range(7):
+        rows = Y[dow == d]
+        profile[d] = rows.mean(axis=0) if len(rows) else Y.mean(axis=0)
+    resid = Y - profile[dow]
+    var = resid.var(axis=0, ddof=1) if len(Y) > 1 else np.ones(Y.shape[1])
+    return profile[day_type(future_dates)], var
+
+
+def reconcile(base, S, var, method="mint"):
+    """
+    base: (dias × nós) previsões de todos os nós; S: matriz de soma.
+    mint: MinT com W diagonal (variância de cada nó); bottom_up: soma das
+    folhas; top_down: total repartido pela proporção das folhas na base.
+    """
+    n_leaves = S.shape[1]
+    leaves = base[:, -n_leaves:]
+    if method == "bottom_up":
+        return leaves @ S.T
+    if method == "top_down":
+        share = leaves / np.where(leaves.sum(axis=1, keepdims=True) > 0, leaves.sum(axis=1, keepdims=True), 1.0)
+        return (base[:, :1] * share) @ S.T
+    w_inv = 1.0 / np.maximum(var, 1e-12)
+    G = np.linalg.solve(S.T @ (S * w_inv[:, None]), S.T * w_inv)    # (folhas × nós)
+    return base @ (S @ G).T
+
+
+# --- RESULTADO ---
+class HierarchicalForecast:
+    """Previsões reconciliadas (datas × nós) e o necessário para detalhar uma folha por usuário."""
+
+    def __init__(self, hierarchy, future_dates, base, reconciled, var, method, seed, leaf_of, n_predicoes):
+        self.hierarchy = hierarchy
+        self.future_dates = future_dates
+        self.base = pd.DataFrame(base, index=future_dates, columns=hierarchy.labels)
+        self.reconciled = pd.DataFrame(reconciled, index=future_dates, columns=hierarchy.labels)
+        self.var = pd.Series(var, index=hierarchy.labels)
+        self.method = method
+        self.seed = seed
+        self.leaf_of = leaf_of          # índice da folha de cada usuário do seed
+        self.n_predicoes = n_predicoes  # linhas avaliadas pelo modelo por dia projetado
+
+    @property
+    def total(self):
+        return self.reconciled.iloc[:, 0]
+
+    @property
+    def exact(self):
+        """Todas as folhas projetadas por inteiro (nenhuma passou da amostra): sem economia de custo."""
+        return self.n_predicoes >= len(self.seed[0])
+
+    def divergence(self):
+        """
+        Por nó agregado (empresa, departamentos): GB do horizonte no perfil do
+        nó e na soma das folhas da base, e a diferença relativa entre os dois.
+        """
+        S = self.hierarchy.S
+        n_leaves = S.shape[1]
+        base = self.base.to_numpy()
+        perfil = base[:, :-n_leaves].sum(axis=0)
+        folhas = (base[:, -n_leaves:] @ S[:-n_leaves].T).sum(axis=0)
+        gap = np.abs(perfil - folhas) / np.maximum(np.maximum(perfil, folhas), 1e-9)
+        return pd.DataFrame({'perfil_gb': perfil, 'folhas_gb': folhas, 'divergencia': gap},
+                            index=self.hierarchy.labels[:-n_leaves])
+
+    def by_level(self, level):
+        """Previsões reconciliadas dos nós de um nível ('empresa', 'departamento', 'segmento')."""
+        keep = [lbl for node, lbl in zip(self.hierarchy.nodes, self.hierarchy.labels)
+                if self.hierarchy.level(node) == level]
+        return self.reconciled[keep]
+
+    def user_detail(self, modelo, departamento, cargo, calendar=None):
+        """
+        Sob demanda: projeta todos os usuários de uma folha e ajusta a escala
+        para somar a previsão reconciliada da folha.
+        """
+        j = self.hierarchy.leaves.index((departamento, cargo))
+        rows = np.flatnonzero(self.leaf_of == j)
+        uids, hist, meta = self.seed
+        fc = previsao_lote.forecast_users_batched(
+            modelo, None, self.future_dates, noise=False, calendar=calendar,
+            seed=(uids[rows], hist[rows], meta.iloc[rows].reset_index(drop=True))
+        )
+        target = self.reconciled[" / ".join((departamento, cargo))].to_numpy()
+        soma = fc.sum(axis=1).to_numpy()
+        return fc.mul(np.where(soma > 0, target / np.where(soma > 0, soma, 1.0), 0.0), axis=0)
+
+
+def forecast_hierarchy(modelo, df_fe, future_dates, method="mint", sample_size=AMOSTRA_FOLHA,
+                       rng=None, calendar=None, seed=None, cached=None):
+    """
+    Previsão hierárquica do contexto df_fe (mesmas colunas do
+    forecast_users_batched). cached: previsões por usuário já existentes
+    (datas × id_usuario) — folhas cobertas por elas entram exatas, sem amostra.
+    """
+    if method not in METODOS:
+        raise ValueError(f"Método de reconciliação desconhecido: {method}")
+    uids, hist, meta = seed if seed is not None else previsao_lote.build_history_matrix(df_fe)
+    if len(uids) == 0:
+        return None
+    rng = rng or np.random.default_rng()
+    meta = meta.reset_index(drop=True)
+
+    leaf_keys = pd.MultiIndex.from_frame(meta[['departamento', 'cargo']])
+    leaf_codes, leaves = pd.factorize(leaf_keys, sort=True)
+    hierarchy = Hierarchy(list(leaves))
+    n_leaves, H = len(leaves), len(future_dates)
+
+    # Níveis agregados: histórico somado por folha (janela do seed) -> todos os nós via S
+    Y_leaves = np.zeros((hist.shape[1], n_leaves))
+    np.add.at(Y_leaves.T, leaf_codes, np.nan_to_num(hist))
+    last_date = pd.Timestamp(future_dates[0]) - pd.Timedelta(days=1)
+    base, var = weekly_profile_forecast(Y_leaves @ hierarchy.S.T, last_date, future_dates, calendar=calendar)
+
+    # Folhas: previsões em cache quando cobrem a folha inteira; senão amostra fixa no modelo
+    cached_cols = set(cached.columns) if cached is not None else set()
+    leaf_fc = np.zeros((H, n_leaves))
+    leaf_var = np.zeros(n_leaves)
+    sampled_rows, sampled_leaf = [], []
+    for j in range(n_leaves):
+        rows = np.flatnonzero(leaf_codes == j)
+        if cached_cols.issuperset(uids[rows]):
+            leaf_fc[:, j] = cached[uids[rows]].to_numpy().sum(axis=1)
+            continue
+        pick = rows if len(rows) <= sample_size else rng.choice(rows, sample_size, replace=False)
+        sampled_rows.append(pick)
+        sampled_leaf.append(np.full(len(pick), j))
+
+    n_predicoes = 0
+    if sampled_rows:
+        rows = np.concatenate(sampled_rows)
+        which = np.concatenate(sampled_leaf)
+        fc = previsao_lote.forecast_users_batched(
+            modelo, None, future_dates, noise=False, calendar=calendar,
+            seed=(uids[rows], hist[rows], meta.iloc[rows].reset_index(drop=True))
+        ).to_numpy()
+        n_predicoes = len(rows)
+        for j in np.unique(which):
+            part = fc[:, which == j]
+            n, k = np.sum(leaf_codes == j), part.shape[1]
+            leaf_fc[:, j] = part.mean(axis=1) * n
+            if k < n:
+                # Variância amostral do total estimado (com correção de população finita)
+                s2 = part.var(axis=1, ddof=1) if k > 1 else part.mean(axis=1) ** 2
+                leaf_var[j] = float(np.mean(n * n * (1 - k / n) * s2 / k))
+
+    # Variância das folhas: erro do perfil da série da folha (mesma escala dos
+    # níveis agregados) + variância da amostra. Folhas exatas (cache ou
+    # população inteira) não zeram a variância: o MinT ainda pondera os níveis
+    base[:, -n_leaves:] = leaf_fc
+    var[-n_leaves:] = var[-n_leaves:] + leaf_var
+    reconciled = reconcile(base, hierarchy.S, var, method)
+    return HierarchicalForecast(hierarchy, pd.DatetimeIndex(future_dates), base, reconciled, var, method,
+                                (uids, hist, meta), leaf_codes, n_predicoes)
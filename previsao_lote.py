@@ -0,0 +1,212 @@
+# previsao_lote.py
+# Previsão recursiva em lote: todos os usuários avançam juntos, um predict
+# por dia projetado (matriz usuários × features) em vez de um por usuário-dia.
+import numpy as np
+import pandas as pd
+
+import custos
+from grade_diaria import DailyGrid, compact
+
+# --- CONFIGURAÇÃO DO MODELO ---
+COLS_MODEL = ["year", "month", "day", "dayofweek", "weekofyear", "is_weekend",
+              "lag_1", "lag_7", "lag_30", "rolling_7", "rolling_30",
+              "cargo", "departamento", "evento", "dispositivo", "situacao"]
+CAT_COLS = ["cargo", "departamento", "evento", "dispositivo", "situacao"]
+
+MIN_HIST = 15      # usuários com menos dias com registro são ignorados
+HIST_WINDOW = 60   # últimos dias usados como semente dos lags
+
+# Semântica dos lags, gravada pelo treino no próprio modelo (atributo
+# lag_semantics; o preditor compilado leva junto no .npz). "dias": lags em
+# dias de calendário (dia vazio = NaN) e médias só dos dias anteriores.
+# "registros": lag_k é o k-ésimo dia com registro anterior (dias vazios são
+# ignorados) — a dos modelos treinados antes da marca, que não a têm.
+LAGS_DIAS = "dias"
+LAGS_REGISTROS = "registros"
+
+
+def lag_semantics(modelo):
+    """Semântica dos lags com que o modelo foi treinado (sem a marca: por registro)."""
+    return getattr(modelo, "lag_semantics", None) or LAGS_REGISTROS
+
+
+# --- ESTADO INICIAL ---
+def build_history_matrix(df_fe, min_hist=MIN_HIST, window=HIST_WINDOW):
+    """
+    Monta a matriz (usuários × window) com os últimos `window` dias até a
+    última data de df_fe (registros do mesmo dia somados; dia sem registro = NaN).
+    Entram usuários com ao menos min_hist dias com registro e algum na janela.
+    Retorna (ids_usuarios, matriz, metadados_categóricos).
+    """
+    if df_fe.empty:
+        return np.array([]), np.empty((0, window)), pd.DataFrame(columns=CAT_COLS)
+    grid = DailyGrid.from_records(df_fe)
+    hist = grid.window(window)
+    valid = (grid.observed.sum(axis=1) >= min_hist) & (~np.isnan(hist)).any(axis=1)
+    uids, hist = grid.uids[valid], hist[valid]
+    if len(uids) == 0:
+        return np.array([]), np.empty((0, window)), pd.DataFrame(columns=CAT_COLS)
+
+    meta = df_fe.sort_values('data').groupby('id_usuario')[CAT_COLS].last().loc[uids].reset_index(drop=True)
+    return uids, hist, meta
+
+
+# --- MOTOR RECURSIVO ---
+def _lag(hist, k, by_day):
+    # Valor de k dias atrás (NaN se o usuário não teve registro no dia, como no treino);
+    # na semântica por registro, cai para o último valor se o usuário não tem k pontos
+    col = hist[:, -k]
+    return col if by_day else np.where(np.isnan(col), hist[:, -1], col)
+
+
+def _window_mean(block):
+    # Média dos dias com registro; NaN se nenhum (sem aviso do nanmean)
+    count = np.sum(~np.isnan(block), axis=1)
+    total = np.nansum(block, axis=1)
+    return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def _step_features(date_fc, hist, by_day):
+    # Features numéricas de um dia projetado para todos os usuários
+    return {
+        'year': date_fc.year, 'month': date_fc.month, 'day': date_fc.day,
+        'dayofweek': date_fc.dayofweek, 'weekofyear': date_fc.isocalendar().week,
+        'is_weekend': 1 if date_fc.dayofweek >= 5 else 0,
+        'lag_1': _lag(hist, 1, by_day),
+        'lag_7': _lag(hist, 7, by_day),
+        'lag_30': _lag(hist, 30, by_day),
+        'rolling_7': _window_mean(hist[:, -7:]),
+        'rolling_30': _window_mean(hist[:, -30:]),
+    }
+
+
+def forecast_users_batched(modelo, df_fe, future_dates, noise=True, rng=None, calendar=None, seed=None,
+                           features=None):
+    """
+    Projeta todos os usuários de df_fe nas datas futuras.
+    Com calendar (calendario.CalendarStore), o evento de cada data futura vem
+    do calendário; sem ele (ou com ele vazio), repete o último evento de cada usuário.
+    seed (ids, matriz, metadados) — p.ex. de historico_usuarios — dispensa
+    montar o estado inicial a partir de df_fe. Os lags seguem a semântica
+    gravada no modelo (lag_semantics).
+    features: lista opcional que recebe a matriz de features de cada dia
+    (na ordem das colunas do resultado), para atribuicao.explain_forecast.
+    Retorna DataFrame (datas × id_usuario) com o consumo diário previsto.
+    """
+    uids, hist, meta = seed if seed is not None else build_history_matrix(df_fe)
+    if len(uids) == 0:
+        return pd.DataFrame(index=future_dates)
+    by_day = lag_semantics(modelo) == LAGS_DIAS
+    if not by_day:
+        hist = compact(hist)
+    if calendar is not None and not len(calendar):
+        calendar = None
+
+    rng = rng or np.random.default_rng()
+    user_std = np.nanstd(hist, axis=1)
+    user_std[np.sum(~np.isnan(hist), axis=1) <= 1] = 1.0
+
+    # Categóricas fixas por usuário: montadas uma vez e reaproveitadas em todos os passos
+    X = pd.DataFrame(index=np.arange(len(uids)), columns=COLS_MODEL)
+    for c in CAT_COLS:
+        X[c] = meta[c].astype('category').values
+
+    # Preditor compilado: codifica as categóricas uma vez e avança só em NumPy
+    compiled = hasattr(modelo, "encode")
+    if compiled:
+        Xa = modelo.encode(X[modelo.feature_names])
+        col = {name: j for j, name in enumerate(modelo.feature_names)}
+
+    out = np.empty((len(future_dates), len(uids)))
+    for step, date_fc in enumerate(future_dates):
+        feats = _step_features(date_fc, hist, by_day)
+        evento = calendar.evento_at(date_fc) if calendar is not None else None
+        if compiled:
+            if evento is not None:
+                Xa[:, col['evento']] = modelo.encoders['evento'].get(evento, np.nan)
+            for name, v in feats.items():
+                Xa[:, col[name]] = v
+            base_pred = modelo.predict(Xa)
+            if features is not None:
+                features.append(Xa.copy())
+        else:
+            for name, v in feats.items():
+                X[name] = v
+            if evento is not None:
+                X['evento'] = pd.Categorical(np.full(len(uids), evento, dtype=object))
+            base_pred = modelo.predict(X[COLS_MODEL])
+            if features is not None:
+                features.append(X[COLS_MODEL].copy())
+
+        if noise:
+            base_pred = base_pred + rng.normal(0, user_std * 0.6)
+        vals = np.maximum(0, base_pred * 1.001)
+
+        hist = np.roll(hist, -1, axis=1)
+        hist[:, -1] = vals
+        out[step] = vals
+
+    return pd.DataFrame(out, index=future_dates, columns=uids)
+
+
+# --- MODO FROTA: WATCHLIST DE EXCESSO ---
+def top_n_indices(scores, n):
+    """Índices dos n maiores scores, ordenados (argpartition + sort só do top-n)."""
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.array([], dtype=np.int64)
+    part = np.argpartition(-scores, n - 1)[:n]
+    return part[np.argsort(-scores[part])]
+
+
+def fleet_over_quota(modelo, df_raw, top_n=50, noise=False, calendar=None, seed=None, tariffs=None):
+    """
+    Previsão de toda a frota em uma rodada: completa o mês corrente de cada
+    linha (realizado + projetado) e compara com cargos.limite_gigas.
+    Com tariffs (custos.resolve_tariffs), inclui a fatura projetada do mês.
+    Retorna o ranking das top_n linhas com maior razão consumo/limite.
+    """
+    if df_raw.empty:
+        return pd.DataFrame()
+
+    df = df_raw.copy(deep=False)   # só colunas novas/substituídas: não altera o cache
+    df['data'] = pd.to_datetime(df['data_uso'])
+    df.rename(columns={'consumo': 'consumo_dados_gb'}, inplace=True)
+    df['consumo_dados_gb'] = df['consumo_dados_gb'].astype(float)
+
+    last_date = df['data'].max().normalize()
+    month_start = last_date.replace(day=1)
+    month_end = month_start + pd.offsets.MonthEnd(0)
+    future_dates = pd.date_range(last_date + pd.Timedelta(days=1), month_end)
+
+    realized = df[df['data'] >= month_start].groupby('id_usuario')['consumo_dados_gb'].sum()
+    if len(future_dates):
+        fc = forecast_users_batched(modelo, df, future_dates, noise=noise, calendar=calendar, seed=seed)
+        projected_rest = fc.sum(axis=0)
+    else:
+        fc = pd.DataFrame(index=pd.DatetimeIndex([month_start]))
+        projected_rest = pd.Series(dtype=float)
+
+    users = df.groupby('id_usuario')[['usuario', 'departamento', 'cargo', 'limite_gigas']].last()
+    users['Realizado (GB)'] = realized.reindex(users.index).fillna(0.0)
+    users['Projetado (GB)'] = users['Realizado (GB)'] + projected_rest.reindex(users.index).fillna(0.0)
+    users['% do Plano'] = 100 * users['Projetado (GB)'] / users['limite_gigas'].astype(float).replace(0, np.nan)
+
+    if tariffs is not None:
+        # Mês corrente inteiro: o realizado entra junto com o projetado no cálculo da fatura
+        fc_month = fc.reindex(columns=users.index, fill_value=0.0)
+        months = pd.DatetimeIndex([month_start])
+        invoices = custos.project_invoices(
+            fc_month, custos.user_profile(df_raw), tariffs,
+            realized=custos.realized_usage(df_raw, months, users.index)
+        )
+        users['Fatura Projetada (R$)'] = invoices.groupby('id_usuario')['custo_total'].sum()
+
+    scores = users['% do Plano'].fillna(-np.inf).to_numpy()
+    ranked = users.iloc[top_n_indices(scores, top_n)].reset_index()
+    ranked = ranked[ranked['% do Plano'] > 0]
+    ranked['Excede'] = ranked['% do Plano'] > 100
+    return ranked.rename(columns={
+        'usuario': 'Usuário', 'departamento': 'Departamento',
+        'cargo': 'Cargo', 'limite_gigas': 'Plano (GB)'
+    })
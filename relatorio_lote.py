@@ -0,0 +1,261 @@
+# relatorio_lote.py
+# Relatório mensal sem interface: para cada empresa / departamento × cargo,
+# roda a mesma previsão em lote e o mesmo diagnóstico do Dashboard e grava
+# CSV + gráfico estático em um diretório. Os segmentos são processados em paralelo
+# (um processo por núcleo, cada um com sua cópia do modelo).
+#
+# Uso:  python relatorio_lote.py --saida relatorios/2025-06 --meses 6
+#       python relatorio_lote.py --empresa 2 --formato pdf
+import argparse
+import os
+import pickle
+import re
+import sys
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from html import escape
+
+import numpy as np
+import pandas as pd
+
+import custos
+import previsao_lote
+from atribuicao import explain_forecast
+from calendario import AVISO_CALENDARIO_VAZIO, load_calendar
+from preditor_compilado import CompiledPredictor
+
+MODELO_PADRAO = "modelo_lightgbm_consumo.pkl"
+SEMENTE = 42   # ruído da previsão reproduzível entre execuções
+
+
+# --- DADOS ---
+def load_report_data(conn, id_empresa=None):
+    """Mesmas colunas do load_ml_data do Dashboard, para uma empresa ou todas."""
+    query = """
+    SELECT
+        l.data_uso,
+        l.consumo_dados_gb AS consumo,
+        l.custo_total,
+        u.id_usuario,
+        u.nome AS usuario,
+        emp.nome AS empresa,
+        dep.nome AS departamento,
+        c.nome AS cargo,
+        c.limite_gigas,
+        evt.nome_eventos AS evento,
+        disp.nome_dispositivo AS dispositivo,
+        s.situacao AS situacao
+    FROM uso_consolidado l
+    JOIN usuario u ON l.id_usuario = u.id_usuario
+    JOIN empresas emp ON u.id_empresa = emp.id_empresa
+    JOIN departamentos dep ON u.id_departamento = dep.id_departamento
+    JOIN cargos c ON u.id_cargo = c.id_cargo
+    JOIN eventos_especiais evt ON l.id_evento = evt.id_evento
+    JOIN dispositivos disp ON l.id_dispositivo = disp.id_dispositivo
+    JOIN situacao s ON l.id_situacao = s.id_situacao
+    WHERE %(empresa)s IS NULL OR u.id_empresa = %(empresa)s
+    ORDER BY l.data_uso;
+    """
+    df = pd.read_sql_query(query, conn, params={"empresa": id_empresa})
+    calendar = load_calendar(conn)
+    if not len(calendar):
+        print(f"Aviso: {AVISO_CALENDARIO_VAZIO}")
+    return df, calendar
+
+
+def slugify(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_").lower() or "segmento"
+
+
+# --- GRÁFICOS ---
+def build_trend_figure(hist_monthly, fc_monthly, title):
+    """Mesma 'Tendência Conectada' do Dashboard (histórico recente + projeção)."""
+    import plotly.graph_objects as go
+
+    last_3 = hist_monthly.tail(3)
+    fc_connected = pd.concat([last_3.iloc[-1:], fc_monthly])
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=last_3['Data'], y=last_3['Consumo'], mode='lines+markers',
+                             name='Histórico Recente', line=dict(color='#1F77B4', width=3)))
+    fig.add_trace(go.Scatter(x=fc_connected['Data'], y=fc_connected['Consumo'], mode='lines+markers',
+                             name='Projeção IA', line=dict(color='#E60000', width=3, dash='dot')))
+    fig.update_layout(title=title, xaxis_title="Mês", yaxis_title="GB", width=900, height=450)
+    return fig
+
+
+def trend_svg(hist_monthly, fc_monthly, title, width=900, height=450):
+    """Fallback sem kaleido: o mesmo gráfico escrito direto em SVG."""
+    last_3 = hist_monthly.tail(3)
+    series = [(last_3, '#1F77B4', ''), (pd.concat([last_3.iloc[-1:], fc_monthly]), '#E60000', '6,4')]
+    allx = pd.concat([s['Data'] for s, _, _ in series])
+    ally = pd.concat([s['Consumo'] for s, _, _ in series])
+    x0, x1 = allx.min().value, max(allx.max().value, allx.min().value + 1)
+    y1 = max(float(ally.max()) * 1.1, 1e-9)
+    left, right, top, bottom = 70, 30, 50, 50
+
+    def px(d):
+        return left + (pd.Timestamp(d).value - x0) / (x1 - x0) * (width - left - right)
+
+    def py(v):
+        return height - bottom - float(v) / y1 * (height - top - bottom)
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" font-size="12">',
+             f'<rect width="{width}" height="{height}" fill="white"/>',
+             f'<text x="{left}" y="28" font-size="16">{escape(title)}</text>']
+    for k in range(5):
+        v = y1 * k / 4
+        parts.append(f'<line x1="{left}" x2="{width - right}" y1="{py(v):.1f}" y2="{py(v):.1f}" stroke="#e5e5e5"/>')
+        parts.append(f'<text x="{left - 8}" y="{py(v) + 4:.1f}" text-anchor="end">{v:.0f} GB</text>')
+    for d in allx.drop_duplicates().sort_values():
+        parts.append(f'<text x="{px(d):.1f}" y="{height - bottom + 18}" text-anchor="middle">{d:%m/%Y}</text>')
+    for frame, color, dash in series:
+        pts = " ".join(f"{px(d):.1f},{py(v):.1f}" for d, v in zip(frame['Data'], frame['Consumo']))
+        parts.append(f'<polyline points="{pts}" fill="none" stroke="{color}" stroke-width="3" stroke-dasharray="{dash}"/>')
+        parts += [f'<circle cx="{px(d):.1f}" cy="{py(v):.1f}" r="4" fill="{color}"/>'
+                  for d, v in zip(frame['Data'], frame['Consumo'])]
+    parts.append('</svg>')
+    return "\n".join(parts)
+
+
+def write_chart(hist_monthly, fc_monthly, title, path_base, formato):
+    """Exportação estática do Plotly (kaleido); sem kaleido, grava SVG puro."""
+    try:
+        fig = build_trend_figure(hist_monthly, fc_monthly, title)
+        path = f"{path_base}.{formato}"
+        fig.write_image(path, format=formato)
+        return path
+    except Exception:
+        path = f"{path_base}.svg"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(trend_svg(hist_monthly, fc_monthly, title))
+        return path
+
+
+# --- WORKER (um por processo) ---
+_worker = {}
+
+
+def _init_worker(model_path, calendar, backend, tariffs=None):
+    with open(model_path, "rb") as f:
+        modelo = pickle.load(f)
+    _worker["explicador"] = modelo   # pred_contrib (SHAP) só no LightGBM
+    if backend == "compilado":
+        # Mesmas previsões do LightGBM, sem o custo fixo da C-API a cada dia projetado
+        npz = model_path.replace(".pkl", "_arvores.npz")
+        modelo = CompiledPredictor.load(npz) if os.path.exists(npz) else CompiledPredictor.from_model(modelo)
+    _worker["modelo"] = modelo
+    _worker["calendar"] = calendar
+    _worker["tariffs"] = tariffs
+
+
+def run_segment(df_context, empresa, departamento, cargo, horizon, out_dir, formato):
+    """Previsão + diagnóstico de um departamento × cargo. Retorna a linha do resumo."""
+    from dashboard import prepare_features, analyze_root_cause
+
+    row = {"empresa": empresa, "departamento": departamento, "cargo": cargo,
+           "usuarios": df_context['id_usuario'].nunique(),
+           "historico_gb": float(df_context['consumo'].sum())}
+    df_fe = prepare_features(df_context)
+    future_dates = pd.date_range(df_fe['data'].max() + pd.Timedelta(days=1), periods=horizon * 30)
+    steps = []
+    fc_users = previsao_lote.forecast_users_batched(
+        _worker["modelo"], df_fe, future_dates,
+        rng=np.random.default_rng(SEMENTE), calendar=_worker["calendar"], features=steps
+    )
+    if fc_users.empty:
+        return {**row, "status": "SEM_DADOS", "mensagem": "Dados insuficientes."}
+
+    fc_monthly = fc_users.sum(axis=1).resample('MS').sum().reset_index()
+    fc_monthly.columns = ['Data', 'Consumo']
+    fc_monthly['Tipo'] = 'Previsão'
+    hist_monthly = df_fe.groupby('data')['consumo_dados_gb'].sum().resample('MS').sum().reset_index()
+    hist_monthly.columns = ['Data', 'Consumo']
+    hist_monthly['Tipo'] = 'Histórico'
+
+    attribution = explain_forecast(_worker["explicador"], steps, fc_users.columns.to_numpy())
+    status, _, msg, causes = analyze_root_cause(hist_monthly, fc_monthly['Consumo'].mean(), df_context.copy(),
+                                                attribution)
+
+    emp_dir = os.path.join(out_dir, slugify(empresa))
+    os.makedirs(emp_dir, exist_ok=True)
+    base = os.path.join(emp_dir, f"{slugify(departamento)}__{slugify(cargo)}")
+    pd.concat([hist_monthly, fc_monthly], ignore_index=True).to_csv(f"{base}.csv", index=False, date_format="%Y-%m")
+    if attribution is not None:
+        attribution.by_user.rename_axis('id_usuario').to_csv(f"{base}__atribuicao.csv")
+    if _worker["tariffs"] is not None:
+        months = custos.monthly_usage(fc_users)[0]
+        invoices = custos.project_invoices(fc_users, custos.user_profile(df_context), _worker["tariffs"],
+                                           realized=custos.realized_usage(df_context, months, fc_users.columns))
+        row["fatura_prevista"] = float(invoices['custo_total'].sum())
+        invoices.to_csv(f"{base}__fatura.csv", index=False, date_format="%Y-%m")
+    chart = write_chart(hist_monthly, fc_monthly, f"Trajetória: {departamento} / {cargo}", base, formato)
+    return {
+        **row,
+        "previsto_gb": float(fc_monthly['Consumo'].sum()),
+        "status": status,
+        "mensagem": msg,
+        "causas": " | ".join(c.replace("**", "").replace("*", "") for c in causes),
+        "csv": os.path.relpath(f"{base}.csv", out_dir),
+        "grafico": os.path.relpath(chart, out_dir),
+    }
+
+
+# --- ORQUESTRAÇÃO ---
+def generate_report(df, calendar, out_dir, horizon=6, model_path=MODELO_PADRAO,
+                    formato="png", workers=None, backend="compilado", tariffs=None):
+    """
+    Gera um CSV + gráfico por empresa/departamento × cargo e o resumo.csv do
+    diretório; com tariffs (custos.resolve_tariffs), também a fatura projetada.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    keys = ['empresa', 'departamento', 'cargo']
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_path, calendar, backend, tariffs)) as pool:
+        futures = {pool.submit(run_segment, part, *key, horizon, out_dir, formato): key
+                   for key, part in df.groupby(keys)}
+        for fut in as_completed(futures):
+            try:
+                rows.append(fut.result())
+            except Exception as e:
+                rows.append({**dict(zip(keys, futures[fut])), "status": "ERRO", "mensagem": str(e)})
+    summary = pd.DataFrame(rows).sort_values(keys, ignore_index=True)
+    summary.to_csv(os.path.join(out_dir, "resumo.csv"), index=False)
+    return summary
+
+
+def main():
+    import psycopg2
+    from ingestao_logs import conn_params_from_env
+
+    parser = argparse.ArgumentParser(description="Relatório de previsão por departamento × cargo")
+    parser.add_argument("--saida", default=os.path.join("relatorios", pd.Timestamp.today().strftime("%Y-%m")))
+    parser.add_argument("--meses", type=int, default=6, help="Horizonte da projeção")
+    parser.add_argument("--empresa", type=int, default=None, help="id_empresa (padrão: todas)")
+    parser.add_argument("--modelo", default=MODELO_PADRAO)
+    parser.add_argument("--formato", choices=["png", "svg", "pdf"], default="png")
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--backend", choices=["compilado", "lightgbm"], default="compilado")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    conn = psycopg2.connect(**conn_params_from_env())
+    try:
+        df, calendar = load_report_data(conn, args.empresa)
+        tariffs = custos.resolve_tariffs(custos.load_tariffs(conn), df) if not df.empty else None
+    finally:
+        conn.close()
+    if df.empty:
+        print("Sem dados para o relatório.", file=sys.stderr)
+        sys.exit(1)
+
+    summary = generate_report(df, calendar, args.saida, args.meses, args.modelo, args.formato, args.processos,
+                              args.backend, tariffs)
+    n_err = int((summary['status'] == "ERRO").sum())
+    print(f"{len(summary)} segmentos em {time.perf_counter() - t0:.1f}s -> {args.saida} ({n_err} com erro)")
+
+
+if __name__ == "__main__":
+    main()
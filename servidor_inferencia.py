@@ -0,0 +1,263 @@
+# servidor_inferencia.py
+# Servidor local de inferência: carrega o booster LightGBM uma única vez e
+# atende todas as réplicas do Streamlit no mesmo host. Pedidos concorrentes
+# são agrupados (micro-batch) em uma só chamada de predict.
+#
+# Uso:  python servidor_inferencia.py --porta 8765 --modelo modelo_lightgbm_consumo.pkl
+#       (no Streamlit: INFERENCE_URL=http://127.0.0.1:8765)
+import argparse
+import http.client
+import json
+import pickle
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+CAT_COLS = ["cargo", "departamento", "evento", "dispositivo", "situacao"]
+
+MAX_BATCH_ROWS = 20_000    # teto de linhas por chamada de predict
+MAX_WAIT_MS = 5            # janela para juntar pedidos concorrentes
+REPROVA_S = 30             # cliente: com o servidor fora, tempo até tentar de novo
+
+
+# --- MICRO-BATCHING ---
+class _Request:
+    __slots__ = ("frame", "received", "done", "result", "error", "metrics")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.received = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.metrics = {}
+
+
+class MicroBatcher:
+    """Fila única de pedidos; um worker junta o que chegou e chama predict uma vez."""
+
+    def __init__(self, modelo, max_rows=MAX_BATCH_ROWS, max_wait_ms=MAX_WAIT_MS):
+        self.modelo = modelo
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "rows": 0, "predict_ms": 0.0}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._worker, name="micro-batch", daemon=True).start()
+
+    def predict(self, frame):
+        req = _Request(frame)
+        self.queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result, req.metrics
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        rows = len(batch[0].frame)
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_rows:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                req = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(req)
+            rows += len(req.frame)
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            total_rows = sum(len(r.frame) for r in batch)
+            started = time.perf_counter()
+            try:
+                X = pd.concat([r.frame for r in batch], ignore_index=True)
+                for c in X.columns:
+                    if c in CAT_COLS:
+                        X[c] = X[c].astype('category')
+                    else:
+                        X[c] = pd.to_numeric(X[c])
+                preds = np.asarray(self.modelo.predict(X))
+                error = None
+            except Exception as e:
+                preds, error = None, e
+            finished = time.perf_counter()
+
+            offset = 0
+            for r in batch:
+                n = len(r.frame)
+                if error is None:
+                    r.result = preds[offset:offset + n]
+                else:
+                    r.error = error
+                offset += n
+                r.metrics = {
+                    "queue_ms": round((started - r.received) * 1000, 3),
+                    "predict_ms": round((finished - started) * 1000, 3),
+                    "total_ms": round((finished - r.received) * 1000, 3),
+                    "batch_requests": len(batch),
+                    "batch_rows": total_rows,
+                }
+                r.done.set()
+
+            with self._lock:
+                self.stats["requests"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["rows"] += total_rows
+                self.stats["predict_ms"] += (finished - started) * 1000
+
+
+# --- HTTP ---
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive: cada réplica reaproveita a conexão
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                with batcher._lock:
+                    self._send(200, {"status": "ok", **batcher.stats,
+                                     "lag_semantics": getattr(batcher.modelo, "lag_semantics", None)})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                frame = pd.DataFrame(payload["data"], columns=payload["columns"])
+                preds, metrics = batcher.predict(frame)
+                self._send(200, {"predictions": preds.tolist(), "metrics": metrics})
+            except Exception as e:
+                self._send(400, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass  # silencioso: métricas vão na resposta e em /health
+
+    return Handler
+
+
+# --- CLIENTE (usado pelo dashboard) ---
+class InferenceClient:
+    """
+    Substituto do LGBMRegressor para o dashboard: predict(X) envia o lote
+    ao servidor e devolve o array de previsões. last_metrics é a latência
+    do último pedido da thread que chama (cada sessão do Streamlit roda na
+    sua). Se o servidor parar de responder, fallback() (o modelo local,
+    carregado só nessa hora) assume e o servidor é tentado de novo após REPROVA_S.
+    """
+
+    def __init__(self, url, timeout=30, fallback=None):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 8765
+        self.timeout = timeout
+        self.fallback = fallback
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fallback_model = None
+        self._down_until = 0.0
+        self.lag_semantics = None   # a do modelo do servidor, lida no ping (previsao_lote.lag_semantics)
+
+    @property
+    def last_metrics(self):
+        return getattr(self._local, "metrics", {})
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _request(self, method, path, body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            conn = self._conn()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = json.loads(resp.read())
+                if resp.status != 200:
+                    raise RuntimeError(data.get("error", f"HTTP {resp.status}"))
+                return data
+            except (http.client.HTTPException, ConnectionError):
+                # Conexão keep-alive expirada: reabre uma vez
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def ping(self):
+        try:
+            health = self._request("GET", "/health")
+        except Exception:
+            return False
+        self.lag_semantics = health.get("lag_semantics")
+        return health.get("status") == "ok"
+
+    def _local_model(self):
+        with self._lock:
+            if self._fallback_model is None:
+                self._fallback_model = self.fallback()
+            if self._fallback_model is None:
+                raise RuntimeError("Servidor de inferência fora e modelo local indisponível")
+            return self._fallback_model
+
+    def predict(self, X):
+        if self.fallback is not None and time.monotonic() < self._down_until:
+            self._local.metrics = {"local": True}
+            return np.asarray(self._local_model().predict(X))
+        X = pd.DataFrame(X)
+        data = X.astype(object).where(X.notna(), None).values.tolist()
+        body = json.dumps({"columns": list(X.columns), "data": data}, default=float)
+        t0 = time.perf_counter()
+        try:
+            resp = self._request("POST", "/predict", body.encode("utf-8"))
+        except (http.client.HTTPException, OSError):
+            # Servidor fora (caiu, reiniciando, sem resposta): segue com o modelo local
+            if self.fallback is None:
+                raise
+            self._down_until = time.monotonic() + REPROVA_S
+            self._local.metrics = {"local": True}
+            return np.asarray(self._local_model().predict(X))
+        self._local.metrics = {**resp["metrics"], "roundtrip_ms": round((time.perf_counter() - t0) * 1000, 3)}
+        return np.asarray(resp["predictions"], dtype=float)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de inferência LightGBM compartilhado")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--modelo", default="modelo_lightgbm_consumo.pkl")
+    parser.add_argument("--max-espera-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    with open(args.modelo, "rb") as f:
+        modelo = pickle.load(f)
+    batcher = MicroBatcher(modelo, max_wait_ms=args.max_espera_ms)
+    server = ThreadingHTTPServer((args.host, args.porta), make_handler(batcher))
+    print(f"Servidor de inferência em http://{args.host}:{args.porta} (modelo: {args.modelo})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# conftest.py
+# Os módulos do projeto ficam na raiz do repositório (sem pacote).
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from previsao_lote import CAT_COLS, COLS_MODEL  # noqa: E402
+
+
+def feature_frame(n, rng):
+    """Matriz de features no formato do modelo (COLS_MODEL), com categóricas."""
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+    lags = rng.gamma(2.0, 0.5, (n, 5))
+    X = pd.DataFrame({
+        "year": dates.year, "month": dates.month, "day": dates.day,
+        "dayofweek": dates.dayofweek, "weekofyear": dates.isocalendar().week.to_numpy().astype(int),
+        "is_weekend": (dates.dayofweek >= 5).astype(int),
+        "lag_1": lags[:, 0], "lag_7": lags[:, 1], "lag_30": lags[:, 2],
+        "rolling_7": lags[:, 3], "rolling_30": lags[:, 4],
+        "cargo": rng.choice(["Vendedor", "Gerente", "Analista"], n),
+        "departamento": rng.choice(["Vendas", "TI", "Diretoria"], n),
+        "evento": rng.choice(["Nenhum", "Roaming", "Feriado"], n),
+        "dispositivo": rng.choice(["Smartphone", "Tablet"], n),
+        "situacao": rng.choice(["Ativo", "Inativo"], n),
+    })
+    for c in CAT_COLS:
+        X[c] = X[c].astype("category")
+    return X[COLS_MODEL]
+
+
+@pytest.fixture(scope="session")
+def modelo():
+    """LGBMRegressor pequeno treinado em dados sintéticos (mesmas features do modelo publicado)."""
+    lgb = pytest.importorskip("lightgbm")
+    rng = np.random.default_rng(0)
+    X = feature_frame(3000, rng)
+    y = (X["lag_1"] * 0.6 + X["rolling_7"] * 0.3
+         + (X["evento"] == "Roaming") * 1.5 + (X["cargo"] == "Gerente") * 0.8
+         + rng.normal(0, 0.1, len(X)))
+    model = lgb.LGBMRegressor(n_estimators=40, num_leaves=15, min_child_samples=10,
+                              random_state=0, verbose=-1)
+    model.fit(X, y, categorical_feature=CAT_COLS)
+    return model
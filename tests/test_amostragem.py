@@ -0,0 +1,100 @@
+import random
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from amostragem import StratifiedReservoir, estimate_by, estimate_total
+
+
+class _Conn:
+    """Conexão sem banco: estrato_amostra vazio."""
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, *args):
+        pass
+
+    def fetchall(self):
+        return []
+
+
+def _reservoir(k=5, seed=0):
+    return StratifiedReservoir(_Conn(), {1: (1, 1, 1), 2: (1, 2, 1)}, k=k, rng=random.Random(seed))
+
+
+def test_reservoir_counts_and_slots():
+    res = _reservoir(k=5)
+    for d in range(1, 21):
+        res.observe(1, datetime(2025, 3, d), float(d))
+    res.observe(2, datetime(2025, 3, 1), 1.0)
+    assert res.counts[(1, 1, 1, datetime(2025, 3, 1).date())] == 20
+    assert res.counts[(1, 2, 1, datetime(2025, 3, 1).date())] == 1
+    assert {slot for (stratum, slot) in res.slots if stratum[1] == 1} <= set(range(5))
+
+
+def test_reservoir_is_uniform():
+    hits = np.zeros(20)
+    for seed in range(2000):
+        res = _reservoir(k=5, seed=seed)
+        for d in range(20):
+            res.observe(1, datetime(2025, 3, d + 1), float(d))
+        for _, consumo in (row[1:] for row in res.slots.values()):
+            hits[int(consumo)] += 1
+    # cada registro fica na amostra com probabilidade k/n = 1/4
+    np.testing.assert_allclose(hits / 2000, 0.25, atol=0.04)
+
+
+def test_reservoir_rollback_restores_counts():
+    res = _reservoir()
+    res.observe(1, datetime(2025, 3, 1), 1.0)
+    res.commit()
+    res.observe(1, datetime(2025, 3, 2), 1.0)
+    res.observe(2, datetime(2025, 3, 2), 1.0)
+    res.rollback()
+    assert res.counts == {(1, 1, 1, datetime(2025, 3, 1).date()): 1}
+    assert not res.slots and not res.dirty_strata
+
+
+def _sample(values_by_stratum, population):
+    rows = []
+    for h, values in enumerate(values_by_stratum):
+        for v in values:
+            rows.append({"estrato": h, "y": v, "grupo": "a" if v % 2 else "b",
+                         "n_estrato": len(values), "N_estrato": population[h]})
+    return pd.DataFrame(rows)
+
+
+def test_full_strata_are_exact():
+    sample = _sample([[1.0, 2.0, 3.0], [10.0, 20.0]], population=[3, 2])
+    total, margem = estimate_total(sample, "y")
+    assert total == pytest.approx(36.0)
+    assert margem == pytest.approx(0.0)
+
+
+def test_stratified_total_and_fpc():
+    sample = _sample([[1.0, 3.0], [10.0, 20.0, 30.0, 40.0]], population=[10, 8])
+    est = estimate_by(sample, "y")
+    # total = N_h × média_h; variância com correção de população finita (1 - n/N)
+    expected_total = 10 * 2.0 + 8 * 25.0
+    var = 10 ** 2 * (1 - 2 / 10) * np.var([1.0, 3.0], ddof=1) / 2 \
+        + 8 ** 2 * (1 - 4 / 8) * np.var([10.0, 20.0, 30.0, 40.0], ddof=1) / 4
+    assert est["total"].iloc[0] == pytest.approx(expected_total)
+    assert est["margem"].iloc[0] == pytest.approx(1.96 * np.sqrt(var))
+    assert est["registros"].iloc[0] == pytest.approx(18.0)
+
+
+def test_domain_estimate_by_group():
+    sample = _sample([[1.0, 2.0, 3.0, 4.0]], population=[40])
+    est = estimate_by(sample, "y", by="grupo")
+    assert est.loc["a", "total"] == pytest.approx(40 * (1 + 3) / 4)
+    assert est.loc["b", "total"] == pytest.approx(40 * (2 + 4) / 4)
+    assert est["registros"].sum() == pytest.approx(40.0)
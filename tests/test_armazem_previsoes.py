@@ -0,0 +1,39 @@
+import numpy as np
+
+import armazem_previsoes
+from armazem_previsoes import ForecastStore, TenantForecastStores
+
+
+class _Growing:
+    """Resultado que cresce depois de guardado e informa a própria memória."""
+
+    def __init__(self):
+        self.nbytes = 100
+
+
+def test_get_does_not_remeasure_fixed_values(monkeypatch):
+    store = ForecastStore(max_bytes=10**6)
+    sim = _Growing()
+    h = store.put({'fc': np.zeros(1000), 'simulator': sim}, 's')
+    before = store.stats()['bytes']
+
+    def fail(value):
+        raise AssertionError("sizeof chamado na leitura")
+
+    monkeypatch.setattr(armazem_previsoes, 'sizeof', fail)
+    sim.nbytes = 5000
+    assert store.get(h, 's') is not None
+    assert store.stats()['bytes'] == before + 4900
+
+
+def test_tenants_have_separate_budgets():
+    stores = TenantForecastStores(default_budget=10_000, budgets={2: 50_000})
+    small = stores.for_tenant(2)
+    h = small.put({'fc': np.zeros(1000)}, 'a')
+    big = stores.for_tenant(1)
+    for _ in range(5):
+        big.put({'fc': np.zeros(1000)}, 'b')
+    assert small.get(h, 'a') is not None
+    stats = stores.stats()
+    assert stats[1]['handles'] == 1 and stats[1]['expulsos'] == 4
+    assert stats[2]['orcamento'] == 50_000
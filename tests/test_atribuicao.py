@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from atribuicao import FEATURE_GROUPS, explain_forecast, sample_days
+from conftest import feature_frame
+from preditor_compilado import CompiledPredictor
+
+
+def _steps(n_days, n_users, seed=0):
+    rng = np.random.default_rng(seed)
+    return [feature_frame(n_users, rng).reset_index(drop=True) for _ in range(n_days)]
+
+
+def test_group_sums_reproduce_prediction(modelo):
+    steps = _steps(6, 10)
+    uids = np.arange(100, 110)
+    att = explain_forecast(modelo, steps, uids)
+    assert list(att.by_user.columns) == list(FEATURE_GROUPS)
+    pred = np.sum([modelo.predict(X) for X in steps], axis=0)
+    np.testing.assert_allclose(att.by_user.sum(axis=1).to_numpy() + att.base * len(steps), pred, atol=1e-6)
+    assert att.by_group.sum() + att.baseline_total == pytest.approx(pred.sum(), abs=1e-6)
+
+
+def test_compiled_matrix_gives_same_attribution(modelo):
+    steps = _steps(4, 8, seed=1)
+    uids = np.arange(8)
+    compiled = CompiledPredictor.from_model(modelo)
+    encoded = [compiled.encode(X[compiled.feature_names]) for X in steps]
+    a = explain_forecast(modelo, steps, uids)
+    b = explain_forecast(modelo, encoded, uids)
+    np.testing.assert_allclose(a.by_user.to_numpy(), b.by_user.to_numpy(), atol=1e-6)
+
+
+def test_sampled_days_cover_horizon():
+    days, users, weight = sample_days(n_days=30, n_users=20, max_rows=100)
+    assert len(days) <= 100
+    assert days.max() < 30 and days.min() >= 0
+    assert weight == pytest.approx(30 / 5)
+    assert len(np.unique(days)) > 5   # deslocamento por usuário espalha os dias
+
+
+def test_without_booster_returns_none():
+    assert explain_forecast(object(), _steps(1, 2), np.arange(2)) is None
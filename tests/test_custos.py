@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import custos
+
+
+def test_overage_tiers():
+    limit = np.array([10.0, 10.0, 10.0, 10.0])
+    excess = np.array([0.0, 3.0, 5.0, 9.0])
+    cost = custos.overage_cost(excess, limit, price=2.0)
+    # até 50% da franquia a preço cheio; acima disso, 1,5×
+    np.testing.assert_allclose(cost, [0.0, 6.0, 10.0, 10.0 + 1.5 * 2.0 * 4.0])
+
+
+def test_overage_custom_tiers():
+    cost = custos.overage_cost(np.array([12.0]), np.array([10.0]), 1.0,
+                               faixas=[(0.0, 1.0), (0.2, 2.0), (1.0, 3.0)])
+    assert cost[0] == pytest.approx(2.0 + 2.0 * 8.0 + 3.0 * 2.0)
+
+
+def _forecast(gb_per_day, days=30):
+    dates = pd.date_range("2025-04-01", periods=days)
+    return pd.DataFrame({uid: np.full(days, v) for uid, v in gb_per_day.items()}, index=dates)
+
+
+def test_project_invoices():
+    users = pd.DataFrame({'cargo': ['Vendedor', 'Vendedor'], 'limite_gigas': [10.0, 10.0],
+                          'roaming_share': [0.0, 0.5]}, index=[1, 2])
+    tariffs = pd.DataFrame({'mensalidade': [50.0], 'preco_gb_excedente': [2.0],
+                            'preco_gb_roaming': [5.0]}, index=['Vendedor'])
+    inv = custos.project_invoices(_forecast({1: 0.5, 2: 1.0}), users, tariffs).set_index('id_usuario')
+    # 1: 15 GB domésticos -> 5 GB de excedente na primeira faixa
+    assert inv.loc[1, 'excedente_gb'] == pytest.approx(5.0)
+    assert inv.loc[1, 'custo_total'] == pytest.approx(50.0 + 10.0)
+    # 2: 30 GB, metade em roaming -> 15 domésticos (5 de excedente) + 15 em roaming
+    assert inv.loc[2, 'roaming_gb'] == pytest.approx(15.0)
+    assert inv.loc[2, 'custo_total'] == pytest.approx(50.0 + 10.0 + 75.0)
+
+
+def test_realized_usage_enters_current_month():
+    users = pd.DataFrame({'cargo': ['Vendedor'], 'limite_gigas': [10.0], 'roaming_share': [0.0]}, index=[1])
+    tariffs = pd.DataFrame({'mensalidade': [50.0], 'preco_gb_excedente': [1.0],
+                            'preco_gb_roaming': [3.0]}, index=['Vendedor'])
+    fc = _forecast({1: 0.2}, days=10)
+    inv = custos.project_invoices(fc, users, tariffs, realized=(np.array([[12.0]]), np.array([[0.0]])))
+    assert inv['consumo_gb'].iloc[0] == pytest.approx(14.0)
+    assert inv['custo_total'].iloc[0] == pytest.approx(50.0 + 4.0)
+
+
+def test_roaming_comes_from_evento():
+    df = pd.DataFrame({
+        'id_usuario': [1, 1, 2], 'consumo': [2.0, 6.0, 4.0],
+        'evento': ['Roaming Internacional', 'Nenhum', None],
+        'cargo': ['Vendedor'] * 3, 'departamento': ['Vendas'] * 3, 'limite_gigas': [10] * 3,
+    })
+    users = custos.user_profile(df)
+    assert users.loc[1, 'roaming_share'] == pytest.approx(0.25)
+    assert users.loc[2, 'roaming_share'] == 0.0
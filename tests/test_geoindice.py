@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import numpy as np
+
+from geoindice import CellRollup, cells_for, geohash_center, geohash_encode, parent
+
+
+def test_geohash_known_values():
+    np.testing.assert_array_equal(geohash_encode([57.64911, -23.55], [10.40744, -46.63], 5), ["u4pru", "6gyf4"])
+    assert geohash_encode([57.64911], [10.40744], 11)[0] == "u4pruydqqvj"
+
+
+def test_center_roundtrip():
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(-60, 60, 200), rng.uniform(-170, 170, 200)
+    for la, lo, cell in zip(lat, lon, geohash_encode(lat, lon, 6)):
+        c_lat, c_lon = geohash_center(cell)
+        assert abs(c_lat - la) <= 180 / 2 ** 15 and abs(c_lon - lo) <= 360 / 2 ** 15   # metade da célula
+        assert geohash_encode([c_lat], [c_lon], 6)[0] == cell
+
+
+def test_parent_is_prefix():
+    assert parent("6gyf4", 3) == "6gy"
+    assert parent("uf:SP", 3) == "uf:SP"
+
+
+def test_cells_for_texts():
+    cells, labels = cells_for(["-23.55, -46.63", "Campinas - SP", "Filial Norte", None, " ", "(-22.9; -43.2)"])
+    assert cells.tolist() == ["6gyf4", "uf:SP", "loc:filial-norte", None, None, "75cm8"]
+    assert labels.tolist()[:3] == ["6gyf4", "SP", "Filial Norte"]
+
+
+def test_rollup_stages_cells_until_commit():
+    rollup = CellRollup({1: (1, 2, 3)})
+    batch = [(1, 0, 0, 0, datetime(2025, 5, 1, 9), 1.5, 0.0, "Campinas/SP"),
+             (1, 0, 0, 0, datetime(2025, 5, 1, 18), 0.5, 0.0, "Campinas/SP")]
+    rollup.observe_batch(batch)
+    assert dict(rollup.acc) == {("uf:SP", 1, 2, 3, datetime(2025, 5, 1).date()): [2.0, 2]}
+    rollup.rollback()
+    assert not rollup.known and not rollup.labels
+    rollup.observe_batch(batch)
+    assert rollup.labels == {"uf:SP": "SP"}   # célula volta a ser gravada no reenvio
+    rollup.commit()
+    assert rollup.known == {"Campinas/SP": "uf:SP"} and not rollup.acc
+
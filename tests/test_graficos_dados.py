@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from graficos_dados import (MIN_PONTOS_TRACE, figure_payload_bytes, fit_figure, lttb, minmax_downsample,
+                            points_budget, reduce_series)
+
+go = pytest.importorskip("plotly.graph_objects")
+
+
+def _daily(n, start="2022-01-01", seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.Series(rng.gamma(2.0, 1.0, n), index=pd.date_range(start, periods=n))
+
+
+def _build(reduced, label, unidade):
+    fig = go.Figure([go.Scatter(x=s.index, y=s.values) for s in reduced])
+    fig.update_layout(title=label, yaxis_title=unidade)
+    return fig
+
+
+def test_lttb_keeps_endpoints_and_budget():
+    y = np.sin(np.linspace(0, 20, 5000))
+    idx = lttb(np.arange(5000), y, 200)
+    assert len(idx) == 200
+    assert idx[0] == 0 and idx[-1] == 4999
+    assert np.all(np.diff(idx) > 0)
+
+
+def test_minmax_preserves_extremes():
+    rng = np.random.default_rng(1)
+    y = rng.normal(size=3000)
+    y[1234], y[2345] = 50.0, -50.0
+    idx = minmax_downsample(np.arange(3000), y, 100)
+    assert 1234 in idx and 2345 in idx
+    assert len(idx) <= 100 + 2
+
+
+def test_reduce_series_respects_point_budget():
+    s = _daily(120)
+    out, label = reduce_series(s, n_traces=2, max_bytes=4_800)
+    assert label == "Diário"
+    assert len(out) <= points_budget(2, 4_800)
+
+
+def test_one_granularity_for_all_series():
+    hist, fc = _daily(700), _daily(30, start="2023-12-01")
+    seen = {}
+
+    def build(reduced, label, unidade):
+        seen.update(reduced=reduced, label=label, unidade=unidade)
+        return _build(reduced, label, unidade)
+
+    fit_figure(build, [hist, fc])
+    assert seen["label"] == "Semanal" and seen["unidade"] == "GB por semana"
+    # a projeção curta também sai em semanas, não em dias
+    assert all((r.index.dayofweek == 0).all() for r in seen["reduced"])
+
+
+def test_payload_cap_drops_to_coarser_bucket():
+    s = _daily(100)
+    # O layout (template) pesa sozinho; sobra espaço para poucas dezenas de pontos
+    cap = figure_payload_bytes(_build([s.iloc[:0]], "Semanal", "GB por semana")) + 1_000
+    fig = fit_figure(_build, [s], window=(s.index[0], s.index[-1]), max_bytes=cap)
+    assert figure_payload_bytes(fig) <= cap
+    assert fig.layout.title.text != "Diário"
+    assert len(fig.data[0].x) < MIN_PONTOS_TRACE
+
+
+def test_payload_cap_impossible_raises():
+    s = _daily(100)
+    with pytest.raises(ValueError):
+        fit_figure(_build, [s], max_bytes=100)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from conftest import feature_frame
+from preditor_compilado import CompiledPredictor, verify
+
+
+def test_matches_lightgbm(modelo):
+    X = feature_frame(500, np.random.default_rng(1))
+    compiled = CompiledPredictor.from_model(modelo)
+    assert verify(compiled, modelo, X) < 1e-9
+
+
+def test_missing_and_unseen_values(modelo):
+    X = feature_frame(300, np.random.default_rng(2))
+    X.loc[::7, "lag_1"] = np.nan
+    X.loc[::5, "rolling_30"] = np.nan
+    evento = X["evento"].astype(object)
+    evento[::3] = np.nan
+    evento[1::4] = "Evento nunca visto"
+    X["evento"] = pd.Categorical(evento)
+    compiled = CompiledPredictor.from_model(modelo)
+    np.testing.assert_allclose(compiled.predict(X), modelo.predict(X), atol=1e-9)
+
+
+def test_encoded_matrix_and_roundtrip(modelo, tmp_path):
+    X = feature_frame(200, np.random.default_rng(3))
+    compiled = CompiledPredictor.from_model(modelo)
+    path = str(tmp_path / "arvores.npz")
+    compiled.save(path)
+    loaded = CompiledPredictor.load(path)
+    Xa = loaded.encode(X[loaded.feature_names])
+    np.testing.assert_allclose(loaded.predict(Xa), modelo.predict(X), atol=1e-9)
+
+
+def test_lag_semantics_survive_roundtrip(modelo, tmp_path):
+    compiled = CompiledPredictor.from_model(modelo)
+    assert compiled.lag_semantics is None          # modelo sem a marca do treino
+    compiled.lag_semantics = "dias"
+    path = str(tmp_path / "arvores.npz")
+    compiled.save(path)
+    assert CompiledPredictor.load(path).lag_semantics == "dias"
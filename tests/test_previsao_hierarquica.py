@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from previsao_hierarquica import Hierarchy, HierarchicalForecast, reconcile
+
+LEAVES = [("TI", "Analista"), ("Vendas", "Gerente"), ("Vendas", "Vendedor")]
+
+
+def _base(rng, coherent=False):
+    h = Hierarchy(LEAVES)
+    leaves = rng.uniform(1, 10, (5, len(LEAVES)))
+    base = leaves @ h.S.T
+    if not coherent:
+        base[:, :-len(LEAVES)] *= rng.uniform(0.5, 1.5, (5, len(h.nodes) - len(LEAVES)))
+    return h, base
+
+
+@pytest.mark.parametrize("method", ["mint", "top_down", "bottom_up"])
+def test_reconciled_forecasts_are_coherent(method):
+    h, base = _base(np.random.default_rng(0))
+    var = np.random.default_rng(1).uniform(0.5, 2.0, len(h.nodes))
+    rec = reconcile(base, h.S, var, method)
+    leaves = rec[:, -len(LEAVES):]
+    np.testing.assert_allclose(rec, leaves @ h.S.T, atol=1e-9)
+
+
+def test_methods_keep_their_anchor():
+    h, base = _base(np.random.default_rng(2))
+    var = np.ones(len(h.nodes))
+    np.testing.assert_allclose(reconcile(base, h.S, var, "bottom_up")[:, -3:], base[:, -3:])
+    np.testing.assert_allclose(reconcile(base, h.S, var, "top_down")[:, 0], base[:, 0])
+
+
+def test_mint_leaves_coherent_base_unchanged():
+    h, base = _base(np.random.default_rng(3), coherent=True)
+    rec = reconcile(base, h.S, np.random.default_rng(4).uniform(0.1, 5, len(h.nodes)), "mint")
+    np.testing.assert_allclose(rec, base, atol=1e-9)
+
+
+def test_mint_follows_the_precise_level():
+    h, base = _base(np.random.default_rng(5))
+    var = np.ones(len(h.nodes))
+    var[-3:] = 1e-9                 # folhas muito mais precisas que os agregados
+    np.testing.assert_allclose(reconcile(base, h.S, var, "mint"), reconcile(base, h.S, var, "bottom_up"),
+                               rtol=1e-6)
+    var = np.ones(len(h.nodes))
+    var[0] = 1e-9                   # total muito mais preciso: MinT respeita o total
+    assert reconcile(base, h.S, var, "mint")[:, 0] == pytest.approx(base[:, 0], rel=1e-6)
+
+
+def test_hierarchy_sum_matrix():
+    h = Hierarchy(LEAVES)
+    assert h.labels == ["Total", "TI", "Vendas", "TI / Analista", "Vendas / Gerente", "Vendas / Vendedor"]
+    np.testing.assert_array_equal(h.S[:3], [[1, 1, 1], [1, 0, 0], [0, 1, 1]])
+
+
+def test_divergence_between_levels():
+    h, base = _base(np.random.default_rng(6), coherent=True)
+    base[:, 0] *= 2.0               # perfil do total no dobro da soma das folhas
+    dates = pd.date_range("2025-01-01", periods=len(base))
+    seed = (np.arange(4), np.zeros((4, 3)), pd.DataFrame())
+    fc = HierarchicalForecast(h, dates, base, reconcile(base, h.S, np.ones(len(h.nodes))), np.ones(len(h.nodes)),
+                              "mint", seed, np.array([0, 1, 2, 2]), n_predicoes=4)
+    gap = fc.divergence()
+    assert list(gap.index) == ["Total", "TI", "Vendas"]
+    assert gap.loc["Total", "divergencia"] == pytest.approx(0.5)
+    np.testing.assert_allclose(gap.loc[["TI", "Vendas"], "divergencia"], 0.0, atol=1e-12)
+    assert fc.exact
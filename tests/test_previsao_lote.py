@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from previsao_lote import CAT_COLS, LAGS_DIAS, LAGS_REGISTROS, forecast_users_batched, lag_semantics
+
+
+class _Recorder:
+    """Modelo falso: guarda o lag_1 do primeiro passo e prevê zero."""
+
+    def __init__(self, semantics=None):
+        if semantics is not None:
+            self.lag_semantics = semantics
+        self.lag_1 = None
+
+    def predict(self, X):
+        if self.lag_1 is None:
+            self.lag_1 = X["lag_1"].to_numpy(dtype=float)
+        return np.zeros(len(X))
+
+
+def _seed():
+    hist = np.full((1, 60), np.nan)
+    hist[0, -3] = 2.0          # último registro há 3 dias
+    meta = pd.DataFrame({c: ["x"] for c in CAT_COLS})
+    return np.array([1]), hist, meta
+
+
+def test_unmarked_model_uses_record_lags():
+    assert lag_semantics(_Recorder()) == LAGS_REGISTROS
+    rec = _Recorder()
+    forecast_users_batched(rec, None, pd.date_range("2024-03-01", periods=2), noise=False, seed=_seed())
+    assert rec.lag_1[0] == 2.0
+
+
+def test_day_lags_follow_the_model_mark():
+    rec = _Recorder(LAGS_DIAS)
+    forecast_users_batched(rec, None, pd.date_range("2024-03-01", periods=2), noise=False, seed=_seed())
+    assert np.isnan(rec.lag_1[0])
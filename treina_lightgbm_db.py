@@ -5,6 +5,11 @@ import lightgbm as lgb
 import pickle
 from lightgbm import early_stopping, log_evaluation
 from datetime import timedelta
+from preditor_compilado import CompiledPredictor, verify
+from calendario import load_calendar, EVENTO_PADRAO
+from monitor_deriva import DriftProfile, reference_path
+from grade_diaria import DailyGrid
+from previsao_lote import LAGS_DIAS
 
 def load_data_from_db(conn_params):
     conn = psycopg2.connect(**conn_params)
@@ -18,9 +23,8 @@ def load_data_from_db(conn_params):
         c.nome AS cargo,
         evt.nome_eventos AS evento,
         disp.nome_dispositivo AS dispositivo,
-        s.situacao AS situacao,
-        l.localizacao
-    FROM log_uso_sim l
+        s.situacao AS situacao
+    FROM uso_consolidado l
     JOIN usuario u ON l.id_usuario = u.id_usuario
     JOIN departamentos dep ON u.id_departamento = dep.id_departamento
     JOIN cargos c ON u.id_cargo = c.id_cargo
@@ -33,29 +37,50 @@ def load_data_from_db(conn_params):
     conn.close()
     return df
 
-def feature_engineering(df):
+def feature_engineering(df, calendar=None):
     df['data'] = pd.to_datetime(df['data_uso'])
-    df = df.sort_values(['id_usuario', 'data']).reset_index(drop=True)
     df.rename(columns={'consumo': 'consumo_dados_gb'}, inplace=True)
 
-    df['year'] = df['data'].dt.year
-    df['month'] = df['data'].dt.month
-    df['day'] = df['data'].dt.day
-    df['dayofweek'] = df['data'].dt.dayofweek
-    df['weekofyear'] = df['data'].dt.isocalendar().week.astype(int)
-    df['is_weekend'] = df['dayofweek'].isin([5,6]).astype(int)
-
-    df['lag_1'] = df.groupby('id_usuario')['consumo_dados_gb'].shift(1)
-    df['lag_7'] = df.groupby('id_usuario')['consumo_dados_gb'].shift(7)
-    df['lag_30'] = df.groupby('id_usuario')['consumo_dados_gb'].shift(30)
-
-    df['rolling_7'] = df.groupby('id_usuario')['consumo_dados_gb'].transform(lambda x: x.rolling(7, min_periods=1).mean())
-    df['rolling_30'] = df.groupby('id_usuario')['consumo_dados_gb'].transform(lambda x: x.rolling(30, min_periods=1).mean())
-
-    df = df.dropna().reset_index(drop=True)
-    return df
-
-def train_and_save(df, model_path="modelo_lightgbm_consumo.pkl"):
+    # Grade usuário × dia: registros do mesmo dia somados, dias sem registro
+    # ficam NaN e não viram linha de treino
+    grid = DailyGrid.from_records(df)
+    u_idx, d_idx = grid.observed_cells()
+    out = pd.DataFrame({
+        'id_usuario': grid.uids[u_idx],
+        'data': grid.days[d_idx],
+        'consumo_dados_gb': grid.values[u_idx, d_idx].astype(float),
+    })
+    # Lags em dias de calendário (LAGS_DIAS): gravado no modelo por train_and_save
+    for k in (1, 7, 30):
+        out[f'lag_{k}'] = grid.lag(k)[u_idx, d_idx]
+    for w in (7, 30):
+        out[f'rolling_{w}'] = grid.rolling_mean(w)[u_idx, d_idx]
+
+    out['year'] = out['data'].dt.year
+    out['month'] = out['data'].dt.month
+    out['day'] = out['data'].dt.day
+    out['dayofweek'] = out['data'].dt.dayofweek
+    out['weekofyear'] = out['data'].dt.isocalendar().week.astype(int)
+    out['is_weekend'] = out['dayofweek'].isin([5,6]).astype(int)
+
+    # Categóricas: as do usuário e as do último registro de cada dia
+    df['dia'] = df['data'].dt.normalize()
+    last_of_day = df.sort_values('data').groupby(['id_usuario', 'dia']).last()
+    cat_cols = [c for c in ['usuario', 'cargo', 'departamento', 'dispositivo', 'situacao', 'evento']
+                if c in last_of_day.columns]
+    out = out.join(last_of_day[cat_cols], on=['id_usuario', 'data'])
+
+    # Evento do próprio registro (eventos_especiais); sem a coluna, o do calendário na data
+    if 'evento' not in out.columns:
+        out['evento'] = calendar.evento(out['data']) if calendar is not None else EVENTO_PADRAO
+
+    # Lags ausentes ficam NaN (o LightGBM trata): só saem os dias sem nenhum
+    # histórico anterior na janela
+    hist_cols = ['lag_1', 'lag_7', 'lag_30', 'rolling_7', 'rolling_30']
+    out = out.dropna(subset=hist_cols, how='all').reset_index(drop=True)
+    return out
+
+def train_and_save(df, model_path="modelo_lightgbm_consumo.pkl", df_raw=None):
     features = [
         "year", "month", "day", "dayofweek", "weekofyear", "is_weekend",
         "lag_1", "lag_7", "lag_30",
@@ -105,10 +130,31 @@ def train_and_save(df, model_path="modelo_lightgbm_consumo.pkl"):
         ]
     )
 
+    # A previsão lê daqui como montar os lags (previsao_lote.lag_semantics)
+    model.lag_semantics = LAGS_DIAS
     with open(model_path, "wb") as f:
         pickle.dump(model, f)
     print(f"Modelo salvo em {model_path}")
 
+    # Exporta as árvores em arrays NumPy para o preditor compilado e confere com o LightGBM
+    compiled = CompiledPredictor.from_model(model)
+    diff = verify(compiled, model, X_test)
+    compiled_path = model_path.replace(".pkl", "_arvores.npz")
+    compiled.save(compiled_path)
+    print(f"Preditor compilado salvo em {compiled_path} (máx. |Δ| vs LightGBM = {diff:.2e})")
+
+    # Referência de deriva: distribuição dos dados de treino, usada pelo monitor na ingestão
+    drift_path = reference_path(model_path)
+    # (registros brutos do período de treino: é o que a ingestão observa)
+    if df_raw is not None:
+        reference = df_raw.rename(columns={'consumo': 'consumo_dados_gb'})
+        in_train = pd.to_datetime(reference['data_uso']) < test_start
+        reference = reference[in_train] if in_train.any() else reference
+    else:
+        reference = train_df
+    DriftProfile.from_frame(reference).save(drift_path)
+    print(f"Referência de deriva salva em {drift_path}")
+
 def main():
     conn_params = {
         "database": "ANALISE",
@@ -122,12 +168,16 @@ def main():
     if df.empty:
         raise RuntimeError("DataFrame vazio — verifique população do banco.")
 
-    df_fe = feature_engineering(df)
+    conn = psycopg2.connect(**conn_params)
+    calendar = load_calendar(conn)
+    conn.close()
+
+    df_fe = feature_engineering(df, calendar)
     if df_fe.empty:
         raise RuntimeError("DataFrame vazio após feature engineering — gere mais dados ou reduza lags.")
 
-    train_and_save(df_fe)
-
+    train_and_save(df_fe, df_raw=df)
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()